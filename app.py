@@ -1,51 +1,101 @@
+import asyncio
+
 import gradio as gr
-import gradio as gr
-from src.auth.auth import handle_login
+from src.auth.auth import ahandle_login, issue_session_token, resume_session
+from src.sessions import UserSession
 from src.auth.db import initialize_db
 from dotenv import load_dotenv
-from src.interface import Interface
+from src import config
+from src.bot.loader import (ALL_SPECIALTIES, example_inputs, knowledge_base_loader,
+                            readiness_markdown, report_session_memory, selected_specialty,
+                            specialty_choices)
+from src.metrics import start_metrics_server
 
 # Load environment variables
 initialize_db()
 load_dotenv()
 
-bot = None  # Initially, no bot is created until the user logs in or registers
+# Start loading the index while the login page is served
+knowledge_base_loader.start()
+
+if config.METRICS_PORT:
+    start_metrics_server(config.METRICS_PORT)
+
 
+def create_bot(api_key):
+    # Imported here so the UI renders before langchain, FAISS and pandas are loaded
+    from src.interface import Interface
+    # a login during the index load waits a little, then asks the user to retry
+    knowledge_base = knowledge_base_loader.get(timeout=config.LOGIN_LOAD_WAIT)
+    return Interface(knowledge_base=knowledge_base, api_key=api_key)
 
-def start_bot(userid, password, api_key_input):
-    global bot
-    login_status = handle_login(userid, password, api_key_input)
+
+def refresh_readiness():
+    return (readiness_markdown(), gr.Timer(active=knowledge_base_loader.status == "loading"),
+            gr.update(choices=specialty_choices()))
+
+
+async def start_bot(userid, password, api_key_input=None):
+    # async, so the bcrypt hash is awaited instead of holding a Gradio worker
+    login_status, api_key = await ahandle_login(userid, password, api_key_input)
     
-    if "successful" in login_status:  # Check for successful login
-        bot = Interface()  # Initialize after login success
+    if api_key is not None:  # Check for successful login
+        # Each browser session gets its own bot built with its own API key
+        try:
+            bot = await asyncio.to_thread(create_bot, api_key)
+        except TimeoutError:
+            # registered or verified already, the retry is a plain login
+            return ("⏳ The knowledge base is still loading, please log in again in a moment.", gr.update(visible=True), gr.update(visible=False),
+                    None, None)
+        session = UserSession(userid, bot)
+        report_session_memory()
         return (
             login_status,
             gr.update(visible=False),  # Hide login/registration section
-            gr.update(visible=True)    # Show chat section
+            gr.update(visible=True),   # Show chat section
+            issue_session_token(userid, api_key),
+            session
         )
     else:
         return (
             login_status,
             gr.update(visible=True),   # Keep login/registration section visible
-            gr.update(visible=False)   # Keep chat section hidden
+            gr.update(visible=False),  # Keep chat section hidden
+            None,
+            None
         )
 
 
-def answer(message, history):
-    answer_md, tables_display, images_display, retrieved_display = bot.get_answer(message)
-    
-    # Combine all parts into a single response string for chat
-    combined_response = f"{answer_md}\n\n{tables_display}"
-    
-    # Add images as markdown
-    if images_display:
-        combined_response += "\n\n" + "\n\n".join(images_display)
-    
-    return combined_response
+def restore_session(session_token):
+    # Page reloads and reconnects reuse the signed token instead of re-hashing.
+    # While the index loads the login page stays up instead of blocking the page load,
+    # the token is kept for the next reload.
+    if not knowledge_base_loader.ready:
+        return gr.update(), gr.update(), None
+    userid, api_key, login_status = resume_session(session_token)
+    if userid is None:
+        return gr.update(), gr.update(), None
+
+    session = UserSession(userid, create_bot(api_key))
+    report_session_memory()
+    return gr.update(visible=False), gr.update(visible=True), session
+
+
+def answer(message, history, session, specialty=ALL_SPECIALTIES):
+    if session is None:
+        return "❌ Please log in first."
+    return session.answer(message, specialty=selected_specialty(specialty))
 
 
 
 with gr.Blocks(fill_height=True, fill_width=True) as app:
+    session_token = gr.BrowserState(None, storage_key="medibot_session")
+    user_session = gr.State(None)
+    readiness = gr.Markdown(readiness_markdown())
+    readiness_timer = gr.Timer(1.0)
+    # rendered by the chat interface, choices fill in once the index is loaded
+    specialty_filter = gr.Dropdown(choices=specialty_choices(), value=ALL_SPECIALTIES,
+                                   label="Specialty", render=False)
 
     with gr.Column(visible=True) as login_register_section:
         gr.Markdown("# 🔐 MediBot Login & Registration")
@@ -76,7 +126,9 @@ with gr.Blocks(fill_height=True, fill_width=True) as app:
         gr.ChatInterface(
                 answer,
                 title="🩺 Medico-Bot",
-                examples=["briefly explain me about cancer", "types of skin diseases?"],
+                additional_inputs=[user_session, specialty_filter],
+                # list of lists because of additional_inputs
+                examples=example_inputs(),
                 flagging_options = ['Like', 'Dislike']
                 )
 
@@ -85,14 +137,27 @@ with gr.Blocks(fill_height=True, fill_width=True) as app:
     login_btn.click(
         start_bot,
         inputs=[userid_login, password_login],
-        outputs=[login_output, login_register_section, chat_section]
+        outputs=[login_output, login_register_section, chat_section, session_token,
+                 user_session]
     )
 
     register_btn.click(
         start_bot,
         inputs=[userid_register, password_register, api_key_register],
-        outputs=[register_output, login_register_section, chat_section]
+        outputs=[register_output, login_register_section, chat_section, session_token,
+                 user_session]
+    )
+
+    readiness_timer.tick(refresh_readiness,
+                         outputs=[readiness, readiness_timer, specialty_filter])
+
+    app.load(
+        restore_session,
+        inputs=[session_token],
+        outputs=[login_register_section, chat_section, user_session]
     )
 
 
+app.queue(default_concurrency_limit=config.QUEUE_CONCURRENCY,
+          max_size=config.QUEUE_MAX_SIZE)
 app.launch(share=True, show_error=True)
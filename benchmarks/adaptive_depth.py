@@ -0,0 +1,120 @@
+"""
+Chunks kept, prompt tokens and answer overlap of adaptive retrieval depth against
+the fixed ``k``.
+
+Every question is retrieved once with the fixed depth and once per adaptive method
+(``elbow``, ``relative``) on an index where every book has its own vocabulary, so
+narrow questions have a few close chunks and a tail of unrelated ones. The fake chat
+model's answer does not depend on the context, so answers are compared through an
+extractive stand-in: the ``ANSWER_WORDS`` most frequent words of the context sent to
+the model, and their overlap (Jaccard) with the fixed-depth one. Per-query chosen k
+is written with ``--per-query``.
+
+    python -m benchmarks.adaptive_depth --queries 200 --min-k 3 --max-k 10
+"""
+import argparse
+import json
+import re
+import tempfile
+from collections import Counter
+
+from benchmarks.fakes import (FakeChatModel, FakeEmbeddings, build_synthetic_store,
+                              synthetic_questions)
+from benchmarks.stats import write_results
+from src.bot.depth import DepthSelector
+
+PROMPT_CONFIG = "src/bot/configs/prompt.toml"
+ANSWER_WORDS = 30
+_WORD = re.compile(r"\w+")
+
+
+def prompt_tokens(bot, question, docs) -> int:
+    # same count the fake chat model reports as input tokens
+    context = bot.context_builder.build(docs)
+    messages = bot.prompt_template.format_messages(context=context, question=question)
+    return sum(len(str(m.content).split()) for m in messages)
+
+
+def extractive_answer(bot, docs) -> set:
+    words = Counter(_WORD.findall(bot.context_builder.build(docs).lower()))
+    return {word for word, _ in words.most_common(ANSWER_WORDS)}
+
+
+def jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a | b else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--min-k", type=int, default=3)
+    parser.add_argument("--max-k", type=int, default=10)
+    parser.add_argument("--margin", type=float, default=0.25)
+    parser.add_argument("--per-query", action="store_true",
+                        help="include the chosen k of every question")
+    parser.add_argument("--output", help="write JSON results to this path")
+    args = parser.parse_args()
+
+    from src.bot.bot import KnowledgeBase, Medibot
+
+    embeddings = FakeEmbeddings()
+    model = FakeChatModel()
+    questions = synthetic_questions(args.queries)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        knowledge_base = KnowledgeBase(
+            embeddings=embeddings,
+            **build_synthetic_store(tmp, args.chunks, embeddings, topic_per_source=True))
+
+        def bot(method: str):
+            return Medibot(PROMPT_CONFIG, knowledge_base=knowledge_base, model=model,
+                           coalesce="off", depth_selector=DepthSelector(
+                               method, args.min_k, args.max_k, args.margin))
+
+        fixed = bot("fixed")
+        fixed.search_kwargs["k"] = args.max_k
+        baseline = []
+        for question in questions:
+            docs = fixed.retrieve(question)
+            baseline.append((docs, prompt_tokens(fixed, question, docs),
+                             extractive_answer(fixed, docs)))
+        results["fixed"] = {
+            "k": args.max_k,
+            "mean_prompt_tokens": sum(tokens for _, tokens, _ in baseline) / len(baseline)}
+
+        for method in ("elbow", "relative"):
+            adaptive = bot(method)
+            chosen, tokens, overlap, kept_ids = [], [], [], []
+            for question, (fixed_docs, _, fixed_answer) in zip(questions, baseline):
+                docs = adaptive.retrieve(question)
+                chosen.append(len(docs))
+                tokens.append(prompt_tokens(adaptive, question, docs))
+                overlap.append(jaccard(extractive_answer(adaptive, docs), fixed_answer))
+                fixed_ids = {doc.id for doc in fixed_docs}
+                kept_ids.append(sum(doc.id in fixed_ids for doc in docs) / max(1, len(docs)))
+            mean_tokens = sum(tokens) / len(tokens)
+            results[method] = {
+                "min_k": min(chosen),
+                "max_k": max(chosen),
+                "mean_k": sum(chosen) / len(chosen),
+                "k_histogram": dict(sorted(Counter(chosen).items())),
+                "mean_prompt_tokens": mean_tokens,
+                "prompt_token_savings": 1 - mean_tokens
+                / results["fixed"]["mean_prompt_tokens"],
+                "mean_answer_overlap": sum(overlap) / len(overlap),
+                "min_answer_overlap": min(overlap),
+                "chunks_also_in_fixed": sum(kept_ids) / len(kept_ids),
+            }
+            if args.per_query:
+                results[method]["per_query"] = [
+                    {"question": question, "k": k, "answer_overlap": o}
+                    for question, k, o in zip(questions, chosen, overlap)]
+
+    report = write_results(args.output, "adaptive_depth", vars(args), results)
+    print(json.dumps(report["results"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
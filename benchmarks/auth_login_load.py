@@ -0,0 +1,65 @@
+"""
+Login throughput under concurrent users.
+
+Registers a set of users in a temporary database, then replays logins from
+``--users`` concurrent clients, first with passwords (bcrypt on every call) and then
+with the session tokens issued after the first login.
+
+    python -m benchmarks.auth_login_load --users 50 --rounds 4
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def run(users: int, rounds: int) -> dict:
+    from src.auth.auth import register_user, login_user, resume_session
+    from src.auth.db import initialize_db
+    from src.auth.session import create_session_token
+
+    initialize_db()
+    credentials = [(f"user{i}", f"password{i}") for i in range(users)]
+    for userid, password in credentials:
+        register_user(userid, password, "gsk_dummy")
+
+    def timed(fn, items):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=users) as pool:
+            results = list(pool.map(fn, items))
+        return time.perf_counter() - start, results
+
+    attempts = credentials * rounds
+    password_time, results = timed(lambda c: login_user(*c)[0], attempts)
+    assert all(results), "password login failed"
+
+    tokens = [create_session_token(userid) for userid, _ in credentials] * rounds
+    token_time, results = timed(lambda t: resume_session(t)[0] is not None, tokens)
+    assert all(results), "session resume failed"
+
+    return {
+        "users": users,
+        "logins": len(attempts),
+        "password_logins_per_s": len(attempts) / password_time,
+        "token_logins_per_s": len(tokens) / token_time,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # DB_PATH is read when src.config is imported
+        os.environ["DB_PATH"] = os.path.join(tmp, "users.db")
+        results = run(args.users, args.rounds)
+
+    for key, value in results.items():
+        print(f"{key:>24}: {value:.1f}" if isinstance(value, float) else f"{key:>24}: {value}")
+
+
+if __name__ == "__main__":
+    main()
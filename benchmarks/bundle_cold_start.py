@@ -0,0 +1,74 @@
+"""
+Cold start of the knowledge base from the single-file bundle versus the separate
+index directory, metadata.csv and prompt TOML.
+
+Each load runs in a fresh interpreter so imports and unpickling are paid again;
+the OS page cache is not dropped, run with ``--runs`` > 1 and compare medians.
+
+    python -m benchmarks.bundle_cold_start --chunks 50000 --runs 5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.fakes import FakeEmbeddings, build_synthetic_store
+from benchmarks.stats import summarize, write_results
+from src.bot.bundle import build_bundle
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROMPT_CONFIG = "src/bot/configs/prompt.toml"
+
+# prints the seconds from interpreter start to a usable Medibot
+LOAD_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings
+from src.bot.bot import KnowledgeBase, Medibot
+kwargs = dict(embeddings=FakeEmbeddings(), **{k: v for k, v in
+              (arg.split("=", 1) for arg in sys.argv[1:])})
+bot = Medibot(knowledge_base=KnowledgeBase(**kwargs), model=FakeChatModel())
+print(time.perf_counter() - start)
+"""
+
+
+def cold_start(args: list, runs: int) -> dict:
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-c", LOAD_SCRIPT, *args], cwd=ROOT,
+                                capture_output=True, text=True, check=True,
+                                env={**os.environ, "EMBED_BATCH_SIZE": "1"})
+        samples.append(float(result.stdout.strip().splitlines()[-1]))
+    return summarize(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="write JSON results to this path")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = build_synthetic_store(tmp, args.chunks, FakeEmbeddings())
+        bundle = os.path.join(tmp, "medibot.bundle")
+        header = build_bundle(paths["faiss_database"], paths["metadata_database"],
+                              os.path.join(ROOT, PROMPT_CONFIG), bundle)
+        multi_file = cold_start([f"faiss_database={paths['faiss_database']}",
+                                 f"metadata_database={paths['metadata_database']}"],
+                                args.runs)
+        single_file = cold_start([f"bundle={bundle}"], args.runs)
+        bundle_bytes = os.path.getsize(bundle)
+
+    results = {"multi_file": multi_file, "bundle": single_file,
+               "bundle_bytes": bundle_bytes, "bundle_stats": header["stats"],
+               "speedup": multi_file["p50_ms"] / single_file["p50_ms"]}
+    report = write_results(args.output, "bundle_cold_start", vars(args), results)
+    print(json.dumps(report["results"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Single-flight coalescing of identical questions asked at the same moment.
+
+``--users`` threads release the same question (in varying case and punctuation)
+through a barrier into ``Medibot.query``, then as many coroutines stream it through
+``Medibot.astream_query``. With coalescing on, the embeddings and the chat model
+must each have been called exactly once per phase and every caller must receive
+the full answer; the run exits non-zero otherwise (``benchmarks.regressions`` runs it
+as a check). ``--coalesce off`` shows the
+uncoalesced baseline.
+
+    python -m benchmarks.coalescing --users 32 --llm-latency 0.5
+"""
+import argparse
+import asyncio
+import json
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings, build_synthetic_store
+from benchmarks.stats import summarize, write_results
+from src.bot.bot import KnowledgeBase, Medibot
+from src.metrics import metrics
+
+PROMPT_CONFIG = "src/bot/configs/prompt.toml"
+VARIANTS = ["briefly explain me about cancer", "Briefly explain me about cancer?",
+            "briefly  explain me about CANCER."]
+
+
+def counts() -> dict:
+    return {kind: metrics.counter("medibot_coalesced_total").get(kind=kind)
+            for kind in ("query", "query_stream")}
+
+
+def concurrent_queries(bot, embeddings, model, users: int) -> dict:
+    embeddings.calls, model.calls = 0, 0
+    barrier = threading.Barrier(users)
+    latencies, answers = [], []
+
+    def ask(i: int):
+        barrier.wait()
+        start = time.perf_counter()
+        answers.append(bot.query(VARIANTS[i % len(VARIANTS)])[0])
+        latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=ask, args=(i,)) for i in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {"embedding_calls": embeddings.calls, "llm_calls": model.calls,
+            "complete_answers": sum(answer == model.answer for answer in answers),
+            "latency": summarize(latencies)}
+
+
+async def concurrent_streams(bot, embeddings, model, users: int) -> dict:
+    embeddings.calls, model.calls = 0, 0
+    latencies, answers = [], []
+
+    async def ask(i: int):
+        start = time.perf_counter()
+        tokens = []
+        async for event, data in bot.astream_query(VARIANTS[i % len(VARIANTS)]):
+            if event == "token":
+                tokens.append(data)
+        answers.append("".join(tokens))
+        latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(ask(i) for i in range(users)))
+    return {"embedding_calls": embeddings.calls, "llm_calls": model.calls,
+            "complete_answers": sum(answer == model.answer for answer in answers),
+            "latency": summarize(latencies)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=32)
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--coalesce", choices=("global", "off"), default="global")
+    parser.add_argument("--output", help="write JSON results to this path")
+    args = parser.parse_args()
+
+    metrics.enabled = True
+    embeddings = FakeEmbeddings(latency=0.05)
+    model = FakeChatModel(latency=args.llm_latency, token_latency=0.01)
+    with tempfile.TemporaryDirectory() as tmp:
+        knowledge_base = KnowledgeBase(
+            embeddings=embeddings, **build_synthetic_store(tmp, args.chunks, embeddings))
+        bot = Medibot(PROMPT_CONFIG, knowledge_base=knowledge_base, model=model,
+                      coalesce=args.coalesce)
+        results = {"query": concurrent_queries(bot, embeddings, model, args.users),
+                   "stream": asyncio.run(concurrent_streams(bot, embeddings, model,
+                                                            args.users))}
+    results["coalesced"] = counts()
+
+    report = write_results(args.output, "coalescing", vars(args), results)
+    print(json.dumps(report["results"], indent=2))
+    if args.coalesce != "off":
+        failed = [phase for phase in ("query", "stream")
+                  if results[phase]["llm_calls"] != 1
+                  or results[phase]["embedding_calls"] != 1
+                  or results[phase]["complete_answers"] != args.users]
+        if failed:
+            print(f"Coalescing failed in: {', '.join(failed)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
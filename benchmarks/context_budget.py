@@ -0,0 +1,90 @@
+"""
+Prompt size and generation latency with and without token-budgeted context.
+
+Builds a synthetic index where every few chunks repeat a passage of their
+neighbour, retrieves the same chunks for each question and generates once with all
+of them in the prompt and once through ``ContextBuilder`` (dedup plus token budget).
+The fake chat model charges ``--prompt-token-latency`` per prompt token.
+
+    python -m benchmarks.context_budget --budget 600 --output results/context.json
+"""
+import argparse
+import json
+import tempfile
+import time
+
+from benchmarks.fakes import (FakeChatModel, FakeEmbeddings, build_synthetic_store,
+                              synthetic_questions)
+from benchmarks.stats import summarize, write_results
+from src.bot.context import ContextBuilder
+
+PROMPT_CONFIG = "src/bot/configs/prompt.toml"
+
+
+def prompt_tokens(bot, question, docs) -> int:
+    # same count the fake chat model reports as input tokens
+    context = bot.context_builder.build(docs)
+    messages = bot.prompt_template.format_messages(context=context, question=question)
+    return sum(len(str(m.content).split()) for m in messages)
+
+
+def measure(bot, questions, retrieved) -> dict:
+    tokens, latencies, chunks = [], [], []
+    for question, docs in zip(questions, retrieved):
+        tokens.append(prompt_tokens(bot, question, docs))
+        chunks.append(len(bot.context_builder.select(docs)))
+        start = time.perf_counter()
+        bot.generate(question, docs)
+        latencies.append(time.perf_counter() - start)
+    return {"mean_prompt_tokens": sum(tokens) / len(tokens),
+            "mean_chunks": sum(chunks) / len(chunks),
+            "generate_latency": summarize(latencies)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--duplicate-every", type=int, default=3)
+    parser.add_argument("--budget", type=int, default=600)
+    parser.add_argument("--dedupe-threshold", type=float, default=0.9)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--prompt-token-latency", type=float, default=0.0001)
+    parser.add_argument("--output", help="write JSON results to this path")
+    args = parser.parse_args()
+
+    from src.bot.bot import KnowledgeBase, Medibot
+
+    embeddings = FakeEmbeddings()
+    model = FakeChatModel(latency=args.llm_latency,
+                          prompt_token_latency=args.prompt_token_latency)
+    questions = synthetic_questions(args.queries)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = build_synthetic_store(tmp, args.chunks, embeddings,
+                                      duplicate_every=args.duplicate_every)
+        knowledge_base = KnowledgeBase(embeddings=embeddings, **paths)
+        all_chunks = Medibot(PROMPT_CONFIG, knowledge_base=knowledge_base, model=model,
+                             context_builder=ContextBuilder())
+        budgeted = Medibot(PROMPT_CONFIG, knowledge_base=knowledge_base, model=model,
+                           context_builder=ContextBuilder(args.budget,
+                                                          args.dedupe_threshold))
+        retrieved = [all_chunks.retrieve(question) for question in questions]
+        baseline = measure(all_chunks, questions, retrieved)
+        trimmed = measure(budgeted, questions, retrieved)
+
+    results = {
+        "all_chunks": baseline,
+        "budgeted": trimmed,
+        "prompt_token_reduction": 1 - trimmed["mean_prompt_tokens"]
+        / baseline["mean_prompt_tokens"],
+        "p50_latency_reduction": 1 - trimmed["generate_latency"]["p50_ms"]
+        / baseline["generate_latency"]["p50_ms"],
+    }
+    report = write_results(args.output, "context_budget", vars(args), results)
+    print(json.dumps(report["results"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
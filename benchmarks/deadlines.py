@@ -0,0 +1,100 @@
+"""
+Tail latency of ``Medibot.query`` and ``Medibot.astream_query`` against a chat
+model that stalls, with and without a request deadline.
+
+Every ``--stall-every``-th completion stops for ``--stall`` seconds after a few
+words. Without a deadline those requests take the whole stall; with one, the p99 and
+the slowest request must stay within the deadline plus a small margin, otherwise the
+run exits non-zero (``benchmarks.regressions`` runs it as a check).
+Answers cut short are counted with how many still carry resolved tables or images.
+
+    python -m benchmarks.deadlines --requests 100 --stall 30 --deadline 2
+"""
+import argparse
+import asyncio
+import json
+import sys
+import tempfile
+import time
+
+from benchmarks.fakes import (FakeChatModel, FakeEmbeddings, build_synthetic_store,
+                              synthetic_questions)
+from benchmarks.stats import summarize, write_results
+from src.bot.bot import PARTIAL_ANSWER_NOTE, KnowledgeBase, Medibot
+
+PROMPT_CONFIG = "src/bot/configs/prompt.toml"
+# scheduling slack allowed on top of the deadline
+MARGIN = 0.25
+
+
+def run_queries(bot, questions, deadline: float) -> dict:
+    latencies, partial, partial_with_refs = [], 0, 0
+    for question in questions:
+        start = time.perf_counter()
+        answer, _, tables, images = bot.query(question, deadline=deadline)
+        latencies.append(time.perf_counter() - start)
+        if answer.endswith(PARTIAL_ANSWER_NOTE):
+            partial += 1
+            partial_with_refs += bool(tables or images)
+    return {"latency": summarize(latencies), "partial_answers": partial,
+            "partial_with_references": partial_with_refs}
+
+
+async def run_streams(bot, questions, deadline: float) -> dict:
+    latencies, partial = [], 0
+    for question in questions:
+        start = time.perf_counter()
+        tokens, done = [], False
+        async for event, data in bot.astream_query(question, deadline=deadline):
+            if event == "token":
+                tokens.append(data)
+            elif event == "done":
+                done = True
+        latencies.append(time.perf_counter() - start)
+        partial += done and bool(tokens) and tokens[-1] == PARTIAL_ANSWER_NOTE
+    return {"latency": summarize(latencies), "partial_answers": partial}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--llm-latency", type=float, default=0.1)
+    parser.add_argument("--stall", type=float, default=30.0)
+    parser.add_argument("--stall-every", type=int, default=10)
+    parser.add_argument("--deadline", type=float, default=2.0)
+    parser.add_argument("--skip-baseline", action="store_true",
+                        help="skip the run without deadline, it takes the full stalls")
+    parser.add_argument("--output", help="write JSON results to this path")
+    args = parser.parse_args()
+
+    embeddings = FakeEmbeddings()
+    model = FakeChatModel(latency=args.llm_latency, token_latency=0.005, stall=args.stall,
+                          stall_every=args.stall_every)
+    # distinct questions, coalescing would hide the stalls
+    questions = synthetic_questions(args.requests)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        knowledge_base = KnowledgeBase(
+            embeddings=embeddings, **build_synthetic_store(tmp, args.chunks, embeddings))
+        bot = Medibot(PROMPT_CONFIG, knowledge_base=knowledge_base, model=model,
+                      coalesce="off")
+        if not args.skip_baseline:
+            results["no_deadline"] = run_queries(bot, questions, deadline=0)
+        results["query"] = run_queries(bot, questions, args.deadline)
+        results["stream"] = asyncio.run(run_streams(bot, questions, args.deadline))
+
+    report = write_results(args.output, "deadlines", vars(args), results)
+    print(json.dumps(report["results"], indent=2))
+    bound = (args.deadline + MARGIN) * 1000
+    failed = [phase for phase in ("query", "stream")
+              if results[phase]["latency"]["p99_ms"] > bound
+              or results[phase]["latency"]["max_ms"] > bound]
+    if failed:
+        print(f"Deadline not held in: {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
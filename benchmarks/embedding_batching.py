@@ -0,0 +1,102 @@
+"""
+Throughput of query embeddings with and without micro-batching.
+
+``FakeEmbeddings`` sleeps a fixed per-call overhead (the round trip to the
+embeddings endpoint), so sending each question alone pays that overhead once per
+user while ``BatchingEmbeddings`` pays it once per batch. Both the threaded (Gradio
+workers) and the asyncio path are measured.
+
+    python -m benchmarks.embedding_batching --users 64 --call-latency 0.05
+"""
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fakes import FakeEmbeddings, synthetic_questions
+from benchmarks.stats import summarize, write_results
+from src.bot.batching import BatchingEmbeddings
+
+
+def run_threads(embeddings, questions, users) -> dict:
+    latencies = []
+
+    def ask(question):
+        start = time.perf_counter()
+        embeddings.embed_query(question)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        list(pool.map(ask, questions))
+    elapsed = time.perf_counter() - start
+    return {"queries_per_s": len(questions) / elapsed, "latency": summarize(latencies)}
+
+
+def run_async(embeddings, questions, users) -> dict:
+    latencies = []
+
+    async def main():
+        semaphore = asyncio.Semaphore(users)
+
+        async def ask(question):
+            async with semaphore:
+                start = time.perf_counter()
+                await embeddings.aembed_query(question)
+                latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(ask(question) for question in questions))
+
+    start = time.perf_counter()
+    asyncio.run(main())
+    elapsed = time.perf_counter() - start
+    return {"queries_per_s": len(questions) / elapsed, "latency": summarize(latencies)}
+
+
+def measure(runner, make_embeddings, questions, users) -> dict:
+    model = FakeEmbeddings()
+    embeddings = make_embeddings(model)
+    result = runner(embeddings, questions, users)
+    result["embedding_calls"] = model.calls
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=64)
+    parser.add_argument("--queries", type=int, default=640)
+    parser.add_argument("--call-latency", type=float, default=0.05,
+                        help="fixed seconds per embeddings call")
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--output", help="write JSON results to this path")
+    args = parser.parse_args()
+
+    questions = synthetic_questions(args.queries, seed=0)
+
+    def direct(model):
+        model.latency = args.call_latency
+        return model
+
+    def batched(model):
+        model.latency = args.call_latency
+        return BatchingEmbeddings(model, max_batch_size=args.max_batch_size,
+                                  max_wait=args.max_wait_ms / 1000)
+
+    results = {}
+    for mode, runner in (("threads", run_threads), ("asyncio", run_async)):
+        unbatched = measure(runner, direct, questions, args.users)
+        with_batching = measure(runner, batched, questions, args.users)
+        results[mode] = {
+            "direct": unbatched,
+            "batched": with_batching,
+            "speedup": with_batching["queries_per_s"] / unbatched["queries_per_s"],
+        }
+
+    report = write_results(args.output, "embedding_batching", vars(args), results)
+    print(json.dumps(report["results"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Deterministic stand-ins for the OpenAI embeddings and the Groq chat model, and a
+builder for synthetic FAISS indexes and metadata stores shaped like the real ones.
+"""
+import base64
+import os
+import random
+import time
+import zlib
+from typing import Any, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from src.bot.ref_graph import build_for_index
+
+VOCABULARY = (
+    "cell tumor cancer carcinoma skin lesion inflammation infection antibody antigen "
+    "kidney liver heart lung brain artery vein blood platelet anemia leukemia lymphoma "
+    "diabetes insulin glucose thyroid hormone receptor enzyme protein gene mutation "
+    "fibrosis necrosis apoptosis edema thrombosis embolism infarction ischemia sepsis "
+    "bacteria virus fungus parasite vaccine immunity allergy asthma eczema psoriasis "
+    "melanoma biopsy diagnosis prognosis therapy dose symptom syndrome chronic acute"
+).split()
+
+
+class FakeEmbeddings(Embeddings):
+    """Hashed bag-of-words vectors, so texts sharing words land close together.
+
+    Args:
+        dim (int): vector size.
+        latency (float): seconds slept once per call, to mimic a remote endpoint.
+    """
+
+    def __init__(self, dim: int = 256, latency: float = 0.0):
+        self.dim = dim
+        self.latency = latency
+        self.calls = 0
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in text.lower().split():
+            h = zlib.crc32(word.encode())
+            vector[h % self.dim] += 1.0 if (h >> 16) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model that sleeps for ``latency`` and answers with a fixed text.
+
+    ``prompt_token_latency`` adds time per prompt word, like prefill on a real model.
+    ``calls`` counts completions, streamed or not. Every ``stall_every``-th call
+    stalls for ``stall`` seconds, after ``stall_after`` words when streaming, like an
+    upstream that stops answering.
+    """
+
+    answer: str = "Synthetic answer. " * 20
+    latency: float = 0.0
+    token_latency: float = 0.0
+    prompt_token_latency: float = 0.0
+    calls: int = 0
+    stall: float = 0.0
+    stall_every: int = 0
+    stall_after: int = 3
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _usage(self, messages: List[BaseMessage]) -> dict:
+        prompt_tokens = sum(len(str(m.content).split()) for m in messages)
+        completion_tokens = len(self.answer.split())
+        return {"input_tokens": prompt_tokens, "output_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens}
+
+    def _stalls(self) -> bool:
+        self.calls += 1
+        return bool(self.stall_every) and self.calls % self.stall_every == 0
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        stalls = self._stalls()
+        usage = self._usage(messages)
+        time.sleep(self.latency + usage["input_tokens"] * self.prompt_token_latency
+                   + (self.stall if stalls else 0.0))
+        message = AIMessage(content=self.answer, usage_metadata=usage)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        stalls = self._stalls()
+        time.sleep(self.latency
+                   + self._usage(messages)["input_tokens"] * self.prompt_token_latency)
+        words = self.answer.split(" ")
+        for i, word in enumerate(words):
+            time.sleep(self.token_latency + (self.stall if stalls and i == self.stall_after
+                                             else 0.0))
+            usage = self._usage(messages) if i == len(words) - 1 else None
+            chunk = AIMessageChunk(content=word if i == 0 else f" {word}",
+                                   usage_metadata=usage)
+            yield ChatGenerationChunk(message=chunk)
+
+
+def synthetic_text(rng: random.Random, n_words: int, topic: int = 0) -> str:
+    # Zipf-like word frequencies so some terms are common across chunks, each topic
+    # ranks the vocabulary differently
+    size = len(VOCABULARY)
+    weights = [1.0 / ((rank + topic * 7) % size + 1) for rank in range(size)]
+    return " ".join(rng.choices(VOCABULARY, weights=weights, k=n_words))
+
+
+def synthetic_documents(n_chunks: int, n_sources: int = 4, words_per_chunk: int = 120,
+                        seed: int = 0, duplicate_every: int = 0,
+                        topic_per_source: bool = False) -> tuple:
+    """Build text chunks plus the table/picture rows they reference.
+
+    With ``duplicate_every`` set, every n-th chunk repeats a passage of the chunk
+    before it, like the overlapping items of ``extract_all_text`` and
+    ``create_chunks``. ``token_count`` is the word count, as the fake chat model
+    counts tokens. ``topic_per_source`` gives every book its own word distribution.
+
+    Returns:
+        tuple: (list of chunk Documents, list of metadata rows for metadata.csv)
+    """
+    rng = random.Random(seed)
+    image = base64.b64encode(bytes(rng.getrandbits(8) for _ in range(2048))).decode()
+    documents, rows = [], []
+    for i in range(n_chunks):
+        source = f"book-{i % n_sources}"
+        specialty = f"specialty-{i % max(1, n_sources // 2)}"
+        child_refs = []
+        if i % 5 == 0:
+            ref = f"#/tables/{i}"
+            child_refs.append(ref)
+            rows.append({"source": source, "self_ref": ref, "chunk_type": "table",
+                         "page_content": "| term | value |\n|---|---|\n| "
+                                         + synthetic_text(rng, 8) + " | 1 |"})
+        if i % 7 == 0:
+            ref = f"#/pictures/{i}"
+            child_refs.append(ref)
+            rows.append({"source": source, "self_ref": ref, "chunk_type": "picture",
+                         "page_content": image})
+        if duplicate_every and i % duplicate_every == 1 and documents:
+            words = documents[-1].page_content.split()
+            start = rng.randint(0, len(words) // 4)
+            text = " ".join(words[start:start + len(words) * 3 // 4])
+        else:
+            text = synthetic_text(rng, words_per_chunk,
+                                  topic=i % n_sources if topic_per_source else 0)
+        documents.append(Document(
+            page_content=text,
+            metadata={
+                "source": source,
+                "specilization": specialty,
+                "chunk_index": i,
+                "self_ref": f"#/texts/{i}",
+                "parent_ref": f"#/groups/{i // 10}",
+                "child_ref": ",".join(child_refs),
+                "chunk_type": "text",
+                "token_count": len(text.split()),
+            }))
+    return documents, rows
+
+
+def build_synthetic_store(directory: str, n_chunks: int, embeddings: Embeddings,
+                          n_sources: int = 4, seed: int = 0,
+                          duplicate_every: int = 0, ref_graph: bool = True,
+                          topic_per_source: bool = False) -> dict:
+    """Write ``faiss_index`` and ``metadata.csv`` under ``directory``, plus the
+    compiled reference graph unless ``ref_graph`` is False.
+
+    Returns:
+        dict: paths to pass as ``faiss_database`` and ``metadata_database``.
+    """
+    documents, rows = synthetic_documents(n_chunks, n_sources=n_sources, seed=seed,
+                                          duplicate_every=duplicate_every,
+                                          topic_per_source=topic_per_source)
+    vector_store = FAISS.from_documents(documents, embeddings)
+    faiss_database = os.path.join(directory, "faiss_index")
+    metadata_database = os.path.join(directory, "metadata.csv")
+    vector_store.save_local(faiss_database)
+    pd.DataFrame(rows, columns=["source", "self_ref", "chunk_type", "page_content"]) \
+        .to_csv(metadata_database, index=False)
+    if ref_graph:
+        build_for_index(faiss_database, metadata_database)
+    return {"faiss_database": faiss_database, "metadata_database": metadata_database}
+
+
+def synthetic_questions(n: int, seed: int = 1) -> List[str]:
+    rng = random.Random(seed)
+    return [f"briefly explain {synthetic_text(rng, rng.randint(2, 6))}" for _ in range(n)]
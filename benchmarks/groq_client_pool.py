@@ -0,0 +1,65 @@
+"""
+Connection reuse of the per-key Groq client pool against the local stand-in.
+
+Compares a fresh ``Groq(api_key=...)`` client per request (the old validation and
+chat paths) with clients from ``GroqClientPool``, counting the TCP connections the
+stand-in accepted and the per-request latency.
+
+    python -m benchmarks.groq_client_pool --requests 200 --keys 4
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from groq import Groq
+
+from benchmarks.groq_stand_in import GroqStandIn
+from benchmarks.stats import summarize, write_results
+from src.bot.clients import GroqClientPool
+
+MESSAGES = [{"role": "user", "content": "briefly explain me about cancer"}]
+
+
+def run(server, get_client, requests, keys, concurrency) -> dict:
+    server.counts.clear()
+    latencies = []
+
+    def call(i):
+        start = time.perf_counter()
+        client = get_client(f"gsk_key{i % keys}")
+        client.chat.completions.create(messages=MESSAGES, model="llama-3.1-8b-instant")
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(call, range(requests)))
+    elapsed = time.perf_counter() - start
+    return {"requests": requests, "connections": server.counts["connections"],
+            "requests_per_s": requests / elapsed, "latency": summarize(latencies)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--keys", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--output", help="write JSON results to this path")
+    args = parser.parse_args()
+
+    with GroqStandIn() as server:
+        fresh = run(server, lambda key: Groq(api_key=key, base_url=server.base_url),
+                    args.requests, args.keys, args.concurrency)
+        client_pool = GroqClientPool(base_url=server.base_url)
+        pooled = run(server, client_pool.client, args.requests, args.keys, args.concurrency)
+        client_pool.close()
+
+    saved_ms = fresh["latency"]["mean_ms"] - pooled["latency"]["mean_ms"]
+    report = write_results(args.output, "groq_client_pool", vars(args),
+                           {"fresh_client": fresh, "pooled_client": pooled,
+                            "saved_per_request_ms": saved_ms})
+    print(json.dumps(report["results"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
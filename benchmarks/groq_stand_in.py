@@ -0,0 +1,182 @@
+"""
+A local HTTP stand-in for the Groq OpenAI-compatible API.
+
+Serves ``GET /openai/v1/models`` and ``POST /openai/v1/chat/completions`` (plain and
+streamed) with configurable latency, and counts requests and TCP connections so
+benchmarks can check how much traffic really reached "Groq".
+
+    with GroqStandIn(valid_keys={"gsk_good"}, latency=0.05) as server:
+        Groq(api_key="gsk_good", base_url=server.base_url).models.list()
+"""
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "GroqStandIn/1.0"
+
+    def setup(self):
+        super().setup()
+        self.server.stand_in._count("connections")
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict, headers: Optional[dict] = None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _error(self, status: int, message: str, headers: Optional[dict] = None):
+        self._send_json(status, {"error": {"message": message, "type": "stand_in_error"}},
+                        headers)
+
+    def _authorized(self) -> bool:
+        stand_in = self.server.stand_in
+        token = self.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+        self.api_key = token
+        if stand_in.valid_keys is not None and token not in stand_in.valid_keys:
+            self._error(401, "Invalid API Key")
+            return False
+        return True
+
+    def _read_body(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        stand_in = self.server.stand_in
+        stand_in._count("requests")
+        if self.path.rstrip("/") != "/openai/v1/models":
+            return self._error(404, f"unknown path {self.path}")
+        stand_in._count("models")
+        time.sleep(stand_in.latency)
+        if not self._authorized():
+            return
+        self._send_json(200, {"object": "list", "data": [
+            {"id": model, "object": "model", "owned_by": "stand-in"}
+            for model in stand_in.models
+        ]})
+
+    def do_POST(self):
+        stand_in = self.server.stand_in
+        stand_in._count("requests")
+        body = self._read_body()
+        if self.path.rstrip("/") != "/openai/v1/chat/completions":
+            return self._error(404, f"unknown path {self.path}")
+        stand_in._count("chat_completions")
+        if not self._authorized():
+            return
+
+        rejection = stand_in.reject(body)
+        if rejection is not None:
+            status, headers = rejection
+            stand_in._count(f"status_{status}")
+            return self._error(status, "Rate limit reached", headers)
+
+        time.sleep(stand_in.latency)
+        model = body.get("model", "stand-in")
+        prompt_tokens = sum(len(str(m.get("content", "")).split())
+                            for m in body.get("messages", []))
+        answer = stand_in.answer
+        if stand_in.echo_key:
+            answer = f"{answer} [key {self.api_key}]"
+        words = answer.split()
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(words),
+                 "total_tokens": prompt_tokens + len(words)}
+
+        if not body.get("stream"):
+            return self._send_json(200, {
+                "id": "chatcmpl-stand-in", "object": "chat.completion",
+                "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": answer}}],
+                "usage": usage,
+            })
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write_event(data: str):
+            event = f"data: {data}\n\n".encode()
+            self.wfile.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+            self.wfile.flush()
+
+        for i, word in enumerate(words):
+            delta = {"content": word if i == 0 else f" {word}"}
+            write_event(json.dumps({
+                "id": "chatcmpl-stand-in", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+            }))
+            time.sleep(stand_in.token_latency)
+        write_event(json.dumps({
+            "id": "chatcmpl-stand-in", "object": "chat.completion.chunk",
+            "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            "x_groq": {"usage": usage},
+        }))
+        write_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class GroqStandIn:
+    def __init__(self, valid_keys: Optional[set] = None,
+                 latency: float = 0.0,
+                 token_latency: float = 0.0,
+                 answer: str = "This is a stand-in answer from the local Groq server.",
+                 models: tuple = ("llama-3.1-8b-instant", "llama-3.3-70b-versatile"),
+                 echo_key: bool = False):
+        self.valid_keys = valid_keys
+        self.latency = latency
+        self.token_latency = token_latency
+        self.answer = answer
+        self.models = models
+        # append the caller's API key to answers, to check per-user isolation
+        self.echo_key = echo_key
+        self.counts = Counter()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.stand_in = self
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counts[name] += 1
+
+    def reject(self, body: dict):
+        """Hook for subclasses, return ``(status, headers)`` to fail a completion."""
+        return None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
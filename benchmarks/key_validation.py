@@ -0,0 +1,67 @@
+"""
+Groq API key validation against the local stand-in.
+
+Shows the cost of the old "Hello" chat completion check versus the cached,
+de-duplicated models listing used by ``src.auth.validation``.
+
+    python -m benchmarks.key_validation --concurrency 50 --latency 0.2
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from groq import Groq
+
+from benchmarks.groq_stand_in import GroqStandIn
+from src.auth.validation import ApiKeyValidator
+
+GOOD_KEY = "gsk_valid_key"
+BAD_KEY = "gsk_revoked_key"
+
+
+def old_validation(base_url: str, api_key: str) -> bool:
+    try:
+        Groq(api_key=api_key, base_url=base_url, max_retries=0).chat.completions.create(
+            messages=[{"role": "user", "content": "Hello"}],
+            model="llama-3.1-8b-instant"
+        )
+        return True
+    except Exception:
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    with GroqStandIn(valid_keys={GOOD_KEY}, latency=args.latency) as server:
+        start = time.perf_counter()
+        assert old_validation(server.base_url, GOOD_KEY)
+        print(f"chat completion check: {1000 * (time.perf_counter() - start):7.1f} ms")
+
+        validator = ApiKeyValidator(base_url=server.base_url)
+        server.counts.clear()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(validator.validate, [GOOD_KEY] * args.concurrency))
+        elapsed = time.perf_counter() - start
+        assert all(valid for valid, _ in results)
+        print(f"{args.concurrency} concurrent checks: {1000 * elapsed:7.1f} ms, "
+              f"{server.counts['models']} upstream request(s)")
+
+        start = time.perf_counter()
+        validator.validate(GOOD_KEY)
+        print(f"cached valid key:      {1000 * (time.perf_counter() - start):7.3f} ms")
+
+        assert not validator.validate(BAD_KEY)[0]
+        start = time.perf_counter()
+        assert not validator.validate(BAD_KEY)[0]
+        print(f"cached invalid key:    {1000 * (time.perf_counter() - start):7.3f} ms")
+        print(f"upstream requests total: {server.counts['requests']}, "
+              f"chat completions: {server.counts['chat_completions']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""
+Synthetic multi-user load generator for sizing a deployment.
+
+Each simulated user asks a question, waits for the answer, thinks for an
+exponentially distributed time and asks again. Questions are drawn from a pool
+with Zipf-distributed popularity, so popular questions repeat and exercise the
+caches the way a ward full of users asking about the same conditions would. The
+number of users is stepped up (``--users 1 2 4 8``) and every step reports
+throughput, latency percentiles and the error rate. The saturation point is the
+first step where adding users no longer buys throughput, pushes p95 over the SLO
+or makes errors exceed 1%.
+
+Targets:
+
+    inprocess   ``Interface.get_answer`` on bots sharing one knowledge base; fake
+                embeddings and chat model (``--backend fake``), the local Groq
+                stand-in (``--backend stand-in``), or the real index and Groq
+                (``--backend real``, needs the database and GROQ_API_KEY)
+    http        ``POST /query`` of ``src.service`` at ``--url``, one keep-alive
+                connection per user, logged in with ``--userid``/``--password``
+    gradio      the ``/chat`` endpoint of the Gradio app at ``--url`` through
+                ``gradio_client``, logged in through ``/start_bot``
+
+    python -m benchmarks.load_generator --target inprocess --users 1 4 16 64 \
+        --duration 30 --think-time 2 --llm-latency 0.5 --output results/load.json
+"""
+import argparse
+import http.client
+import json
+import random
+import tempfile
+import threading
+import time
+from typing import Callable, List, Optional
+from urllib.parse import urlparse
+
+from benchmarks.fakes import synthetic_questions
+from benchmarks.stats import summarize, write_results
+# the example questions of the Gradio apps lead the pool, so they are the most asked
+from src.bot.loader import EXAMPLE_QUESTIONS
+
+PROMPT_CONFIG = "src/bot/configs/prompt.toml"
+MAX_ERROR_RATE = 0.01
+# relative throughput gain below which more users count as saturation
+MIN_SCALING_GAIN = 0.1
+
+
+class ZipfQuestionMix:
+    """Draws questions with probability proportional to ``1 / rank ** exponent``."""
+
+    def __init__(self, questions: List[str], exponent: float = 1.1):
+        self.questions = questions
+        self.weights = [1.0 / (rank + 1) ** exponent for rank in range(len(questions))]
+
+    def draw(self, rng: random.Random) -> str:
+        return rng.choices(self.questions, weights=self.weights)[0]
+
+
+class AskError(Exception):
+    """The target answered with an error."""
+
+
+# targets ------------------------------------------------------------------------
+# a target builds one ``ask(question)`` callable per simulated user
+
+
+def inprocess_target(args, stack: list) -> Callable[[], Callable[[str], None]]:
+    from benchmarks.fakes import FakeChatModel, FakeEmbeddings, build_synthetic_store
+    from src.bot.bot import KnowledgeBase
+    from src.interface import Interface
+
+    bot_kwargs = {}
+    if args.backend == "real":
+        knowledge_base = KnowledgeBase(args.metadata_database, args.faiss_database)
+    else:
+        embeddings = FakeEmbeddings()
+        tmp = tempfile.TemporaryDirectory()
+        stack.append(tmp.cleanup)
+        knowledge_base = KnowledgeBase(
+            embeddings=embeddings, **build_synthetic_store(tmp.name, args.chunks, embeddings))
+        if args.backend == "fake":
+            bot_kwargs["model"] = FakeChatModel(latency=args.llm_latency)
+        else:
+            from benchmarks.groq_stand_in import GroqStandIn
+            from src.bot.clients import GroqClientPool
+            from src.bot.throttle import ThrottleRegistry
+            server = GroqStandIn(latency=args.llm_latency).start()
+            stack.append(server.stop)
+            bot_kwargs["client_pool"] = GroqClientPool(base_url=server.base_url)
+            bot_kwargs["api_key"] = "gsk_load"
+            # every simulated user shares the key, pacing it would cap the load
+            bot_kwargs["throttles"] = ThrottleRegistry(requests_per_minute=0)
+
+    def user():
+        interface = Interface(PROMPT_CONFIG, knowledge_base=knowledge_base, **bot_kwargs)
+
+        def ask(question: str):
+            answer = interface.get_answer(question)[0]
+            if answer.startswith("Error:"):
+                raise AskError(answer)
+        return ask
+
+    return user
+
+
+def http_target(args, stack: list) -> Callable[[], Callable[[str], None]]:
+    url = urlparse(args.url)
+
+    def connect():
+        return http.client.HTTPConnection(url.hostname, url.port or 80,
+                                          timeout=args.timeout)
+
+    def request(connection, path: str, body: dict, headers: dict) -> dict:
+        connection.request("POST", path, json.dumps(body),
+                           {"Content-Type": "application/json", **headers})
+        response = connection.getresponse()
+        payload = response.read()
+        if response.status != 200:
+            raise AskError(f"HTTP {response.status}: {payload[:200]!r}")
+        return json.loads(payload)
+
+    token = args.token
+    if token is None:
+        token = request(connect(), "/auth/login",
+                        {"userid": args.userid, "password": args.password}, {})["token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    def user():
+        connection = connect()
+
+        def ask(question: str):
+            nonlocal connection
+            try:
+                request(connection, "/query", {"question": question}, headers)
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = connect()
+                raise
+        return ask
+
+    return user
+
+
+def gradio_target(args, stack: list) -> Callable[[], Callable[[str], None]]:
+    from gradio_client import Client
+
+    def user():
+        # the chat session lives in the server-side state of this client
+        client = Client(args.url, verbose=False)
+        if args.userid:
+            client.predict(args.userid, args.password, api_name="/start_bot")
+
+        def ask(question: str):
+            answer = client.predict(question, "All specialties", api_name="/chat")
+            if str(answer).startswith(("Error:", "❌", "⏳")):
+                raise AskError(str(answer)[:200])
+        return ask
+
+    return user
+
+
+TARGETS = {"inprocess": inprocess_target, "http": http_target, "gradio": gradio_target}
+
+
+# load ---------------------------------------------------------------------------
+
+
+def run_step(make_user: Callable, n_users: int, mix: ZipfQuestionMix, duration: float,
+             think_time: float, seed: int) -> dict:
+    """Run ``n_users`` closed-loop users for ``duration`` seconds."""
+    users = [make_user() for _ in range(n_users)]
+    latencies, errors, asked = [], [], []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def run(i: int, ask: Callable[[str], None]):
+        rng = random.Random(seed * 1000 + i)
+        # spread the first questions over one think time
+        time.sleep(rng.uniform(0, think_time))
+        while time.perf_counter() < deadline:
+            question = mix.draw(rng)
+            start = time.perf_counter()
+            try:
+                ask(question)
+                error = None
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            elapsed = time.perf_counter() - start
+            with lock:
+                asked.append(question)
+                if error is None:
+                    latencies.append(elapsed)
+                else:
+                    errors.append(error)
+            if think_time:
+                time.sleep(min(rng.expovariate(1 / think_time),
+                               max(0.0, deadline - time.perf_counter())))
+
+    threads = [threading.Thread(target=run, args=(i, ask), daemon=True)
+               for i, ask in enumerate(users)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    requests = len(asked)
+    return {
+        "users": n_users,
+        "requests": requests,
+        "throughput_rps": len(latencies) / elapsed,
+        "error_rate": len(errors) / requests if requests else 0.0,
+        "errors": len(errors),
+        "error_samples": sorted(set(errors))[:5],
+        "repeat_ratio": 1 - len(set(asked)) / requests if requests else 0.0,
+        "latency": summarize(latencies),
+    }
+
+
+def saturation(steps: List[dict], slo_ms: Optional[float]) -> Optional[dict]:
+    """First step past the knee, with the reason, None if the load never saturated."""
+    for previous, step in zip([None] + steps, steps):
+        reasons = []
+        if step["error_rate"] > MAX_ERROR_RATE:
+            reasons.append(f"error rate {step['error_rate']:.1%}")
+        if slo_ms and step["latency"].get("p95_ms", 0) > slo_ms:
+            reasons.append(f"p95 {step['latency']['p95_ms']:.0f} ms over the SLO")
+        if previous and previous["throughput_rps"] and step["users"] > previous["users"]:
+            gain = step["throughput_rps"] / previous["throughput_rps"] - 1
+            if gain < MIN_SCALING_GAIN * (step["users"] / previous["users"] - 1):
+                reasons.append(f"throughput {gain:+.0%} for "
+                               f"{step['users'] / previous['users']:.1f}x users")
+        if reasons:
+            return {"users": step["users"],
+                    "max_good_users": previous["users"] if previous else None,
+                    "reasons": reasons}
+    return None
+
+
+def print_summary(steps: List[dict], knee: Optional[dict]):
+    print(f"{'users':>6} {'req':>7} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9} {'errors':>7} {'repeat':>7}")
+    for step in steps:
+        latency = step["latency"]
+        print(f"{step['users']:>6} {step['requests']:>7} {step['throughput_rps']:>8.2f} "
+              f"{latency.get('p50_ms', 0):>9.1f} {latency.get('p95_ms', 0):>9.1f} "
+              f"{latency.get('p99_ms', 0):>9.1f} {step['error_rate']:>7.1%} "
+              f"{step['repeat_ratio']:>7.1%}")
+    if knee is None:
+        print("No saturation within the tested user counts.")
+    else:
+        print(f"Saturated at {knee['users']} users "
+              f"(last good: {knee['max_good_users']}): {', '.join(knee['reasons'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=tuple(TARGETS), default="inprocess")
+    parser.add_argument("--backend", choices=("fake", "stand-in", "real"), default="fake",
+                        help="backends of the in-process target")
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--userid")
+    parser.add_argument("--password")
+    parser.add_argument("--token", help="session token for the http target")
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds per step")
+    parser.add_argument("--think-time", type=float, default=1.0,
+                        help="mean seconds between a user's questions")
+    parser.add_argument("--questions", type=int, default=200, help="question pool size")
+    parser.add_argument("--questions-file", help="one question per line, most popular first")
+    parser.add_argument("--zipf", type=float, default=1.1, help="popularity exponent")
+    parser.add_argument("--slo-ms", type=float, help="p95 latency target")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--metadata-database", default="database/metadata.csv")
+    parser.add_argument("--faiss-database", default="database/faiss_index")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="also print the JSON report")
+    parser.add_argument("--output", help="write JSON results to this path")
+    args = parser.parse_args()
+
+    if args.questions_file:
+        with open(args.questions_file) as f:
+            questions = [line.strip() for line in f if line.strip()]
+    else:
+        questions = EXAMPLE_QUESTIONS + synthetic_questions(args.questions, seed=args.seed)
+    mix = ZipfQuestionMix(questions, args.zipf)
+
+    cleanup = []
+    try:
+        make_user = TARGETS[args.target](args, cleanup)
+        steps = []
+        for n_users in args.users:
+            steps.append(run_step(make_user, n_users, mix, args.duration,
+                                  args.think_time, args.seed))
+            print(f"{n_users} users: {steps[-1]['throughput_rps']:.2f} req/s", flush=True)
+    finally:
+        for close in reversed(cleanup):
+            close()
+
+    knee = saturation(steps, args.slo_ms)
+    params = {k: v for k, v in vars(args).items() if k not in ("password", "token")}
+    report = write_results(args.output, "load_generator", params,
+                           {"steps": steps, "saturation": knee})
+    print()
+    print_summary(steps, knee)
+    if args.json:
+        print(json.dumps(report["results"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
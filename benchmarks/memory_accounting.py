@@ -0,0 +1,84 @@
+"""
+Checks the memory report against synthetic indexes of known size.
+
+For every size and vector storage a synthetic index is built, loaded into a
+``KnowledgeBase`` with a few sessions on top, and the reported sizes are compared
+with what the index must hold: ``chunks * dim`` vector codes, one 2 KiB base64
+picture per seven chunks, and the RSS growth of loading it.
+
+    python -m benchmarks.memory_accounting --chunks 5000 20000 --dim 512 --sessions 8
+"""
+import argparse
+import gc
+import json
+import math
+import tempfile
+
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings, build_synthetic_store
+from benchmarks.stats import rss_bytes, write_results
+from src.bot.bot import KnowledgeBase, Medibot
+from src.bot.vectors import compress_index
+from src.memory import check_budgets, memory_report
+
+PROMPT_CONFIG = "src/bot/configs/prompt.toml"
+CODE_BYTES = {"float32": 4, "float16": 2, "sq8": 1}
+# base64 of the 2048 random bytes every synthetic picture row holds
+PICTURE_CHARS = 4 * math.ceil(2048 / 3)
+
+
+def measure(paths: dict, embeddings, n_chunks: int, dim: int, storage: str,
+            n_sessions: int) -> dict:
+    gc.collect()
+    before = rss_bytes()
+    knowledge_base = KnowledgeBase(paths["metadata_database"], paths["faiss_database"],
+                                   embeddings=embeddings)
+    loaded = rss_bytes()
+    sessions = [Medibot(PROMPT_CONFIG, knowledge_base=knowledge_base,
+                        model=FakeChatModel()) for _ in range(n_sessions)]
+    report = memory_report(knowledge_base, sessions)
+    expected_faiss = n_chunks * dim * CODE_BYTES[storage]
+    expected_images = math.ceil(n_chunks / 7) * PICTURE_CHARS
+    return {
+        "report": report.to_dict(),
+        "expected_faiss": expected_faiss,
+        "faiss_error": report.components["faiss"] / expected_faiss - 1,
+        "expected_images": expected_images,
+        "images_error": report.details["metadata_images"] / expected_images - 1,
+        "load_rss_growth": loaded - before,
+        # accounted shared structures versus what loading them cost the process
+        "accounted_share": (report.total - sum(report.sessions))
+                           / max(1, loaded - before),
+        "exceeded_1mb_session_budget": check_budgets(report, {"session": 1 << 20},
+                                                     action="warn"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, nargs="+", default=[5000, 20000])
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--storages", nargs="+", default=["float32", "float16"],
+                        choices=tuple(CODE_BYTES))
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--output", help="write JSON results to this path")
+    args = parser.parse_args()
+
+    embeddings = FakeEmbeddings(dim=args.dim)
+    results = {}
+    for n_chunks in args.chunks:
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = build_synthetic_store(tmp, n_chunks, embeddings)
+            for storage in args.storages:
+                if storage != "float32":
+                    compress_index(paths["faiss_database"], paths["faiss_database"],
+                                   storage=storage)
+                results[f"{n_chunks}_{storage}"] = measure(
+                    paths, embeddings, n_chunks, args.dim, storage, args.sessions)
+
+    report = write_results(args.output, "memory_accounting", vars(args), results)
+    print(json.dumps(report["results"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
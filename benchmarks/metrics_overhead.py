@@ -0,0 +1,44 @@
+"""
+Per-call cost of the instrumentation in ``src.metrics`` with metrics disabled,
+enabled, and inside a request trace.
+
+    python -m benchmarks.metrics_overhead --iterations 200000
+"""
+import argparse
+import time
+
+from src.metrics import MetricsRegistry, trace
+
+
+def time_spans(registry: MetricsRegistry, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        with registry.span("search"):
+            pass
+        registry.observe("medibot_retrieved_docs", 10)
+    return (time.perf_counter() - start) / iterations * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=200000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    for _ in range(args.iterations):
+        pass
+    baseline = (time.perf_counter() - start) / args.iterations * 1e9
+
+    disabled = time_spans(MetricsRegistry(enabled=False), args.iterations)
+    enabled = time_spans(MetricsRegistry(enabled=True), args.iterations)
+    with trace():
+        traced = time_spans(MetricsRegistry(enabled=False), args.iterations)
+
+    print(f"empty loop:        {baseline:8.1f} ns/iteration")
+    print(f"metrics disabled:  {disabled:8.1f} ns/iteration")
+    print(f"metrics enabled:   {enabled:8.1f} ns/iteration")
+    print(f"trace only:        {traced:8.1f} ns/iteration")
+
+
+if __name__ == "__main__":
+    main()
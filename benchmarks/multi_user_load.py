@@ -0,0 +1,128 @@
+"""
+Multi-user load against per-session bots.
+
+Every simulated user logs in with their own Groq key and gets their own
+``UserSession``. Chat completions go to the local Groq stand-in, which echoes the
+caller's key so the run can check that no answer used another user's key (identical
+questions are only coalesced per key for that reason). The same
+workload is replayed with increasing queue concurrency to show throughput scaling.
+A final phase has one user flood the queue to show the per-user in-flight limit
+protecting everyone else.
+
+    python -m benchmarks.multi_user_load --users 16 --llm-latency 0.1 \
+        --concurrency 1 2 4 8 16 --output results/multi_user.json
+"""
+import argparse
+import json
+import re
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fakes import FakeEmbeddings, build_synthetic_store, synthetic_questions
+from benchmarks.groq_stand_in import GroqStandIn
+from benchmarks.stats import summarize, write_results
+
+PROMPT_CONFIG = "src/bot/configs/prompt.toml"
+KEY_PATTERN = re.compile(r"\[key (\S+)\]")
+
+
+def replay(sessions, questions, concurrency, limiter):
+    latencies, leaks, errors = [], 0, 0
+
+    def ask(item):
+        nonlocal leaks, errors
+        session, question = item
+        start = time.perf_counter()
+        response = session.answer(question, limiter)
+        latencies.append(time.perf_counter() - start)
+        match = KEY_PATTERN.search(response)
+        if match is None:
+            errors += 1
+        elif match.group(1) != session.api_key:
+            leaks += 1
+
+    workload = [(session, question) for question in questions for session in sessions]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(ask, workload))
+    elapsed = time.perf_counter() - start
+    return {"concurrency": concurrency, "requests": len(workload),
+            "requests_per_s": len(workload) / elapsed, "key_leaks": leaks,
+            "errors": errors, "latency": summarize(latencies)}
+
+
+def flood(sessions, question, concurrency, limiter, burst):
+    """One user fires ``burst`` questions at once while the others ask one each."""
+    heavy, others = sessions[0], sessions[1:]
+    results = {"heavy": [], "others": []}
+
+    def ask(item):
+        kind, session = item
+        start = time.perf_counter()
+        response = session.answer(question, limiter)
+        results[kind].append((time.perf_counter() - start, response.startswith("⏳")))
+
+    workload = [("heavy", heavy)] * burst + [("others", s) for s in others]
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(ask, workload))
+    return {
+        "burst": burst,
+        "max_in_flight": limiter.max_in_flight,
+        "heavy_rejected": sum(rejected for _, rejected in results["heavy"]),
+        "others_rejected": sum(rejected for _, rejected in results["others"]),
+        "others_latency": summarize([latency for latency, _ in results["others"]]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=16)
+    parser.add_argument("--questions", type=int, default=4)
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--llm-latency", type=float, default=0.1)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--max-in-flight", type=int, default=2)
+    parser.add_argument("--burst", type=int, default=32)
+    parser.add_argument("--output", help="write JSON results to this path")
+    args = parser.parse_args()
+
+    from src.bot.bot import KnowledgeBase
+    from src.bot.clients import GroqClientPool
+    from src.bot.throttle import ThrottleRegistry
+    from src.interface import Interface
+    from src.sessions import InFlightLimiter, UserSession
+
+    embeddings = FakeEmbeddings()
+    questions = synthetic_questions(args.questions)
+    with tempfile.TemporaryDirectory() as tmp, \
+            GroqStandIn(latency=args.llm_latency, echo_key=True) as server:
+        client_pool = GroqClientPool(base_url=server.base_url)
+        # the stand-in has no rate limit, pacing the keys would only measure the pacing
+        unthrottled = ThrottleRegistry(requests_per_minute=0)
+        knowledge_base = KnowledgeBase(embeddings=embeddings,
+                                       **build_synthetic_store(tmp, args.chunks, embeddings))
+        sessions = []
+        for i in range(args.users):
+            api_key = f"gsk_user{i}"
+            session = UserSession(f"user{i}", Interface(config_path=PROMPT_CONFIG,
+                                                        knowledge_base=knowledge_base,
+                                                        api_key=api_key,
+                                                        client_pool=client_pool,
+                                                        coalesce="key",
+                                                        throttles=unthrottled))
+            session.api_key = api_key
+            sessions.append(session)
+
+        limiter = InFlightLimiter(args.max_in_flight)
+        scaling = [replay(sessions, questions, c, limiter) for c in args.concurrency]
+        fairness = flood(sessions, questions[0], max(args.concurrency), limiter, args.burst)
+
+    report = write_results(args.output, "multi_user_load", vars(args),
+                           {"scaling": scaling, "flood": fairness})
+    print(json.dumps(report["results"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Throughput of ``Medibot.query_batch`` versus a loop over ``Medibot.query`` with
+stand-in backends.
+
+The fake embeddings charge ``--embed-latency`` per call and the fake chat model
+``--llm-latency`` per answer, so the loop pays both once per question while the
+batch pays one embedding call and overlaps ``--concurrency`` LLM calls.
+
+    python -m benchmarks.query_batch --questions 500 --concurrency 8
+"""
+import argparse
+import json
+import tempfile
+import time
+
+from benchmarks.fakes import (FakeChatModel, FakeEmbeddings, build_synthetic_store,
+                              synthetic_questions)
+from benchmarks.stats import summarize, write_results
+
+PROMPT_CONFIG = "src/bot/configs/prompt.toml"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--questions", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--output", help="write JSON results to this path")
+    args = parser.parse_args()
+
+    from src.bot.bot import KnowledgeBase, Medibot
+
+    embeddings = FakeEmbeddings(latency=args.embed_latency)
+    model = FakeChatModel(latency=args.llm_latency)
+    questions = synthetic_questions(args.questions)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = build_synthetic_store(tmp, args.chunks, FakeEmbeddings())
+        knowledge_base = KnowledgeBase(embeddings=embeddings, **paths)
+        bot = Medibot(PROMPT_CONFIG, knowledge_base=knowledge_base, model=model)
+
+        start = time.perf_counter()
+        loop_answers = [bot.query(question)[0] for question in questions]
+        loop_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batch = bot.query_batch(questions, concurrency=args.concurrency)
+        batch_s = time.perf_counter() - start
+
+    stages = sorted({stage for result in batch for stage in result.timings})
+    results = {
+        "loop": {"seconds": loop_s, "questions_per_s": len(questions) / loop_s},
+        "batch": {"seconds": batch_s, "questions_per_s": len(questions) / batch_s,
+                  "errors": sum(result.error is not None for result in batch),
+                  "stages": {stage: summarize([result.timings.get(stage, 0.0)
+                                               for result in batch]) for stage in stages}},
+        "speedup": loop_s / batch_s,
+        "same_answers": loop_answers == [result.answer for result in batch],
+    }
+    report = write_results(args.output, "query_batch", vars(args), results)
+    print(json.dumps(report["results"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+End-to-end latency of ``Medibot.query`` and ``Interface.get_answer`` with stand-in
+backends.
+
+Builds a synthetic FAISS index and metadata store, swaps in deterministic fake
+embeddings and a fake chat model, then reports per-stage and end-to-end
+p50/p95/p99 latency, throughput and memory.
+
+    python -m benchmarks.query_latency --chunks 20000 --llm-latency 0.3 \
+        --output results/query_latency.json
+"""
+import argparse
+import json
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fakes import (FakeChatModel, FakeEmbeddings, build_synthetic_store,
+                              synthetic_questions)
+from benchmarks.stats import rss_bytes, summarize, write_results
+
+PROMPT_CONFIG = "src/bot/configs/prompt.toml"
+
+
+def stage_latencies(interface, questions) -> dict:
+    """Run the query path stage by stage, timing each one."""
+    bot = interface.bot
+    stages = {name: [] for name in
+              ("embed", "search", "generate", "resolve_references", "format", "end_to_end")}
+    for question in questions:
+        t0 = time.perf_counter()
+        embedding = bot.embed_question(question)
+        t1 = time.perf_counter()
+        docs = bot.search(embedding)
+        t2 = time.perf_counter()
+        answer = bot.generate(question, docs)
+        t3 = time.perf_counter()
+        tables, images = bot.resolve_references(docs)
+        t4 = time.perf_counter()
+        interface.format_answer(answer, docs, tables, images)
+        t5 = time.perf_counter()
+        for name, start, end in (("embed", t0, t1), ("search", t1, t2),
+                                 ("generate", t2, t3), ("resolve_references", t3, t4),
+                                 ("format", t4, t5), ("end_to_end", t0, t5)):
+            stages[name].append(end - start)
+    return {name: summarize(samples) for name, samples in stages.items()}
+
+
+def throughput(interface, questions, concurrency: int) -> dict:
+    latencies = []
+
+    def timed(question):
+        start = time.perf_counter()
+        interface.get_answer(question)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(timed, questions))
+    elapsed = time.perf_counter() - start
+    return {"concurrency": concurrency, "queries": len(questions),
+            "queries_per_s": len(questions) / elapsed, "latency": summarize(latencies)}
+
+
+def run(args) -> dict:
+    from src.interface import Interface
+
+    embeddings = FakeEmbeddings(dim=args.dim, latency=args.embed_latency)
+    model = FakeChatModel(latency=args.llm_latency)
+    questions = synthetic_questions(args.queries)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        paths = build_synthetic_store(tmp, args.chunks, embeddings, n_sources=args.sources)
+        build_s = time.perf_counter() - start
+
+        rss_before = rss_bytes()
+        start = time.perf_counter()
+        interface = Interface(config_path=PROMPT_CONFIG, embeddings=embeddings,
+                              model=model, **paths)
+        load_s = time.perf_counter() - start
+        rss_loaded = rss_bytes()
+
+        interface.get_answer(questions[0])  # warm-up
+        stages = stage_latencies(interface, questions)
+        load = throughput(interface, questions, args.concurrency)
+
+    return {
+        "build_index_s": build_s,
+        "load_s": load_s,
+        "stages": stages,
+        "throughput": load,
+        "memory": {"rss_before_load_bytes": rss_before,
+                   "rss_after_load_bytes": rss_loaded,
+                   "rss_peak_bytes": rss_bytes(),
+                   "index_load_delta_bytes": rss_loaded - rss_before},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--sources", type=int, default=4)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--embed-latency", type=float, default=0.0)
+    parser.add_argument("--llm-latency", type=float, default=0.0)
+    parser.add_argument("--output", help="write JSON results to this path")
+    args = parser.parse_args()
+
+    report = write_results(args.output, "query_latency", vars(args), run(args))
+    print(json.dumps(report["results"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Bursty load on one shared Groq key against a stand-in that enforces a rate limit.
+
+The stand-in answers at most ``--limit`` completions per second of the primary
+model and returns 429 with ``retry-after`` beyond that, like Groq does. ``--users``
+threads sharing one key ask ``--questions`` distinct questions each, three times:
+
+* ``unprotected``: no pacing, only the retries with backoff,
+* ``paced``: the per-key token bucket and circuit breaker of ``src.bot.throttle``,
+* ``fallback``: paced, and throttled calls go to ``--fallback-model``.
+
+Reported per run: 429s served by the stand-in, completions per model, errors the
+users saw, fallbacks taken and the latency. A fourth run, ``breaker``, sends a few
+questions while the stand-in answers every primary call with 429: the first 429 must
+open the primary's breaker, the questions must be answered by the fallback model and
+the throttle, breaker and fallback counters must be recorded. The run exits non-zero
+when that does not hold or the fallback run shows errors to the users
+(``benchmarks.regressions`` runs it as a check).
+
+    python -m benchmarks.rate_limits --users 16 --questions 5 --limit 5
+"""
+import argparse
+import json
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fakes import FakeEmbeddings, build_synthetic_store, synthetic_questions
+from benchmarks.groq_stand_in import GroqStandIn
+from benchmarks.stats import summarize, write_results
+from src.bot.bot import KnowledgeBase, Medibot
+from src.bot.clients import GroqClientPool
+from src.bot.throttle import CircuitBreaker, ThrottleRegistry
+from src.metrics import metrics
+
+PROMPT_CONFIG = "src/bot/configs/prompt.toml"
+API_KEY = "gsk_shared"
+PRIMARY_MODEL = "llama-3.1-8b-instant"
+
+
+class ThrottlingStandIn(GroqStandIn):
+    """Stand-in limiting ``model`` to ``limit`` completions per ``window`` seconds."""
+
+    def __init__(self, model: str, limit: int, window: float = 1.0, **kwargs):
+        super().__init__(**kwargs)
+        self.limited_model = model
+        self.limit = limit
+        self.window = window
+        self._served = deque()
+        self._window_lock = threading.Lock()
+
+    def reject(self, body: dict):
+        model = body.get("model")
+        self._count(f"model_{model}")
+        if model != self.limited_model:
+            return None
+        with self._window_lock:
+            now = time.monotonic()
+            while self._served and now - self._served[0] >= self.window:
+                self._served.popleft()
+            if len(self._served) >= self.limit:
+                wait = self.window - (now - self._served[0]) if self._served \
+                    else self.window
+                return 429, {"retry-after": f"{wait:.2f}"}
+            self._served.append(now)
+        return None
+
+
+def fallbacks() -> float:
+    counter = metrics.counter("medibot_llm_fallbacks_total")
+    return sum(counter.values.values())
+
+
+def run(server, knowledge_base, client_pool, questions, users, throttles,
+        fallback_model: str) -> dict:
+    server.counts.clear()
+    bot = Medibot(PROMPT_CONFIG, knowledge_base=knowledge_base, api_key=API_KEY,
+                  client_pool=client_pool, coalesce="off", throttles=throttles,
+                  fallback_model=fallback_model)
+    latencies, errors = [], Counter()
+    fallbacks_before = fallbacks()
+
+    def ask(user: int):
+        for question in questions[user::users]:
+            start = time.perf_counter()
+            try:
+                bot.query(question)
+            except Exception as e:
+                errors[type(e).__name__] += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        list(pool.map(ask, range(users)))
+    elapsed = time.perf_counter() - start
+    return {"requests": len(questions), "elapsed_s": elapsed,
+            "status_429": server.counts["status_429"],
+            "completions": {name.removeprefix("model_"): count
+                            for name, count in server.counts.items()
+                            if name.startswith("model_")},
+            "errors": dict(errors), "fallbacks": fallbacks() - fallbacks_before,
+            "latency": summarize(latencies)}
+
+
+def breaker_check(knowledge_base, fallback_model: str) -> dict:
+    """Failures of the 429 -> open breaker -> fallback path, empty when it works."""
+    with ThrottlingStandIn(PRIMARY_MODEL, 0, window=60.0) as server:
+        throttles = ThrottleRegistry(requests_per_minute=0, failure_threshold=1,
+                                     reset_timeout=60.0)
+        bot = Medibot(PROMPT_CONFIG, knowledge_base=knowledge_base, api_key=API_KEY,
+                      client_pool=GroqClientPool(base_url=server.base_url),
+                      coalesce="off", throttles=throttles, fallback_model=fallback_model)
+        throttled = metrics.counter("medibot_llm_throttled_total")
+        opened = metrics.counter("medibot_circuit_transitions_total")
+        fallback = metrics.counter("medibot_llm_fallbacks_total")
+        before = (throttled.get(reason="429", model=PRIMARY_MODEL), opened.get(state="open"),
+                  fallback.get(reason="open", model=fallback_model))
+        errors = []
+        for question in synthetic_questions(3, seed=7):
+            try:
+                bot.query(question)
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+        after = (throttled.get(reason="429", model=PRIMARY_MODEL), opened.get(state="open"),
+                 fallback.get(reason="open", model=fallback_model))
+        checks = {
+            "no user errors": not errors,
+            "429 served": server.counts["status_429"] >= 1,
+            "primary breaker open":
+                throttles.get(API_KEY, PRIMARY_MODEL).breaker.state == CircuitBreaker.OPEN,
+            "answered by the fallback model": server.counts[f"model_{fallback_model}"] == 3,
+            "429 counted": after[0] > before[0],
+            "breaker opening counted": after[1] > before[1],
+            "fallbacks counted": after[2] - before[2] >= 2,
+        }
+        return {"errors": errors, "failed": [name for name, ok in checks.items() if not ok]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=16)
+    parser.add_argument("--questions", type=int, default=5, help="questions per user")
+    parser.add_argument("--limit", type=int, default=5,
+                        help="completions per second the stand-in serves the primary model")
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--fallback-model", default="llama-3.3-70b-versatile")
+    parser.add_argument("--output", help="write JSON results to this path")
+    args = parser.parse_args()
+
+    metrics.enabled = True
+    embeddings = FakeEmbeddings()
+    questions = synthetic_questions(args.users * args.questions)
+
+    def paced():
+        # a little under the server's limit, bursts up to a second's worth
+        return ThrottleRegistry(requests_per_minute=args.limit * 60 * 0.9,
+                                burst=args.limit)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp, \
+            ThrottlingStandIn(PRIMARY_MODEL, args.limit, latency=args.llm_latency) as server:
+        client_pool = GroqClientPool(base_url=server.base_url)
+        knowledge_base = KnowledgeBase(embeddings=embeddings,
+                                       **build_synthetic_store(tmp, args.chunks, embeddings))
+        common = (server, knowledge_base, client_pool, questions, args.users)
+        # no pacing and a breaker that never opens: what the retries alone achieve
+        results["unprotected"] = run(*common, ThrottleRegistry(
+            requests_per_minute=0, failure_threshold=sys.maxsize), fallback_model="")
+        results["paced"] = run(*common, paced(), fallback_model="")
+        results["fallback"] = run(*common, paced(), fallback_model=args.fallback_model)
+        results["breaker"] = breaker_check(knowledge_base, args.fallback_model)
+
+    report = write_results(args.output, "rate_limits", vars(args), results)
+    print(json.dumps(report["results"], indent=2))
+    failed = False
+    if results["fallback"]["errors"]:
+        print(f"Users saw errors despite the fallback: {results['fallback']['errors']}",
+              file=sys.stderr)
+        failed = True
+    if results["breaker"]["failed"]:
+        print(f"Breaker checks failed: {', '.join(results['breaker']['failed'])}",
+              file=sys.stderr)
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Table/picture resolution through the precompiled reference graph versus parsing
+the reference strings of every retrieved chunk.
+
+    python -m benchmarks.ref_resolution --chunks 20000 --queries 500
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.fakes import FakeEmbeddings, build_synthetic_store, synthetic_questions
+from benchmarks.stats import summarize, write_results
+from src.bot.extract_metadata import Metadata
+from src.bot.ref_graph import GRAPH_FILE, ReferenceGraph
+
+
+def resolve_all(metadata, retrieved) -> tuple:
+    latencies, results = [], []
+    for docs in retrieved:
+        start = time.perf_counter()
+        results.append(metadata.get_data_from_ref(docs))
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--output", help="write JSON results to this path")
+    args = parser.parse_args()
+
+    from src.bot.bot import KnowledgeBase
+
+    embeddings = FakeEmbeddings()
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = build_synthetic_store(tmp, args.chunks, embeddings)
+        knowledge_base = KnowledgeBase(embeddings=embeddings, **paths)
+        retrieved = [knowledge_base.vector_store.similarity_search(question, k=10)
+                     for question in synthetic_questions(args.queries)]
+        graph_path = os.path.join(paths["faiss_database"], GRAPH_FILE)
+        graph_bytes = os.path.getsize(graph_path)
+        start = time.perf_counter()
+        ReferenceGraph.load(graph_path)
+        graph_load_s = time.perf_counter() - start
+
+        regex_latency, regex_results = resolve_all(Metadata(paths["metadata_database"]),
+                                                   retrieved)
+        graph_latency, graph_results = resolve_all(knowledge_base.metadata_extactor,
+                                                   retrieved)
+
+    results = {
+        "regex": regex_latency,
+        "graph": graph_latency,
+        "graph_file_bytes": graph_bytes,
+        "graph_load_s": graph_load_s,
+        "same_results": regex_results == graph_results,
+        "speedup": regex_latency["mean_ms"] / graph_latency["mean_ms"],
+    }
+    report = write_results(args.output, "ref_resolution", vars(args), results)
+    print(json.dumps(report["results"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
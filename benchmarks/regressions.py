@@ -0,0 +1,57 @@
+"""
+Runs the benchmarks that check a guarantee, on small inputs, and fails if any of
+them does.
+
+Each check is a benchmark that exits non-zero when its guarantee does not hold, run
+in its own process so global state (metrics, pools, registries) starts clean.
+
+    python -m benchmarks.regressions
+    python -m benchmarks.regressions deadlines
+"""
+import argparse
+import subprocess
+import sys
+import time
+
+CHECKS = {
+    # p99 and max latency stay within the deadline while the model stalls
+    "deadlines": ["benchmarks.deadlines", "--requests", "20", "--chunks", "500",
+                  "--stall", "5", "--stall-every", "5", "--deadline", "1",
+                  "--skip-baseline"],
+    # N identical questions in flight make one embedding and one LLM call
+    "coalescing": ["benchmarks.coalescing", "--users", "16", "--chunks", "500",
+                   "--llm-latency", "0.3"],
+    # a 429 opens the breaker, calls go to the fallback model, counters are recorded
+    "rate_limits": ["benchmarks.rate_limits", "--users", "4", "--questions", "3",
+                    "--chunks", "500"],
+}
+
+
+def run(name: str) -> bool:
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-m", *CHECKS[name]], capture_output=True,
+                            text=True)
+    passed = result.returncode == 0
+    print(f"{'ok  ' if passed else 'FAIL'} {name} ({time.perf_counter() - start:.1f}s)")
+    if not passed:
+        print(result.stdout[-2000:] + result.stderr[-2000:], file=sys.stderr)
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("checks", nargs="*", help=f"checks to run, all by default: "
+                                                  f"{', '.join(CHECKS)}")
+    args = parser.parse_args()
+    unknown = set(args.checks) - set(CHECKS)
+    if unknown:
+        parser.error(f"unknown checks: {', '.join(sorted(unknown))}")
+    failed = [name for name in args.checks or CHECKS if not run(name)]
+    if failed:
+        print(f"Failed: {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Per-request overhead of the headless HTTP service versus the Gradio path, with
+stand-in backends.
+
+The same ``Medibot`` (fake embeddings and chat model) answers questions called
+directly, through ``POST /query`` and ``POST /query/stream`` of ``src.service``
+over a keep-alive connection, and through a Gradio ``ChatInterface`` driven by
+``gradio_client``. Overhead is each path's latency minus the direct call.
+
+    python -m benchmarks.service_overhead --requests 200 --llm-latency 0.0
+"""
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import tempfile
+import threading
+import time
+
+from benchmarks.fakes import (FakeChatModel, FakeEmbeddings, build_synthetic_store,
+                              synthetic_questions)
+from benchmarks.stats import summarize, write_results
+
+PROMPT_CONFIG = "src/bot/configs/prompt.toml"
+
+
+def timed(call, questions) -> dict:
+    latencies = []
+    for question in questions:
+        start = time.perf_counter()
+        call(question)
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies)
+
+
+def start_service(service) -> int:
+    ready = threading.Event()
+
+    def run():
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(service.start("127.0.0.1", 0))
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+    return service.port
+
+
+def http_query(port: int, token: str):
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+
+    def call(question):
+        connection.request("POST", "/query", json.dumps({"question": question}), headers)
+        response = connection.getresponse()
+        assert response.status == 200, response.read()
+        response.read()
+
+    return call
+
+
+def sse_query(port: int, token: str):
+    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+    first_token = []
+
+    def call(question):
+        start = time.perf_counter()
+        connection = http.client.HTTPConnection("127.0.0.1", port)
+        connection.request("POST", "/query/stream", json.dumps({"question": question}),
+                           headers)
+        response = connection.getresponse()
+        seen = False
+        for line in response:
+            if not seen and line.startswith(b"event: token"):
+                first_token.append(time.perf_counter() - start)
+                seen = True
+            if line.startswith(b"event: done"):
+                break
+        connection.close()
+
+    return call, first_token
+
+
+def gradio_query(session):
+    import gradio as gr
+    from gradio_client import Client
+
+    demo = gr.ChatInterface(lambda message, history: session.answer(message))
+    _, url, _ = demo.launch(prevent_thread_lock=True, quiet=True)
+    client = Client(url, verbose=False)
+    return (lambda question: client.predict(question, api_name="/chat")), demo
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--llm-latency", type=float, default=0.0)
+    parser.add_argument("--skip-gradio", action="store_true")
+    parser.add_argument("--output", help="write JSON results to this path")
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    # the auth modules read DB_PATH when they are first imported
+    os.environ["DB_PATH"] = os.path.join(tmp.name, "users.db")
+    from src.auth.auth import hash_password
+    from src.auth.db import initialize_db, insert_user
+    from src.auth.session import create_session_token
+    from src.bot.bot import KnowledgeBase, Medibot
+    from src.bot.loader import BackgroundLoader
+    from src.interface import Interface
+    from src.service import MedibotService
+    from src.sessions import InFlightLimiter, UserSession
+
+    embeddings = FakeEmbeddings()
+    model = FakeChatModel(latency=args.llm_latency)
+    questions = synthetic_questions(args.requests)
+    paths = build_synthetic_store(tmp.name, args.chunks, embeddings)
+    knowledge_base = KnowledgeBase(embeddings=embeddings, **paths)
+
+    initialize_db()
+    insert_user("bench", hash_password("bench"), "gsk_bench")
+    token = create_session_token("bench")
+
+    loader = BackgroundLoader(lambda: knowledge_base).start()
+    loader.get()
+    service = MedibotService(
+        loader, limiter=InFlightLimiter(1000),
+        bot_factory=lambda api_key: Medibot(PROMPT_CONFIG, knowledge_base=knowledge_base,
+                                            model=model, api_key=api_key))
+    port = start_service(service)
+    bot = service.bot("gsk_bench")
+
+    results = {"direct": timed(bot.query, questions)}
+    results["http_json"] = timed(http_query(port, token), questions)
+    sse, first_token = sse_query(port, token)
+    results["http_sse"] = timed(sse, questions)
+    results["http_sse_first_token"] = summarize(first_token)
+    if not args.skip_gradio:
+        interface = Interface(PROMPT_CONFIG, knowledge_base=knowledge_base, model=model)
+        call, demo = gradio_query(UserSession("bench", interface))
+        results["gradio"] = timed(call, questions)
+        demo.close()
+
+    direct = results["direct"]["p50_ms"]
+    results["overhead_p50_ms"] = {path: results[path]["p50_ms"] - direct
+                                  for path in ("http_json", "http_sse", "gradio")
+                                  if path in results}
+    report = write_results(args.output, "service_overhead", vars(args), results)
+    print(json.dumps(report["results"], indent=2))
+    tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Search latency and recall of routed per-book shards versus the single index, as
+the number of books grows.
+
+For each book count a synthetic index is built where every book has its own word
+distribution, split into one shard per book, and searched with questions drawn
+from random chunks. Recall@k is measured against the exact top-k of the
+monolithic index.
+
+    python -m benchmarks.sharded_search --books 4 8 16 32 --top-shards 3
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.fakes import FakeEmbeddings, build_synthetic_store
+from benchmarks.stats import summarize, write_results
+from src.bot.ref_graph import read_index_chunks
+from src.bot.shards import ShardedVectorStore, build_shards
+
+
+def search_all(search, vectors) -> tuple:
+    latencies, hits = [], []
+    for vector in vectors:
+        start = time.perf_counter()
+        result = search(vector)
+        latencies.append(time.perf_counter() - start)
+        hits.append({doc.metadata["chunk_index"] for doc, _ in result})
+    return summarize(latencies), hits
+
+
+def run(books, args) -> dict:
+    from langchain_community.vectorstores import FAISS
+
+    embeddings = FakeEmbeddings(dim=args.dim)
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = build_synthetic_store(tmp, args.chunks_per_book * books, embeddings,
+                                      n_sources=books, ref_graph=False,
+                                      topic_per_source=True)
+        shards_dir = os.path.join(tmp, "shards")
+        build_shards(paths["faiss_database"], shards_dir, by="source")
+
+        monolithic = FAISS.load_local(paths["faiss_database"], embeddings,
+                                      allow_dangerous_deserialization=True)
+        sharded = ShardedVectorStore(shards_dir, embeddings, top_shards=args.top_shards)
+
+        rng = random.Random(books)
+        chunks, _ = read_index_chunks(paths["faiss_database"])
+        questions = [" ".join(rng.sample(rng.choice(chunks).page_content.split(), 6))
+                     for _ in range(args.queries)]
+        vectors = [embeddings.embed_query(question) for question in questions]
+
+        exact_latency, exact = search_all(
+            lambda v: monolithic.similarity_search_with_score_by_vector(v, args.k), vectors)
+        sharded_latency, routed = search_all(
+            lambda v: sharded.similarity_search_with_score_by_vector(v, args.k), vectors)
+
+    recall = sum(len(a & b) / len(a) for a, b in zip(exact, routed)) / len(exact)
+    return {"chunks": args.chunks_per_book * books,
+            "monolithic": exact_latency,
+            "sharded": sharded_latency,
+            f"recall_at_{args.k}": recall}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, nargs="+", default=[4, 8, 16, 32])
+    parser.add_argument("--chunks-per-book", type=int, default=5000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-shards", type=int, default=3)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--output", help="write JSON results to this path")
+    args = parser.parse_args()
+
+    results = {f"{books}_books": run(books, args) for books in args.books}
+    report = write_results(args.output, "sharded_search", vars(args), results)
+    print(json.dumps(report["results"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
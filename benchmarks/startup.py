@@ -0,0 +1,81 @@
+"""
+Import time of the app entry points and time-to-ready of the knowledge base.
+
+Import costs come from ``python -X importtime`` in a fresh interpreter per module.
+Time-to-ready loads a synthetic index through the same ``BackgroundLoader`` the
+apps use.
+
+    python -m benchmarks.startup --chunks 20000 --output results/startup.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.stats import write_results
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ("src.interface", "src.auth.auth", "src.bot.loader", "src.bot.bot")
+
+
+def import_time(module: str, top: int = 10) -> dict:
+    """Cumulative import time of ``module`` and its slowest dependencies."""
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=ROOT, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        entries.append((name.strip(), int(self_us), int(cumulative_us)))
+
+    total = next((cum for name, _, cum in entries if name == module), None)
+    slowest = sorted(entries, key=lambda e: e[1], reverse=True)[:top]
+    return {
+        "ok": result.returncode == 0,
+        "wall_s": wall,
+        "cumulative_ms": total / 1000 if total is not None else None,
+        "modules_imported": len(entries),
+        "slowest_self_ms": {name: self_us / 1000 for name, self_us, _ in slowest},
+        "error": result.stderr.strip().splitlines()[-1] if result.returncode else None,
+    }
+
+
+def time_to_ready(chunks: int) -> dict:
+    from benchmarks.fakes import FakeEmbeddings, build_synthetic_store
+    from src.bot.loader import BackgroundLoader
+
+    embeddings = FakeEmbeddings()
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = build_synthetic_store(tmp, chunks, embeddings)
+
+        def load():
+            from src.bot.bot import KnowledgeBase
+            return KnowledgeBase(embeddings=embeddings, **paths)
+
+        loader = BackgroundLoader(load).start()
+        loader.get()
+    return {"chunks": chunks, "load_s": loader.load_seconds}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--output", help="write JSON results to this path")
+    args = parser.parse_args()
+
+    results = {"imports": {module: import_time(module) for module in MODULES},
+               "time_to_ready": time_to_ready(args.chunks)}
+    report = write_results(args.output, "startup", vars(args), results)
+    print(json.dumps(report["results"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
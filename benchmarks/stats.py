@@ -0,0 +1,63 @@
+"""
+Shared helpers for the benchmark scripts: latency summaries, process memory and
+machine-readable result files.
+"""
+import json
+import os
+import platform
+import subprocess
+import time
+from typing import Dict, List, Optional
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """p50/p95/p99/mean/max of latency samples given in seconds, reported in ms."""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def percentile(p: float) -> float:
+        index = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))
+        return ordered[index] * 1000
+
+    return {
+        "count": len(ordered),
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def rss_bytes() -> int:
+    """Resident set size of this process, 0 where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path: Optional[str], name: str, params: dict, results: dict) -> dict:
+    """Wrap results with run metadata and write them as JSON when ``path`` is set."""
+    report = {
+        "benchmark": name,
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "params": params,
+        "results": results,
+    }
+    if path:
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
@@ -0,0 +1,88 @@
+"""
+Coarse-to-fine retrieval through the summary tree against the flat index.
+
+Builds a synthetic index where every book has its own vocabulary, builds its
+summary tree with ``ExtractiveSummarizer`` (no model needed) and retrieves every
+question through the flat index and through the tree. Reports the build time, the
+tree size, vectors scored per question, search latency and the overlap of the
+chunks retrieved by both.
+
+    python -m benchmarks.summary_tree --chunks 20000 --books 16 --branching 8 --beam 4
+"""
+import argparse
+import json
+import tempfile
+import time
+
+from benchmarks.fakes import (FakeChatModel, FakeEmbeddings, build_synthetic_store,
+                              synthetic_questions)
+from benchmarks.stats import summarize, write_results
+from src.bot.summary_tree import ExtractiveSummarizer, build_for_index
+from src.metrics import metrics
+
+PROMPT_CONFIG = "src/bot/configs/prompt.toml"
+
+
+def run(bot, embedded) -> tuple:
+    latencies, retrieved = [], []
+    for embedding in embedded:
+        start = time.perf_counter()
+        retrieved.append(bot.search(embedding))
+        latencies.append(time.perf_counter() - start)
+    return retrieved, summarize(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--books", type=int, default=16)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--branching", type=int, default=8)
+    parser.add_argument("--beam", type=int, default=4)
+    parser.add_argument("--output", help="write JSON results to this path")
+    args = parser.parse_args()
+
+    from src.bot.bot import KnowledgeBase, Medibot
+
+    metrics.enabled = True
+    embeddings = FakeEmbeddings()
+    questions = synthetic_questions(args.queries)
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = build_synthetic_store(tmp, args.chunks, embeddings, n_sources=args.books,
+                                      topic_per_source=True)
+        start = time.perf_counter()
+        tree = build_for_index(paths["faiss_database"], ExtractiveSummarizer(), embeddings,
+                               branching=args.branching)
+        build_seconds = time.perf_counter() - start
+
+        knowledge_base = KnowledgeBase(embeddings=embeddings, **paths)
+        knowledge_base.summary_tree_beam = args.beam
+        bot = Medibot(PROMPT_CONFIG, knowledge_base=knowledge_base, model=FakeChatModel(),
+                      coalesce="off")
+        embedded = [bot.embed_question(question) for question in questions]
+
+        knowledge_base.summary_tree = None
+        flat, flat_latency = run(bot, embedded)
+        knowledge_base.summary_tree = tree
+        through_tree, tree_latency = run(bot, embedded)
+
+    _, scored_sum, scored_count = metrics.histogram("medibot_tree_vectors_scored") \
+        .values.get((), [None, 0.0, 0])
+    overlap = [len({doc.id for doc in a} & {doc.id for doc in b}) / max(1, len(a))
+               for a, b in zip(flat, through_tree)]
+    results = {
+        "build_seconds": build_seconds,
+        "summary_nodes": len(tree.level),
+        "levels": int(tree.level.max()),
+        "flat": {"vectors_scored": args.chunks, "latency": flat_latency},
+        "tree": {"vectors_scored": scored_sum / max(1, scored_count),
+                 "latency": tree_latency},
+        "mean_overlap_with_flat": sum(overlap) / len(overlap),
+    }
+    report = write_results(args.output, "summary_tree", vars(args), results)
+    print(json.dumps(report["results"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Mixed register/login concurrency against a temp-file users database.
+
+Compares the pooled WAL layer in ``src.auth.db`` with the previous
+connect-per-call rollback-journal access pattern. bcrypt is left out so the numbers
+reflect database access only.
+
+    python -m benchmarks.users_db_concurrency --threads 32 --ops 4000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+PASSWORD_HASH = b"$2b$12$" + b"x" * 53
+
+
+def naive_insert(db_path, userid):
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute('INSERT INTO users (userid, password_hash, api_key) VALUES (?, ?, ?)',
+                     (userid, PASSWORD_HASH, "gsk_dummy"))
+        conn.commit()
+        return True
+    except sqlite3.IntegrityError:
+        return False
+    finally:
+        conn.close()
+
+
+def naive_fetch(db_path, userid):
+    conn = sqlite3.connect(db_path)
+    row = conn.execute('SELECT password_hash, api_key FROM users WHERE userid=?',
+                       (userid,)).fetchone()
+    conn.close()
+    return row
+
+
+def workload(ops: int, write_ratio: float, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    registered = 0
+    plan = []
+    for _ in range(ops):
+        if registered == 0 or rng.random() < write_ratio:
+            plan.append(("register", f"user{registered}"))
+            registered += 1
+        else:
+            plan.append(("login", f"user{rng.randrange(registered)}"))
+    return plan
+
+
+def run(name, plan, threads, insert, fetch) -> dict:
+    errors = 0
+
+    def execute(op):
+        nonlocal errors
+        kind, userid = op
+        try:
+            if kind == "register":
+                insert(userid)
+            else:
+                fetch(userid)
+        except sqlite3.OperationalError:
+            errors += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(execute, plan))
+    elapsed = time.perf_counter() - start
+    return {"layer": name, "ops_per_s": len(plan) / elapsed, "errors": errors}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--ops", type=int, default=4000)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    args = parser.parse_args()
+
+    plan = workload(args.ops, args.write_ratio)
+    with tempfile.TemporaryDirectory() as tmp:
+        naive_path = os.path.join(tmp, "naive.db")
+        conn = sqlite3.connect(naive_path)
+        conn.execute('CREATE TABLE users (userid TEXT PRIMARY KEY, '
+                     'password_hash TEXT NOT NULL, api_key TEXT NOT NULL)')
+        conn.close()
+        baseline = run("connect-per-call", plan, args.threads,
+                       lambda u: naive_insert(naive_path, u),
+                       lambda u: naive_fetch(naive_path, u))
+
+        # DB_PATH is read when src.config is imported
+        os.environ["DB_PATH"] = os.path.join(tmp, "pooled.db")
+        from src.auth import db
+        db.initialize_db()
+        pooled = run("pooled-wal", plan, args.threads,
+                     lambda u: db.insert_user(u, PASSWORD_HASH, "gsk_dummy"),
+                     db.fetch_user)
+        db.get_pool().close()
+
+    for result in (baseline, pooled):
+        print(f"{result['layer']:>18}: {result['ops_per_s']:8.0f} ops/s, "
+              f"{result['errors']} lock errors")
+
+
+if __name__ == "__main__":
+    main()
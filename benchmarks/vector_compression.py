@@ -0,0 +1,74 @@
+"""
+Index memory and search latency versus recall@10 for truncated and compressed
+vector storage.
+
+A synthetic float32 index is rewritten with ``compress_index`` for every setting
+and loaded the way ``KnowledgeBase`` does, with query embeddings configured from
+``index_meta.json``. Recall is measured against the full float32 index.
+
+    python -m benchmarks.vector_compression --chunks 20000 --dim 1024
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.fakes import FakeEmbeddings, build_synthetic_store, synthetic_questions
+from benchmarks.stats import summarize, write_results
+from src.bot.vectors import compress_index, query_embeddings, read_index_meta
+
+
+def settings(dim: int) -> list:
+    return [("float32", None), ("float16", None), ("sq8", None),
+            ("float32", dim // 2), ("float32", dim // 4), ("sq8", dim // 4)]
+
+
+def evaluate(faiss_database, embeddings, questions, k) -> tuple:
+    from langchain_community.vectorstores import FAISS
+
+    query = query_embeddings(read_index_meta(faiss_database), embeddings)
+    store = FAISS.load_local(faiss_database, query, allow_dangerous_deserialization=True)
+    vectors = [query.embed_query(question) for question in questions]
+    latencies, hits = [], []
+    for vector in vectors:
+        start = time.perf_counter()
+        docs = store.similarity_search_by_vector(vector, k)
+        latencies.append(time.perf_counter() - start)
+        hits.append({doc.metadata["chunk_index"] for doc in docs})
+    index_bytes = os.path.getsize(os.path.join(faiss_database, "index.faiss"))
+    return {"index_bytes": index_bytes, "latency": summarize(latencies)}, hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--output", help="write JSON results to this path")
+    args = parser.parse_args()
+
+    embeddings = FakeEmbeddings(dim=args.dim)
+    questions = synthetic_questions(args.queries)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = build_synthetic_store(tmp, args.chunks, embeddings, ref_graph=False)
+        baseline, exact = evaluate(paths["faiss_database"], embeddings, questions, args.k)
+        for storage, dimensions in settings(args.dim):
+            name = f"{storage}_{dimensions or args.dim}d"
+            output = os.path.join(tmp, name)
+            compress_index(paths["faiss_database"], output, dimensions, storage)
+            result, hits = evaluate(output, embeddings, questions, args.k)
+            result[f"recall_at_{args.k}"] = sum(len(a & b) / len(a)
+                                                for a, b in zip(exact, hits)) / len(exact)
+            result["memory_ratio"] = result["index_bytes"] / baseline["index_bytes"]
+            results[name] = result
+
+    report = write_results(args.output, "vector_compression", vars(args), results)
+    print(json.dumps(report["results"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
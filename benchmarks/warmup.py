@@ -0,0 +1,103 @@
+"""
+Post-deploy latency and cache hit rate with and without the start-up warm-up.
+
+A query log of ``--history`` questions is written from a Zipf-distributed pool led
+by the Gradio example questions, like the log of the previous deployment. Then the
+first ``--traffic`` questions after a restart are replayed twice on a fresh question
+cache: cold, and after ``warm_up`` replayed the examples and the ``--top`` most
+asked logged questions. Embeddings sleep ``--embed-latency`` per call, like the
+remote embeddings endpoint. Reports the warm-up time, the hit rate and latency of
+the post-deploy traffic, and the bytes per query log entry.
+
+    python -m benchmarks.warmup --history 5000 --traffic 200 --top 20
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.fakes import (FakeChatModel, FakeEmbeddings, build_synthetic_store,
+                              synthetic_questions)
+from benchmarks.load_generator import ZipfQuestionMix
+from benchmarks.stats import summarize, write_results
+from src.bot.bot import KnowledgeBase, Medibot
+from src.bot.loader import EXAMPLE_QUESTIONS
+from src.bot.warmup import QueryLog, QuestionCache, top_questions, warm_up
+
+PROMPT_CONFIG = "src/bot/configs/prompt.toml"
+
+
+def write_history(path: str, mix: ZipfQuestionMix, entries: int, seed: int):
+    rng = random.Random(seed)
+    log = QueryLog(path)
+    for _ in range(entries):
+        log.record(mix.draw(rng), None, 0.0, False, [])
+    log.close()
+
+
+def replay(bot, questions) -> dict:
+    cache = bot.knowledge_base.question_cache
+    latencies, hits = [], 0
+    for question in questions:
+        hits += question in cache
+        start = time.perf_counter()
+        bot.query(question)
+        latencies.append(time.perf_counter() - start)
+    return {"hit_rate": hits / len(questions), "latency": summarize(latencies)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pool", type=int, default=500, help="distinct questions")
+    parser.add_argument("--history", type=int, default=5000)
+    parser.add_argument("--traffic", type=int, default=200)
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--zipf", type=float, default=1.1)
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--llm-latency", type=float, default=0.0)
+    parser.add_argument("--generate", action="store_true",
+                        help="also generate answers during the warm-up")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write JSON results to this path")
+    args = parser.parse_args()
+
+    mix = ZipfQuestionMix(EXAMPLE_QUESTIONS + synthetic_questions(args.pool, seed=args.seed),
+                          args.zipf)
+    rng = random.Random(args.seed + 1)
+    traffic = [mix.draw(rng) for _ in range(args.traffic)]
+    embeddings = FakeEmbeddings(latency=args.embed_latency)
+    model = FakeChatModel(latency=args.llm_latency)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        history = os.path.join(tmp, "queries.jsonl")
+        write_history(history, mix, args.history, args.seed)
+        knowledge_base = KnowledgeBase(
+            embeddings=embeddings, **build_synthetic_store(tmp, args.chunks, embeddings))
+        query_log = QueryLog(os.path.join(tmp, "post_deploy.jsonl"))
+        bot = Medibot(PROMPT_CONFIG, knowledge_base=knowledge_base, model=model,
+                      coalesce="off", query_log=query_log)
+
+        knowledge_base.question_cache = QuestionCache(args.pool + len(EXAMPLE_QUESTIONS))
+        results["cold"] = replay(bot, traffic)
+
+        knowledge_base.question_cache = QuestionCache(args.pool + len(EXAMPLE_QUESTIONS))
+        questions = [(question, None) for question in EXAMPLE_QUESTIONS]
+        questions += [(question, specialty) for question, specialty, _
+                      in top_questions(history, args.top)]
+        results["warmup"] = warm_up(bot, questions, generate=args.generate)
+        results["warm"] = replay(bot, traffic)
+        query_log.close()
+        results["log_bytes_per_entry"] = \
+            os.path.getsize(query_log.path) / (2 * len(traffic))
+
+    results["hit_rate_gain"] = results["warm"]["hit_rate"] - results["cold"]["hit_rate"]
+    report = write_results(args.output, "warmup", vars(args), results)
+    print(json.dumps(report["results"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
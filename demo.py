@@ -1,50 +1,76 @@
+import asyncio
+
 import gradio as gr
-import os
 from dotenv import load_dotenv
-from src.interface import (
-    Interface, 
-    handle_login,
-)
+from src.interface import handle_login
+from src.sessions import UserSession
 from src import config
+from src.bot.loader import (ALL_SPECIALTIES, example_inputs, knowledge_base_loader,
+                            readiness_markdown, report_session_memory, selected_specialty,
+                            specialty_choices)
+from src.metrics import start_metrics_server
 
 # Load environment variables
 load_dotenv()
 
-bot = None  # Initially, no bot is created until the user logs in or registers
+# Start loading the index while the login page is served
+knowledge_base_loader.start()
+
+if config.METRICS_PORT:
+    start_metrics_server(config.METRICS_PORT)
+
+
+def create_bot(api_key):
+    # src.interface only imports the bot stack when an Interface is built
+    from src.interface import Interface
+    # a login during the index load waits a little, then asks the user to retry
+    knowledge_base = knowledge_base_loader.get(timeout=config.LOGIN_LOAD_WAIT)
+    return Interface(knowledge_base=knowledge_base, api_key=api_key)
+
+
+def refresh_readiness():
+    return (readiness_markdown(), gr.Timer(active=knowledge_base_loader.status == "loading"),
+            gr.update(choices=specialty_choices()))
 
 
 # Function to handle bot initialization after successful login
-def start_bot(userid, password, api_key_input):
-    # Run login first and get success
-    global bot
-    login_status, login_section, chat_section = handle_login(userid, password, api_key_input)
+async def start_bot(userid, password, api_key_input):
+    # Run login first and get success, the bcrypt hash is awaited off the event loop
+    login_status, login_section, chat_section, api_key = await handle_login(
+        userid, password, api_key_input)
     
-    # Initialize the bot after login is successful
-    if "successful" in login_status:  # Check for successful login
-        bot = Interface()  # Initialize after login success
-        return login_status, login_section, chat_section, bot  # Return all sections and bot
+    # Initialize the bot after login is successful, it lives in this session's state
+    if api_key is not None:  # Check for successful login
+        try:
+            bot = await asyncio.to_thread(create_bot, api_key)
+        except TimeoutError:
+            return ("⏳ The knowledge base is still loading, please log in again in a moment.", gr.update(visible=True), gr.update(visible=False),
+                    None)
+        session = UserSession(userid, bot)
+        report_session_memory()
+        return login_status, login_section, chat_section, session  # Return all sections and session
     else:
-        return login_status, login_section, chat_section, None  # Return failure and no bot
+        return login_status, login_section, chat_section, None  # Return failure and no session
 
         
 
-def answer(message, history):
-    answer_md, tables_display, images_display, retrieved_display = bot.get_answer(message)
-    
-    # Combine all parts into a single response string for chat
-    combined_response = f"{answer_md}\n\n{tables_display}"
-    
-    # Add images as markdown
-    if images_display:
-        combined_response += "\n\n" + "\n\n".join(images_display)
-    
-    return combined_response
+def answer(message, history, session, specialty=ALL_SPECIALTIES):
+    if session is None:
+        return "❌ Please log in first."
+    return session.answer(message, specialty=selected_specialty(specialty))
 
 
 # Build Gradio Interface
 with gr.Blocks(fill_height=True, fill_width = True) as app:
     # gr.Markdown("# 🧪 MediBot Login & Chat App")
 
+    user_session = gr.State(None)
+    readiness = gr.Markdown(readiness_markdown())
+    readiness_timer = gr.Timer(1.0)
+    # rendered by the chat interface, choices fill in once the index is loaded
+    specialty_filter = gr.Dropdown(choices=specialty_choices(), value=ALL_SPECIALTIES,
+                                   label="Specialty", render=False)
+
     # Login Section
     with gr.Column(visible=True) as login_section:
         gr.Markdown("## 🔐 Enter Your Groq Cloud API Key")
@@ -68,7 +94,9 @@ with gr.Blocks(fill_height=True, fill_width = True) as app:
         gr.ChatInterface(
                         answer,
                         title="🩺 MediBot Chat Interface",
-                        examples=["briefly explain me about cancer", "types of skin diseases?"],
+                        additional_inputs=[user_session, specialty_filter],
+                        # list of lists because of additional_inputs
+                        examples=example_inputs(),
                         flagging_options = ['Like', 'Dislike']
                     )
 
@@ -76,8 +104,13 @@ with gr.Blocks(fill_height=True, fill_width = True) as app:
     login_btn.click(
         fn=start_bot,
         inputs=[userid_input, password_input, api_key_input],
-        outputs=[login_output, login_section, chat_section]
+        outputs=[login_output, login_section, chat_section, user_session]
     )
 
+    readiness_timer.tick(refresh_readiness,
+                         outputs=[readiness, readiness_timer, specialty_filter])
+
 
+app.queue(default_concurrency_limit=config.QUEUE_CONCURRENCY,
+          max_size=config.QUEUE_MAX_SIZE)
 app.launch(share=True, show_error=True)
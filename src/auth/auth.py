@@ -1,74 +1,160 @@
-import os
+import asyncio
 import bcrypt
-from src.auth.db import get_db_connection
+from concurrent.futures import ThreadPoolExecutor
+from src.auth.db import fetch_user, insert_user
+from src.auth.session import create_session_token, verify_session_token
+from src.auth.validation import validate_groq_api_key
 from src import config
-from groq import Groq
+
+# bcrypt is deliberately slow, bound how many hashes can burn CPU at the same time.
+# The sync functions block their caller until the hash is done (fine on the service's
+# to_thread workers and in scripts), UI handlers use the async ones and await it.
+_bcrypt_pool = ThreadPoolExecutor(max_workers=config.BCRYPT_WORKERS,
+                                  thread_name_prefix="bcrypt")
+
+
+def hash_password(password: str) -> bytes:
+    salt = bcrypt.gensalt(rounds=config.BCRYPT_ROUNDS)
+    return _bcrypt_pool.submit(bcrypt.hashpw, password.encode(), salt).result()
+
+
+def check_password(password: str, stored_hash) -> bool:
+    if isinstance(stored_hash, str):
+        stored_hash = stored_hash.encode()
+    return _bcrypt_pool.submit(bcrypt.checkpw, password.encode(), stored_hash).result()
+
+
+async def ahash_password(password: str) -> bytes:
+    salt = bcrypt.gensalt(rounds=config.BCRYPT_ROUNDS)
+    return await asyncio.get_running_loop().run_in_executor(
+        _bcrypt_pool, bcrypt.hashpw, password.encode(), salt)
+
+
+async def acheck_password(password: str, stored_hash) -> bool:
+    if isinstance(stored_hash, str):
+        stored_hash = stored_hash.encode()
+    return await asyncio.get_running_loop().run_in_executor(
+        _bcrypt_pool, bcrypt.checkpw, password.encode(), stored_hash)
+
 
 def register_user(userid, password, api_key):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    password_hash = bcrypt.hashpw(password.encode(), bcrypt.gensalt())
-    try:
-        cursor.execute('INSERT INTO users (userid, password_hash, api_key) VALUES (?, ?, ?)',
-                       (userid, password_hash, api_key))
-        conn.commit()
-        return True, "✅ Registered successfully!"
-    except:
+    if fetch_user(userid) is not None:
         return False, "❌ User already exists."
-    finally:
-        conn.close()
+
+    password_hash = hash_password(password)
+    if insert_user(userid, password_hash, api_key):
+        return True, "✅ Registered successfully!"
+    return False, "❌ User already exists."
 
 def login_user(userid, password):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT password_hash, api_key FROM users WHERE userid=?', (userid,))
-    result = cursor.fetchone()
-    conn.close()
+    result = fetch_user(userid)
 
     if result:
         stored_hash, api_key = result
-        if bcrypt.checkpw(password.encode(), stored_hash):
+        if check_password(password, stored_hash):
             return True, api_key
     return False, None
 
 
+async def aregister_user(userid, password, api_key):
+    if await asyncio.to_thread(fetch_user, userid) is not None:
+        return False, "❌ User already exists."
+
+    password_hash = await ahash_password(password)
+    if await asyncio.to_thread(insert_user, userid, password_hash, api_key):
+        return True, "✅ Registered successfully!"
+    return False, "❌ User already exists."
+
+
+async def alogin_user(userid, password):
+    result = await asyncio.to_thread(fetch_user, userid)
+
+    if result:
+        stored_hash, api_key = result
+        if await acheck_password(password, stored_hash):
+            return True, api_key
+    return False, None
+
+
+def get_user_api_key(userid):
+    result = fetch_user(userid)
+    return result[1] if result else None
+
+
+def resume_session(session_token):
+    """Log a user back in from a session token without re-hashing the password.
+
+    Returns ``(userid, api_key, status)``, userid and api_key are None on failure.
+    """
+    userid = verify_session_token(session_token)
+    if userid is None:
+        return None, None, "❌ Session expired, please log in again."
+
+    saved_api_key = get_user_api_key(userid)
+    if saved_api_key is None:
+        return None, None, "❌ Session expired, please log in again."
+
+    return userid, saved_api_key, "✅ Login successful!"
+
+
+# The functions below return the user's API key to the caller instead of storing it
+# in the process environment, so concurrent sessions never see each other's key.
+
 def verify_login(userid, password):
     # Verify the user's login credentials
     success, saved_api_key = login_user(userid, password)
     if success:
-        config.api_key = saved_api_key
-        os.environ["GROQ_API_KEY"] = saved_api_key
-        return "✅ Login successful!" 
+        return "✅ Login successful!", saved_api_key
     else:
-        return "❌ Incorrect userid or password."
+        return "❌ Incorrect userid or password.", None
 
 def register_user_with_api_key(userid, password, user_api_key):
     # Validate the API Key first
-    try:
-        client = Groq(api_key=user_api_key)
-        response = client.chat.completions.create(
-            messages=[{"role": "user", "content": "Hello"}],
-            model="llama3-70b-8192"
-        )
-
-        # If API key is valid, proceed to register the user
-        success, msg = register_user(userid, password, user_api_key)
-        if success:
-            config.api_key = user_api_key
-            os.environ["GROQ_API_KEY"] = user_api_key
-            return "✅ API Key validated & registered!"
-        else:
-            return msg
-
-    except Exception as e:
-        # API key invalid
-        return f"❌ Invalid API Key: {str(e)}" 
+    is_valid, reason = validate_groq_api_key(user_api_key)
+    if not is_valid:
+        return f"❌ Invalid API Key: {reason}", None
+
+    # If API key is valid, proceed to register the user
+    success, msg = register_user(userid, password, user_api_key)
+    if success:
+        return "✅ API Key validated & registered!", user_api_key
+    else:
+        return msg, None
     
     
 def handle_login(userid, password, user_api_key):
+    """Register (when an API key is given) or log in.
+
+    Returns ``(status, api_key)``, api_key is None when it failed.
+    """
     if user_api_key:
         # Handle registration with API key validation
         return register_user_with_api_key(userid, password, user_api_key)
     else:
         # Handle standard login
         return verify_login(userid, password)
+
+
+async def ahandle_login(userid, password, user_api_key):
+    """``handle_login`` for handlers on the event loop: no thread waits for bcrypt."""
+    if user_api_key:
+        is_valid, reason = await asyncio.to_thread(validate_groq_api_key, user_api_key)
+        if not is_valid:
+            return f"❌ Invalid API Key: {reason}", None
+        success, msg = await aregister_user(userid, password, user_api_key)
+        if success:
+            return "✅ API Key validated & registered!", user_api_key
+        return msg, None
+
+    success, saved_api_key = await alogin_user(userid, password)
+    if success:
+        return "✅ Login successful!", saved_api_key
+    return "❌ Incorrect userid or password.", None
+
+
+def issue_session_token(userid, api_key):
+    # Only successful logins get a token the browser can reuse on reload
+    if api_key is not None:
+        return create_session_token(userid)
+    return None
+
@@ -1,19 +1,138 @@
 import sqlite3
-from src.config import DB_PATH
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from queue import Queue, Empty
+from src import config
+from src.metrics import inc
+
+
+class ConnectionPool:
+    """A fixed-size pool of sqlite connections shared between threads.
+
+    Every connection runs in WAL mode with a busy timeout so readers never block
+    the writer and concurrent writers wait instead of failing with
+    "database is locked".
+    """
+
+    def __init__(self, db_path: str, size: int = 8, busy_timeout: float = 5.0):
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self._connections = Queue(maxsize=size)
+        for _ in range(size):
+            self._connections.put(self._connect())
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout,
+                               check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout * 1000)}")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self._connections.get(timeout=self.busy_timeout)
+        except Empty:
+            raise sqlite3.OperationalError("timed out waiting for a database connection")
+        try:
+            yield conn
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._connections.put(conn)
+
+    def close(self):
+        while not self._connections.empty():
+            self._connections.get_nowait().close()
+
+
+class UserCache:
+    """Bounded LRU cache of ``userid -> (password_hash, api_key)`` rows."""
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._rows = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, userid):
+        with self._lock:
+            row = self._rows.get(userid)
+            if row is not None:
+                self._rows.move_to_end(userid)
+            return row
+
+    def put(self, userid, row):
+        with self._lock:
+            self._rows[userid] = row
+            self._rows.move_to_end(userid)
+            while len(self._rows) > self.max_size:
+                self._rows.popitem(last=False)
+
+    def invalidate(self, userid):
+        with self._lock:
+            self._rows.pop(userid, None)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+user_cache = UserCache(config.USER_CACHE_SIZE)
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(config.DB_PATH, size=config.DB_POOL_SIZE,
+                                       busy_timeout=config.DB_BUSY_TIMEOUT)
+    return _pool
+
 
 def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    return conn
+    """Borrow a pooled connection, use as ``with get_db_connection() as conn``."""
+    return get_pool().connection()
+
 
 def initialize_db():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            userid TEXT PRIMARY KEY,
-            password_hash TEXT NOT NULL,
-            api_key TEXT NOT NULL
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    with get_db_connection() as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                userid TEXT PRIMARY KEY,
+                password_hash TEXT NOT NULL,
+                api_key TEXT NOT NULL
+            )
+        ''')
+        conn.commit()
+
+
+def fetch_user(userid):
+    """Return ``(password_hash, api_key)`` for a user or None, served from cache."""
+    row = user_cache.get(userid)
+    if row is not None:
+        inc("medibot_cache_hits_total", cache="users")
+        return row
+    inc("medibot_cache_misses_total", cache="users")
+
+    with get_db_connection() as conn:
+        row = conn.execute('SELECT password_hash, api_key FROM users WHERE userid=?',
+                           (userid,)).fetchone()
+    if row is not None:
+        user_cache.put(userid, row)
+    return row
+
+
+def insert_user(userid, password_hash, api_key) -> bool:
+    """Insert a new user, returns False if the userid is already taken."""
+    try:
+        with get_db_connection() as conn:
+            conn.execute('INSERT INTO users (userid, password_hash, api_key) VALUES (?, ?, ?)',
+                         (userid, password_hash, api_key))
+            conn.commit()
+    except sqlite3.IntegrityError:
+        return False
+    finally:
+        user_cache.invalidate(userid)
+    return True
@@ -0,0 +1,71 @@
+"""
+Signed session tokens so a returning user does not pay for bcrypt again.
+
+A token is ``base64(userid|expiry).base64(hmac_sha256)``. Tokens are stateless: the
+server only needs the secret to verify them.
+"""
+import base64
+import hashlib
+import hmac
+import secrets
+import time
+from typing import Optional
+
+from src import config
+
+# fall back to a per-process secret, tokens then only survive until restart
+_secret = (config.SESSION_SECRET or secrets.token_hex(32)).encode()
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(payload: bytes) -> bytes:
+    return hmac.new(_secret, payload, hashlib.sha256).digest()
+
+
+def create_session_token(userid: str, ttl: Optional[int] = None) -> str:
+    """Issue a signed token for ``userid`` valid for ``ttl`` seconds.
+
+    Args:
+        userid (str): user the token is issued to.
+        ttl (Optional[int]): lifetime in seconds, defaults to ``config.SESSION_TTL``.
+
+    Returns:
+        str: the session token.
+    """
+    expiry = int(time.time()) + (ttl if ttl is not None else config.SESSION_TTL)
+    payload = f"{userid}|{expiry}".encode()
+    return f"{_b64encode(payload)}.{_b64encode(_sign(payload))}"
+
+
+def verify_session_token(token: str) -> Optional[str]:
+    """Check the signature and expiry of a token.
+
+    Args:
+        token (str): token previously returned by ``create_session_token``.
+
+    Returns:
+        Optional[str]: the userid if the token is valid, otherwise None.
+    """
+    if not token or "." not in token:
+        return None
+    try:
+        payload_part, signature_part = token.split(".", 1)
+        payload = _b64decode(payload_part)
+        signature = _b64decode(signature_part)
+    except (ValueError, TypeError):
+        return None
+
+    if not hmac.compare_digest(signature, _sign(payload)):
+        return None
+
+    userid, _, expiry = payload.decode().rpartition("|")
+    if not userid or not expiry.isdigit() or int(expiry) < time.time():
+        return None
+    return userid
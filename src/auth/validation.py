@@ -0,0 +1,133 @@
+"""
+Groq API key validation.
+
+A key is checked by listing the available models, which is authenticated but costs
+no tokens. Results are cached per key hash for a TTL, in an LRU of at most
+``max_size`` keys, and concurrent checks of the same key share a single upstream
+request.
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Optional, Tuple
+
+from src import config
+from src.metrics import inc
+
+logger = logging.getLogger(__name__)
+
+
+def hash_api_key(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+
+class ApiKeyValidator:
+    def __init__(self, base_url: Optional[str] = None,
+                 valid_ttl: float = 3600.0,
+                 invalid_ttl: float = 300.0,
+                 timeout: float = 10.0,
+                 client_pool=None,
+                 max_size: int = 4096):
+        self.base_url = base_url
+        self._client_pool = client_pool
+        self.valid_ttl = valid_ttl
+        self.invalid_ttl = invalid_ttl
+        self.timeout = timeout
+        self.max_size = max_size
+        self._cache = OrderedDict()  # key hash -> (expires_at, is_valid, reason)
+        self._in_flight = {}  # key hash -> Future
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        if self._client_pool is None:
+            from src.bot.clients import GroqClientPool, client_pool
+            # share the bots' pool unless pointed at a different endpoint
+            self._client_pool = client_pool if self.base_url == config.GROQ_BASE_URL \
+                else GroqClientPool(base_url=self.base_url)
+        return self._client_pool
+
+    def _check_upstream(self, api_key: str) -> Tuple[bool, str, bool]:
+        """Return ``(is_valid, reason, cacheable)`` for a single upstream check."""
+        # the groq SDK pulls in httpx and pydantic, only load it when a key is checked
+        import groq
+
+        # a valid key keeps its pooled connection for the chat requests that follow
+        client = self._pool().client(api_key).with_options(timeout=self.timeout,
+                                                           max_retries=0)
+        try:
+            client.models.list()
+            return True, "ok", True
+        except (groq.AuthenticationError, groq.PermissionDeniedError) as e:
+            self._client_pool.discard(api_key)
+            return False, str(e), True
+        except Exception as e:
+            # network errors and 5xx say nothing about the key, don't remember them
+            logger.warning(f"Groq API key validation failed: {e}")
+            return False, str(e), False
+
+    def validate(self, api_key: str) -> Tuple[bool, str]:
+        """Check a Groq API key.
+
+        Args:
+            api_key (str): key entered by the user.
+
+        Returns:
+            Tuple[bool, str]: whether the key is valid and a short reason.
+        """
+        if not api_key:
+            return False, "no API key given"
+
+        key_hash = hash_api_key(api_key)
+        with self._lock:
+            cached = self._cache.get(key_hash)
+            if cached is not None and cached[0] > time.monotonic():
+                self._cache.move_to_end(key_hash)
+                inc("medibot_cache_hits_total", cache="api_key_validation")
+                return cached[1], cached[2]
+            if cached is not None:
+                del self._cache[key_hash]
+            inc("medibot_cache_misses_total", cache="api_key_validation")
+
+            future = self._in_flight.get(key_hash)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._in_flight[key_hash] = future
+
+        if not owner:
+            return future.result()
+
+        try:
+            is_valid, reason, cacheable = self._check_upstream(api_key)
+            if cacheable:
+                ttl = self.valid_ttl if is_valid else self.invalid_ttl
+                with self._lock:
+                    self._cache[key_hash] = (time.monotonic() + ttl, is_valid, reason)
+                    self._cache.move_to_end(key_hash)
+                    while len(self._cache) > self.max_size:
+                        self._cache.popitem(last=False)
+            future.set_result((is_valid, reason))
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key_hash, None)
+        return is_valid, reason
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+validator = ApiKeyValidator(base_url=config.GROQ_BASE_URL,
+                            valid_ttl=config.KEY_VALIDATION_TTL,
+                            invalid_ttl=config.KEY_VALIDATION_NEGATIVE_TTL,
+                            max_size=config.KEY_VALIDATION_CACHE_SIZE)
+
+
+def validate_groq_api_key(api_key: str) -> Tuple[bool, str]:
+    return validator.validate(api_key)
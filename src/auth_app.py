@@ -2,7 +2,7 @@ import gradio as gr
 import os
 import subprocess
 import webbrowser
-from groq import Groq
+from src.auth.validation import validate_groq_api_key
 
 
 # Function to validate and save the API key
@@ -11,23 +11,16 @@ def validate_api_key(user_api_key):
     if not user_api_key:
         return "❌ Please enter your Groq Cloud API key."
 
-    try:
-        # Initialize Groq client
-        client = Groq(api_key=user_api_key)
+    # Listing models is authenticated but costs no tokens
+    is_valid, reason = validate_groq_api_key(user_api_key)
+    if not is_valid:
+        return f"❌ Invalid API key: {reason}"
 
-        # Make a test request
-        response = client.chat.completions.create(
-            messages=[{"role": "user", "content": "Hello"}],
-            model="llama-3.1-8b-instant"
-        )
+    # Save API key to env variable if successful
+    api_key = user_api_key
+    os.environ["GROQ_API_KEY"] = api_key
 
-        # Save API key to env variable if successful
-        api_key = user_api_key
-        os.environ["GROQ_API_KEY"] = api_key
-
-        return "✅ API key is valid and saved!"
-    except Exception as e:
-        return f"❌ Invalid API key: {str(e)}"
+    return "✅ API key is valid and saved!"
 
 # Gradio Interface
 with gr.Blocks() as demo:
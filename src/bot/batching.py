@@ -0,0 +1,91 @@
+"""
+Micro-batching of query embeddings.
+
+Concurrent ``embed_query`` calls are collected for up to ``max_wait`` seconds or
+``max_batch_size`` texts and sent to the wrapped model as one ``embed_documents``
+call, which both the OpenAI endpoint and local models serve far more efficiently
+than one text at a time. Results are fanned back out to the waiting callers, sync
+or async.
+"""
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+from src.metrics import SIZE_BUCKETS, observe
+
+logger = logging.getLogger(__name__)
+
+
+class BatchingEmbeddings(Embeddings):
+    """Wrap an ``Embeddings`` model so single-query calls are batched together.
+
+    Args:
+        embeddings (Embeddings): the model doing the work.
+        max_batch_size (int): most texts sent in one call.
+        max_wait (float): longest a query waits for others to join its batch, seconds.
+        max_concurrent_batches (int): batches that may be in flight at once.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_batch_size: int = 32,
+                 max_wait: float = 0.005, max_concurrent_batches: int = 4):
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._pending = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_batches,
+                                            thread_name_prefix="embed-batch")
+        self._collector = threading.Thread(target=self._collect, name="embed-batcher",
+                                           daemon=True)
+        self._collector.start()
+
+    def _collect(self):
+        while True:
+            batch = [self._pending.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._executor.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch):
+        # identical questions in one batch are embedded once
+        unique_texts = list(dict.fromkeys(text for text, _ in batch))
+        observe("medibot_embedding_batch_size", len(unique_texts), SIZE_BUCKETS)
+        try:
+            vectors = dict(zip(unique_texts, self.embeddings.embed_documents(unique_texts)))
+        except Exception as e:
+            logger.warning(f"Embedding batch of {len(unique_texts)} failed: {e}")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for text, future in batch:
+            future.set_result(vectors[text])
+
+    def submit(self, text: str) -> Future:
+        future = Future()
+        self._pending.put((text, future))
+        return future
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.submit(text).result()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await asyncio.wrap_future(self.submit(text))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # already a batch, send it straight through
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
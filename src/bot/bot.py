@@ -1,36 +1,265 @@
+import asyncio
+import groq
+import operator
 import os
+import random
+import threading
+import time
 import toml
-from typing import Optional
-from groq import Groq
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextlib import nullcontext
+from functools import reduce
+from typing import AsyncIterator, List, Optional, Tuple
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings
-from langchain_core.runnables import RunnableParallel, RunnablePassthrough, RunnableLambda
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
 import logging
-from langchain_groq import ChatGroq
+import numpy as np
+from src import config as settings
+from src.bot.batching import BatchingEmbeddings
+from src.bot.bundle import Bundle, BundleError
+from src.bot.clients import (RETRYABLE_ERRORS, GroqClientPool,
+                             client_pool as default_client_pool)
+from src.bot.context import ContextBuilder
+from src.bot.deadline import (Deadline, DeadlineExceeded, call_within, check, current_deadline,
+                              deadline as request_deadline, submit as submit_call)
+from src.bot.depth import DepthSelector
 from src.bot.extract_metadata import Metadata
+from src.bot.ref_graph import ReferenceGraph
+from src.bot.shards import ShardedVectorStore, SpecialtyFilter, chunk_specialty
+from src.bot.singleflight import SingleFlight, normalize_question, query_flights
+from src.bot.summary_tree import SummaryTree
+from src.bot.throttle import (KeyThrottle, RateLimited, ThrottleRegistry, retry_after,
+                              throttles as default_throttles)
+from src.bot.vectors import query_embeddings, read_index_meta
+from src.bot.warmup import QueryLog, QuestionCache, query_log as default_query_log
+from src.metrics import SIZE_BUCKETS, inc, observe, span, trace
+from src.profiling import profiler
 
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
+DEFAULT_PROMPT_CONFIG = "src/bot/configs/prompt.toml"
+# appended to an answer the model could not finish within the request deadline
+PARTIAL_ANSWER_NOTE = "\n\n_⏱ The answer was cut short because the model took too long._"
+
+
+class QueryResult:
+    """Answer, sources and stage timings (seconds) of one question of a batch."""
+
+    def __init__(self, question: str, docs: List[Document], tables: dict, images: dict):
+        self.question = question
+        self.answer: Optional[str] = None
+        self.error: Optional[str] = None
+        self.docs = docs
+        self.tables = tables
+        self.images = images
+        self.timings = {}
+
+    def to_dict(self) -> dict:
+        return {"question": self.question, "answer": self.answer, "error": self.error,
+                "sources": [doc.metadata.get("source") for doc in self.docs],
+                "tables": list(self.tables), "images": list(self.images),
+                "timings": self.timings}
+
+
+class KnowledgeBase:
+    """Vector store and reference metadata, shared by every Medibot in the process."""
+
+    def __init__(self, metadata_database: str = "database/metadata.csv",
+                 faiss_database: str = "database/faiss_index",
+                 embeddings: Optional[Embeddings] = None,
+                 shards_database: Optional[str] = None,
+                 bundle: Optional[str] = None,
+                 ):
+        """``shards_database`` (default ``SHARDS_DATABASE``) loads the routed shards
+        built from ``faiss_database`` instead of the single index. ``bundle`` (default
+        ``INDEX_BUNDLE``) loads index, metadata and prompt from one bundle file."""
+        self._specialties = None
+        self.prompt_config = None
+        self.question_cache = QuestionCache(settings.QUESTION_CACHE_SIZE)
+        self.summary_tree: Optional[SummaryTree] = None
+        self.summary_tree_beam = settings.SUMMARY_TREE_BEAM
+        self.warmup: Optional[dict] = None
+        bundle = bundle or settings.INDEX_BUNDLE
+        if bundle and (shards_database or settings.SHARDS_DATABASE):
+            raise BundleError("a bundle holds a single index, it cannot be combined "
+                              "with SHARDS_DATABASE")
+        if bundle:
+            self._load_bundle(bundle, embeddings)
+        else:
+            self._load_files(metadata_database, faiss_database,
+                             shards_database or settings.SHARDS_DATABASE, embeddings)
+        self._attach_ref_graph()
+        if self.summary_tree is not None:
+            self._check_summary_tree()
+
+    def _check_summary_tree(self):
+        # the tree addresses chunk positions of one flat index, shards renumber them
+        if isinstance(self.vector_store, ShardedVectorStore):
+            logger.warning("Summary tree search is not supported on a sharded index, "
+                           "searching the shards instead")
+            self.summary_tree = None
+            return
+        index = self.vector_store.index
+        if self.summary_tree.index_size != index.ntotal \
+                or self.summary_tree.vectors.shape[1] != index.d:
+            logger.warning("Summary tree was built for another index, rebuild it with "
+                           "`python -m src.bot.summary_tree`")
+            self.summary_tree = None
+
+    def _configure_embeddings(self, embeddings: Optional[Embeddings]):
+        # the index records the model, dimensions and storage it was built with
+        self.embeddings = query_embeddings(self.index_meta, embeddings)
+        if settings.EMBED_BATCH_SIZE > 1:
+            # concurrent questions share one embeddings request
+            self.embeddings = BatchingEmbeddings(self.embeddings,
+                                                 max_batch_size=settings.EMBED_BATCH_SIZE,
+                                                 max_wait=settings.EMBED_BATCH_WAIT_MS / 1000)
+
+    def _load_files(self, metadata_database: str, faiss_database: str,
+                    shards_database: str, embeddings: Optional[Embeddings]):
+        self.index_meta = read_index_meta(shards_database or faiss_database)
+        self._configure_embeddings(embeddings)
+        if shards_database:
+            self.vector_store = ShardedVectorStore(shards_database, self.embeddings,
+                                                   top_shards=settings.ROUTER_TOP_SHARDS)
+        else:
+            self.vector_store = FAISS.load_local(
+                            faiss_database, self.embeddings, allow_dangerous_deserialization=True
+                        )
+        self.ref_graph = ReferenceGraph.load_for_index(faiss_database)
+        self.metadata_extactor = Metadata(metadata_database)
+        if not shards_database and settings.SUMMARY_TREE_SEARCH:
+            self.summary_tree = SummaryTree.load_for_index(faiss_database)
+
+    def _load_bundle(self, path: str, embeddings: Optional[Embeddings]):
+        bundle = Bundle(path, verify=settings.BUNDLE_VERIFY)
+        self.index_meta = bundle.index_meta
+        self._configure_embeddings(embeddings)
+        # the default embeddings follow index_meta, injected ones must match it
+        bundle.check_embedding_model(getattr(embeddings, "model", None))
+        docstore, index_to_docstore_id = bundle.docstore()
+        self.vector_store = FAISS(embedding_function=self.embeddings,
+                                  index=bundle.faiss_index(), docstore=docstore,
+                                  index_to_docstore_id=index_to_docstore_id)
+        self.ref_graph = bundle.ref_graph()
+        if settings.SUMMARY_TREE_SEARCH:
+            self.summary_tree = bundle.summary_tree()
+        self.metadata_extactor = Metadata(bundle.metadata())
+        self.prompt_config = bundle.prompt_config()
+        self.bundle = bundle
+
+    def _attach_ref_graph(self):
+        if self.ref_graph is None:
+            return
+        if self.ref_graph.metadata_rows != len(self.metadata_extactor.df):
+            logger.warning("Reference graph was built for another metadata.csv, "
+                           "rebuild it with `python -m src.bot.ref_graph`")
+            self.ref_graph = None
+            return
+        # older indexes return documents without their docstore id
+        for docstore_id, doc in self.vector_store.docstore._dict.items():
+            if getattr(doc, "id", None) is None:
+                doc.id = docstore_id
+        self.metadata_extactor.ref_graph = self.ref_graph
+
+    @property
+    def specialties(self) -> List[str]:
+        """Specialties of the indexed chunks, for the UI filter."""
+        if self._specialties is None:
+            if isinstance(self.vector_store, ShardedVectorStore):
+                specialties = self.vector_store.specialties
+            else:
+                specialties = (chunk_specialty(doc.metadata)
+                               for doc in self.vector_store.docstore._dict.values())
+            self._specialties = sorted(set(specialties))
+        return self._specialties
+
+    def specialty_kwargs(self, specialty: Optional[str]) -> dict:
+        """Extra search arguments restricting results to ``specialty``."""
+        if specialty is None:
+            return {}
+        if isinstance(self.vector_store, ShardedVectorStore):
+            return {"specialty": specialty}
+        return {"filter": SpecialtyFilter(specialty)}
+
+    def tree_search(self, embedding, k: int, fetch_k: int, lambda_mult: float = 0.5,
+                    specialty: Optional[str] = None) -> List[Tuple[Document, float]]:
+        """MMR over the ``fetch_k`` chunks reached by descending the summary tree."""
+        store = self.vector_store
+        positions, distances, vectors = self.summary_tree.search(
+            embedding, store.index, k=fetch_k, beam=self.summary_tree_beam,
+            specialty=specialty)
+        if not len(positions):
+            return []
+        picked = maximal_marginal_relevance(np.asarray(embedding, dtype=np.float32),
+                                            vectors, k=k, lambda_mult=lambda_mult)
+        return [(store.docstore.search(store.index_to_docstore_id[int(positions[i])]),
+                 float(distances[i])) for i in picked]
+
+
 class Medibot:
-    def __init__(self, config_path: str = "src/bot/configs/prompt.toml",
+    def __init__(self, config_path: Optional[str] = None,
                  metadata_database: str = "database/metadata.csv",
-                 faiss_database: str = "database/faiss_index" 
+                 faiss_database: str = "database/faiss_index",
+                 embeddings: Optional[Embeddings] = None,
+                 model: Optional[BaseChatModel] = None,
+                 knowledge_base: Optional[KnowledgeBase] = None,
+                 api_key: Optional[str] = None,
+                 client_pool: Optional[GroqClientPool] = None,
+                 context_builder: Optional[ContextBuilder] = None,
+                 coalesce: Optional[str] = None,
+                 single_flight: Optional[SingleFlight] = None,
+                 fallback_model: Optional[str] = None,
+                 throttles: Optional[ThrottleRegistry] = None,
+                 query_log: Optional[QueryLog] = None,
+                 depth_selector: Optional[DepthSelector] = None,
                  ):
-        """Initialize Medibot with configuration and Groq client."""
+        """Initialize Medibot with configuration and Groq client.
+
+        ``api_key`` is the Groq key of the session this bot serves, scripts can leave
+        it out and rely on ``GROQ_API_KEY``. ``embeddings`` and ``model`` replace the
+        OpenAI embeddings and the Groq chat model, e.g. with deterministic stand-ins
+        for benchmarks. An already loaded ``knowledge_base`` skips loading the index
+        again. ``client_pool`` defaults to the process-wide Groq client pool and
+        ``context_builder`` to one using the configured token budget. ``coalesce``
+        (default ``COALESCE_QUERIES``, "key") shares identical questions in flight
+        between bots of the same API key ("key"), all bots ("global") or not ("off").
+        Groq calls are paced per key by ``throttles`` (default the process-wide
+        registry) and go to ``fallback_model`` (default ``GROQ_FALLBACK_MODEL``) while
+        the primary model is throttled. Answered questions are appended to
+        ``query_log`` (default the ``QUERY_LOG`` one). ``depth_selector`` (default
+        from ``RETRIEVAL_DEPTH``) decides how many retrieved chunks to keep.
+        """
         # Load environment variables
-        api_key = os.environ.get("GROQ_API_KEY")
-        if not api_key:
+        api_key = api_key or os.environ.get("GROQ_API_KEY")
+        if model is None and not api_key:
             logger.error("GROQ_API_KEY not found in environment variables")
             raise ValueError("GROQ_API_KEY is required")
 
-        # Load prompt configuration
+        # initialize vector database
+        if knowledge_base is None:
+            knowledge_base = KnowledgeBase(metadata_database, faiss_database, embeddings)
+        self.knowledge_base = knowledge_base
+        self.embeddings = knowledge_base.embeddings
+        self.vector_store = knowledge_base.vector_store
+        self.metadata_extactor = knowledge_base.metadata_extactor
+
+        # Load prompt configuration, a bundle brings its own unless a path is given
         try:
-            config = toml.load(config_path)
+            if config_path is None and knowledge_base.prompt_config:
+                config = knowledge_base.prompt_config
+            else:
+                config_path = config_path or DEFAULT_PROMPT_CONFIG
+                config = toml.load(config_path)
             system_prompt = config["rag_prompt"]["system_prompt"]
             user_prompt_template = config["rag_prompt"]["user_prompt_template"]
             
@@ -44,40 +273,472 @@ class Medibot:
             ("user", user_prompt_template)
         ])
 
-        # initialize vector database
-        embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
-        vector_store = FAISS.load_local(
-                        faiss_database, embeddings, allow_dangerous_deserialization=True
-                    )
-        self.retriever = vector_store.as_retriever(search_type="mmr", search_kwargs={"k": 10})
+        self.search_kwargs = {"k": 10}
+        self.depth_selector = depth_selector or DepthSelector(
+            settings.RETRIEVAL_DEPTH, settings.RETRIEVAL_MIN_K, settings.RETRIEVAL_MAX_K,
+            settings.RETRIEVAL_RELATIVE_MARGIN)
+        self.retriever = self.vector_store.as_retriever(search_type="mmr",
+                                                        search_kwargs=self.search_kwargs) \
+            if isinstance(self.vector_store, FAISS) else None
         # Initialize Groq client
-        
-        self.model = ChatGroq(
-                            model="llama-3.1-8b-instant",
-                            temperature=0.2,
-                            max_tokens=None,
-                            timeout=None,
-                            max_retries=2,
-                            )
-        
-        self.metadata_extactor = Metadata(metadata_database)
+        # The chat model handle is taken from the per-key client pool on every call,
+        # so its keep-alive connections are shared with the user's other sessions.
+        # Timeouts and retries are configured on the pooled Groq client.
+        self.api_key = api_key
+        self.client_pool = client_pool or default_client_pool
+        self.model = model
+        self.model_kwargs = {
+                            "model": "llama-3.1-8b-instant",
+                            "temperature": 0.2,
+                            "max_tokens": None,
+                            }
+        self.output_parser = StrOutputParser()
+        self.context_builder = context_builder or ContextBuilder(
+            token_budget=settings.CONTEXT_TOKEN_BUDGET or None,
+            dedupe_threshold=settings.CONTEXT_DEDUPE_THRESHOLD)
+        self.coalesce = coalesce or settings.COALESCE_QUERIES
+        self.fallback_model = settings.GROQ_FALLBACK_MODEL if fallback_model is None \
+            else fallback_model
+        self.throttles = throttles or default_throttles
+        self.query_log = query_log or default_query_log
+        self.single_flight = single_flight or query_flights
+        self._prompt_key = (system_prompt, user_prompt_template)
+
+    def embed_question(self, question: str) -> List[float]:
+        cache = self.knowledge_base.question_cache
+        embedding = cache.get(question)
+        if embedding is None:
+            with span("embed"):
+                embedding = call_within(lambda: self.embeddings.embed_query(question),
+                                        "embed")
+            cache.put(question, embedding)
+        return embedding
+
+    async def aembed_question(self, question: str) -> List[float]:
+        cache = self.knowledge_base.question_cache
+        embedding = cache.get(question)
+        if embedding is None:
+            with span("embed"):
+                embedding = await self.embeddings.aembed_query(question)
+            cache.put(question, embedding)
+        return embedding
+
+    def search(self, embedding: List[float],
+               specialty: Optional[str] = None) -> List[Document]:
+        # same MMR search the retriever runs, on an already embedded question
+        check("search")
+        with span("search"):
+            if self.knowledge_base.summary_tree is not None:
+                search_kwargs = self._adaptive_search_kwargs() \
+                    if self.depth_selector.adaptive else self.search_kwargs
+                hits = self.knowledge_base.tree_search(
+                    embedding, search_kwargs["k"], search_kwargs.get("fetch_k", 20),
+                    search_kwargs.get("lambda_mult", 0.5), specialty)
+                retrieved_docs = self.depth_selector.select(hits) \
+                    if self.depth_selector.adaptive else [doc for doc, _ in hits]
+            elif self.depth_selector.adaptive:
+                hits = self.vector_store.max_marginal_relevance_search_with_score_by_vector(
+                    embedding, **self._adaptive_search_kwargs(),
+                    **self.knowledge_base.specialty_kwargs(specialty))
+                retrieved_docs = self.depth_selector.select(hits)
+            else:
+                retrieved_docs = self.vector_store.max_marginal_relevance_search_by_vector(
+                    embedding, **self.search_kwargs,
+                    **self.knowledge_base.specialty_kwargs(specialty))
+        observe("medibot_retrieved_docs", len(retrieved_docs), SIZE_BUCKETS)
+        return retrieved_docs
+
+    def _adaptive_search_kwargs(self) -> dict:
+        # every candidate the selector may keep, from a pool large enough for MMR
+        max_k = self.depth_selector.max_k
+        return {**self.search_kwargs, "k": max_k,
+                "fetch_k": max(self.search_kwargs.get("fetch_k", 20), 2 * max_k)}
+
+    def retrieve(self, question: str, specialty: Optional[str] = None) -> List[Document]:
+        return self.search(self.embed_question(question), specialty)
+
+    def chat_model(self, model: Optional[str] = None) -> BaseChatModel:
+        """The chat model, ``model`` names another Groq model than the configured one."""
+        if self.model is not None:
+            return self.model
+        kwargs = dict(self.model_kwargs)
+        if model is not None:
+            kwargs["model"] = model
+        return self.client_pool.chat_model(self.api_key, **kwargs)
+
+    def _lease(self):
+        """Keeps the pooled Groq clients open for the duration of a call."""
+        if self.model is not None:
+            return nullcontext()
+        return self.client_pool.lease(self.api_key)
+
+    def _admit(self, deadline: Optional[Deadline]) -> Optional[KeyThrottle]:
+        """Throttle of the Groq model to call next, None for an injected model.
+
+        Falls back to ``fallback_model`` while the primary model's breaker is open or
+        its bucket is empty, else waits for the primary's bucket.
+
+        Raises:
+            RateLimited: no model can take the call within the wait budget.
+        """
+        if self.model is not None:
+            return None
+        primary = self.throttles.get(self.api_key, self.model_kwargs["model"])
+        reason = primary.try_admit()
+        if reason is None:
+            return primary
+        inc("medibot_llm_throttled_total", reason=reason, model=primary.model)
+        if self.fallback_model and self.fallback_model != primary.model:
+            fallback = self.throttles.get(self.api_key, self.fallback_model)
+            if fallback.try_admit() is None:
+                inc("medibot_llm_fallbacks_total", reason=reason, model=fallback.model)
+                return fallback
+        if reason == "throttled":
+            budget = settings.GROQ_RATE_LIMIT_MAX_WAIT
+            if deadline is not None:
+                budget = min(budget, deadline.remaining())
+            if primary.wait_admit(budget):
+                return primary
+        raise RateLimited(f"Groq is rate limiting this API key ({primary.model} {reason}), "
+                          "please try again shortly")
+
+    def _chain(self, deadline: Optional[Deadline] = None, model: Optional[str] = None):
+        chat_model = self.chat_model(model)
+        if deadline is not None and self.model is None:
+            # per-request timeout of the Groq call, passed through to the SDK
+            chat_model = chat_model.bind(timeout=max(0.1, deadline.remaining()))
+        return self.prompt_template | chat_model
+
+    def _retry_delay(self, attempt: int, error: Exception,
+                     deadline: Optional[Deadline]) -> Optional[float]:
+        """Seconds to wait before attempt ``attempt + 1``, None when out of budget."""
+        if not isinstance(error, RETRYABLE_ERRORS) or attempt >= settings.LLM_MAX_ATTEMPTS:
+            return None
+        delay = settings.LLM_RETRY_BASE_DELAY * 2 ** (attempt - 1) * random.uniform(0.5, 1.0)
+        if isinstance(error, groq.RateLimitError):
+            # the next attempt can go to the fallback model right away
+            delay = 0.0 if self.fallback_model and self.model is None \
+                else max(delay, retry_after(error) or 0.0)
+        # another attempt is only worth it with time left to complete it
+        if deadline is not None and deadline.remaining() < 2 * delay + 1.0:
+            return None
+        return delay
+
+    def _complete_within(self, inputs: dict, deadline: Deadline,
+                         model: Optional[str] = None) -> BaseMessage:
+        """Stream the completion, return what arrived when the deadline passes."""
+        chunks, errors = [], []
+        cancelled = threading.Event()
+
+        def run():
+            # leased by the worker, which may outlive the deadline
+            try:
+                with self._lease():
+                    for chunk in self._chain(deadline, model).stream(inputs):
+                        if cancelled.is_set():
+                            break
+                        chunks.append(chunk)
+            except Exception as e:
+                errors.append(e)
+
+        finished = submit_call(run)
+        try:
+            finished.result(timeout=deadline.remaining())
+        except FutureTimeout:
+            cancelled.set()
+            # still queued behind busy workers: never start a stream nobody waits for
+            finished.cancel()
+            inc("medibot_deadline_exceeded_total", stage="generate")
+            text = "".join(str(chunk.content) for chunk in list(chunks))
+            return AIMessage(content=text + PARTIAL_ANSWER_NOTE,
+                             response_metadata={"partial": True})
+        if errors:
+            raise errors[0]
+        return reduce(operator.add, chunks) if chunks else AIMessage(content="")
+
+    def complete(self, inputs: dict) -> BaseMessage:
+        """Run the RAG chain within the key's rate limit, retrying transient errors
+        within the request deadline."""
+        current = current_deadline()
+        attempt = 1
+        while True:
+            throttle = self._admit(current)
+            model = throttle.model if throttle is not None else None
+            try:
+                if current is None:
+                    with self._lease():
+                        message = self._chain(model=model).invoke(inputs)
+                else:
+                    message = self._complete_within(inputs, current, model)
+            except Exception as e:
+                if throttle is not None:
+                    throttle.failed(e)
+                delay = self._retry_delay(attempt, e, current)
+                if delay is None:
+                    raise
+                inc("medibot_llm_retries_total", error=type(e).__name__)
+                logger.warning(f"LLM attempt {attempt} failed ({e}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+                attempt += 1
+                continue
+            if throttle is not None:
+                if message.response_metadata.get("partial"):
+                    throttle.failed(None)
+                else:
+                    throttle.succeeded()
+            return message
+
+    def generate(self, question: str, retrieved_docs: List[Document]) -> str:
+        with span("assemble_context"):
+            context = self.context_builder.build(retrieved_docs)
+        with span("generate"):
+            message = self.complete({"context": context, "question": question})
+        usage = getattr(message, "usage_metadata", None)
+        if usage:
+            observe("medibot_prompt_tokens", usage.get("input_tokens", 0), SIZE_BUCKETS)
+            observe("medibot_completion_tokens", usage.get("output_tokens", 0), SIZE_BUCKETS)
+        return self.output_parser.invoke(message)
+
+    def resolve_references(self, retrieved_docs: List[Document]) -> Tuple[dict, dict]:
+        check("resolve_references")
+        with span("resolve_references"):
+            return self.metadata_extactor.get_data_from_ref(retrieved_docs)
+
+    def embed_questions(self, questions: List[str]) -> np.ndarray:
+        with span("embed"):
+            return np.asarray(self.embeddings.embed_documents(questions), dtype=np.float32)
+
+    def search_batch(self, embeddings: np.ndarray,
+                     specialty: Optional[str] = None) -> List[List[Document]]:
+        """``search`` for many embedded questions, one FAISS call for the whole matrix."""
+        store = self.vector_store
+        if specialty is not None or not isinstance(store, FAISS) \
+                or self.knowledge_base.summary_tree is not None:
+            return [self.search(embedding, specialty) for embedding in embeddings]
+        search_kwargs = self._adaptive_search_kwargs() if self.depth_selector.adaptive \
+            else self.search_kwargs
+        k = search_kwargs.get("k", 4)
+        fetch_k = search_kwargs.get("fetch_k", 20)
+        lambda_mult = search_kwargs.get("lambda_mult", 0.5)
+        with span("search"):
+            if store._normalize_L2:
+                embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+            distances, indices = store.index.search(np.ascontiguousarray(embeddings), fetch_k)
+            results = []
+            # same MMR re-ranking FAISS.max_marginal_relevance_search_by_vector does
+            for embedding, row, row_distances in zip(embeddings, indices, distances):
+                found = row >= 0
+                row, row_distances = row[found], row_distances[found]
+                picked = maximal_marginal_relevance(
+                    embedding, store.index.reconstruct_batch(row), k=k,
+                    lambda_mult=lambda_mult)
+                hits = [(store.docstore.search(store.index_to_docstore_id[int(row[i])]),
+                         float(row_distances[i])) for i in picked]
+                results.append(self.depth_selector.select(hits)
+                               if self.depth_selector.adaptive
+                               else [doc for doc, _ in hits])
+        for docs in results:
+            observe("medibot_retrieved_docs", len(docs), SIZE_BUCKETS)
+        return results
+
+    def resolve_references_batch(self, docs_per_question: List[List[Document]]) -> list:
+        """``resolve_references`` for many questions, each distinct chunk resolved once."""
+        resolved = {}
+        with span("resolve_references"):
+            for docs in docs_per_question:
+                for doc in docs:
+                    key = getattr(doc, "id", None) or id(doc)
+                    if key not in resolved:
+                        resolved[key] = self.metadata_extactor.get_data_from_ref([doc])
+        results = []
+        for docs in docs_per_question:
+            tables, images = {}, {}
+            for doc in docs:
+                doc_tables, doc_images = resolved[getattr(doc, "id", None) or id(doc)]
+                tables.update(doc_tables)
+                images.update(doc_images)
+            results.append((tables, images))
+        return results
+
+    def query_batch(self, questions: List[str], concurrency: int = 4,
+                    specialty: Optional[str] = None) -> List["QueryResult"]:
+        """Answer many questions: bulk embedding, one matrix search, bulk reference
+        resolution and at most ``concurrency`` LLM calls at a time.
+
+        Returns:
+            List[QueryResult]: one per question, in order. A failed LLM call sets
+            ``error`` on its result instead of failing the batch.
+        """
+        start = time.perf_counter()
+        with trace() as batch_timings:
+            embeddings = self.embed_questions(questions)
+            docs_per_question = self.search_batch(embeddings, specialty)
+            references = self.resolve_references_batch(docs_per_question)
+        # the bulk stages are shared, each question is charged an equal part
+        shared = {stage: seconds / max(1, len(questions))
+                  for stage, seconds in batch_timings.items()}
+
+        def answer(i: int) -> QueryResult:
+            tables, images = references[i]
+            result = QueryResult(questions[i], docs_per_question[i], tables, images)
+            with trace() as timings:
+                try:
+                    result.answer = self.generate(questions[i], docs_per_question[i])
+                    inc("medibot_queries_total")
+                except Exception as e:
+                    logger.error(f"Batch question {i} failed: {e}")
+                    result.error = str(e)
+            result.timings = {**shared, **timings,
+                              "end_to_end": time.perf_counter() - start}
+            return result
+
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            return list(pool.map(answer, range(len(questions))))
+
+    async def aretrieve(self, question: str,
+                        specialty: Optional[str] = None) -> List[Document]:
+        current = current_deadline()
+        try:
+            embedding = await asyncio.wait_for(
+                self.aembed_question(question),
+                None if current is None else current.remaining())
+        except asyncio.TimeoutError:
+            inc("medibot_deadline_exceeded_total", stage="embed")
+            raise DeadlineExceeded("embed") from None
+        # FAISS releases the GIL, a worker thread keeps the event loop free
+        return await asyncio.to_thread(self.search, embedding, specialty)
+
+    async def astream_generate(self, question: str,
+                               retrieved_docs: List[Document]) -> AsyncIterator[str]:
+        """Yield the answer as the model streams it."""
+        with span("assemble_context"):
+            context = self.context_builder.build(retrieved_docs)
+        current = current_deadline()
+        throttle = await asyncio.to_thread(self._admit, current)
+        usage, cut_short = None, False
+        try:
+            # inside the try, a failure building the chain must release the throttle
+            with self._lease():
+                stream = self._chain(current, throttle.model if throttle else None).astream(
+                    {"context": context, "question": question})
+                with span("generate"):
+                    async for chunk in self._stream_within(stream, current):
+                        if chunk is None:
+                            cut_short = True
+                            yield PARTIAL_ANSWER_NOTE
+                            break
+                        usage = getattr(chunk, "usage_metadata", None) or usage
+                        if chunk.content:
+                            yield chunk.content
+        except (GeneratorExit, asyncio.CancelledError):
+            # the client went away, the call neither succeeded nor failed
+            if throttle is not None:
+                throttle.abandoned()
+            raise
+        except Exception as e:
+            if throttle is not None:
+                throttle.failed(e)
+            raise
+        if throttle is not None and cut_short:
+            throttle.failed(None)
+        elif throttle is not None:
+            throttle.succeeded()
+        if usage:
+            observe("medibot_prompt_tokens", usage.get("input_tokens", 0), SIZE_BUCKETS)
+            observe("medibot_completion_tokens", usage.get("output_tokens", 0), SIZE_BUCKETS)
+
+    @staticmethod
+    async def _stream_within(stream, current: Optional[Deadline]):
+        """Chunks of ``stream``, then None if the deadline cut it short."""
+        while True:
+            try:
+                chunk = await asyncio.wait_for(
+                    stream.__anext__(), None if current is None else current.remaining())
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                # what was streamed stays with the user, the rest is given up
+                inc("medibot_deadline_exceeded_total", stage="generate")
+                await stream.aclose()
+                yield None
+                return
+            yield chunk
+
+    def _flight_key(self, question: str, specialty: Optional[str]) -> Optional[tuple]:
+        """Questions with the same key get the same answer, None when not coalescing."""
+        if self.coalesce == "off":
+            return None
+        return (id(self.knowledge_base), self._prompt_key,
+                id(self.model) if self.model is not None else None,
+                tuple(sorted(self.model_kwargs.items())),
+                tuple(sorted(self.search_kwargs.items())), self.depth_selector.key,
+                (self.context_builder.token_budget, self.context_builder.dedupe_threshold),
+                self.api_key if self.coalesce == "key" else None,
+                specialty, normalize_question(question))
+
+    def _answer(self, question: str, specialty: Optional[str]) -> tuple:
+        retrieved_docs = self.retrieve(question, specialty)
+        # resolved first, so an answer cut short by the deadline still has them
+        refered_tables , refered_images = self.resolve_references(retrieved_docs)
+        answer = self.generate(question, retrieved_docs)
+        return answer, retrieved_docs, refered_tables , refered_images
+
+    def query(self, question: str, specialty: Optional[str] = None,
+              profile: bool = False, deadline: Optional[float] = None) -> str:
+        """Answer a question within ``deadline`` seconds (default ``REQUEST_DEADLINE``).
+
+        An answer the model could not finish in time is returned as far as it got,
+        ending with ``PARTIAL_ANSWER_NOTE``, together with the resolved references.
+        """
+        key = self._flight_key(question, specialty)
+        start, hit = time.perf_counter(), question in self.knowledge_base.question_cache
+        with request_deadline(settings.REQUEST_DEADLINE if deadline is None else deadline), \
+                profiler.profile("query", question, force=profile), span("query"):
+            if key is None:
+                result = self._answer(question, specialty)
+            else:
+                result, shared = self.single_flight.do(
+                    key, lambda: self._answer(question, specialty))
+                if shared:
+                    # callers of one flight must not share mutable results
+                    answer, docs, tables, images = result
+                    result = answer, list(docs), dict(tables), dict(images)
+        inc("medibot_queries_total")
+        self.query_log.record(question, specialty, time.perf_counter() - start, hit,
+                              result[1])
+        return result
+
+    async def _astream_answer(self, question: str,
+                              specialty: Optional[str]) -> AsyncIterator[tuple]:
+        retrieved_docs = await self.aretrieve(question, specialty)
+        yield "sources", retrieved_docs
+        references = await asyncio.to_thread(self.resolve_references, retrieved_docs)
+        async for token in self.astream_generate(question, retrieved_docs):
+            yield "token", token
+        yield "done", references
 
-    
-    def query(self, question: str) -> str:
-        retrieved_docs = self.retriever.invoke(question)
-
-        # RunnableParallel({"context": retriever, "question": RunnablePassthrough()})
-        rag_chain = (
-            RunnableParallel({
-            "context": RunnableLambda(lambda _: retrieved_docs),  # Reuse retrieved docs
-            "question": RunnablePassthrough()
-        })
-            | self.prompt_template
-            | self.model
-            | StrOutputParser()
-        )
-
-        answer = rag_chain.invoke({"question": question})
-
-        refered_tables , refered_images = self.metadata_extactor.get_data_from_ref(retrieved_docs)
-        return answer, retrieved_docs, refered_tables , refered_images
\ No newline at end of file
+    async def astream_query(self, question: str, specialty: Optional[str] = None,
+                            deadline: Optional[float] = None) -> AsyncIterator[tuple]:
+        """Answer as ``(event, data)`` pairs: ``("sources", docs)``, one
+        ``("token", text)`` per streamed piece and ``("done", (tables, images))``.
+        Identical questions streamed at the same time share one stream. Past the
+        deadline the stream ends with ``PARTIAL_ANSWER_NOTE`` and the references."""
+        key = self._flight_key(question, specialty)
+        start, hit = time.perf_counter(), question in self.knowledge_base.question_cache
+        docs = []
+        with request_deadline(settings.REQUEST_DEADLINE if deadline is None else deadline):
+            events = self._astream_answer(question, specialty) if key is None else \
+                self.single_flight.stream(key,
+                                          lambda: self._astream_answer(question, specialty))
+            async for event in events:
+                if key is not None:
+                    # callers of one flight must not share mutable results
+                    if event[0] == "sources":
+                        event = "sources", list(event[1])
+                    elif event[0] == "done":
+                        event = "done", (dict(event[1][0]), dict(event[1][1]))
+                if event[0] == "sources":
+                    docs = event[1]
+                yield event
+        inc("medibot_queries_total")
+        self.query_log.record(question, specialty, time.perf_counter() - start, hit, docs)
\ No newline at end of file
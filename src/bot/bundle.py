@@ -0,0 +1,221 @@
+"""
+Single-file, versioned bundle of everything a deployment loads.
+
+Layout::
+
+    b"MEDIBNDL" | version (u16) | header length (u32) | header (JSON) | sections
+
+The JSON header records the embedding model identity (``index_meta.json``), build
+stats, and for every section its offset, length and SHA-256. Sections start on
+page boundaries so each one can be memory-mapped on its own:
+
+    faiss      serialized FAISS index
+    docstore   pickled (docstore, index_to_docstore_id), as in index.pkl
+    metadata   pickled table/picture DataFrame (metadata.csv)
+    ref_graph  ref_graph.npz, when the index has one
+    summary_tree  summary_tree.npz, when the index has one
+    prompt     prompt TOML
+
+A bundle holds one flat index: routed shard sets cannot be bundled, and a bundle
+cannot be combined with ``SHARDS_DATABASE``.
+
+    python -m src.bot.bundle build database/faiss_index database/metadata.csv \
+        src/bot/configs/prompt.toml -o database/medibot.bundle
+"""
+import argparse
+import hashlib
+import io
+import json
+import logging
+import mmap
+import os
+import pickle
+import struct
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"MEDIBNDL"
+BUNDLE_VERSION = 1
+_PREAMBLE = struct.Struct("<8sHI")
+_ALIGN = mmap.ALLOCATIONGRANULARITY
+
+
+class BundleError(ValueError):
+    """The bundle is corrupt, of an unknown version or built for another model."""
+
+
+def build_bundle(faiss_database: str, metadata_database: str, prompt_config: str,
+                 output: str) -> dict:
+    """Pack an ingested index, its reference metadata and the prompt into one file.
+
+    Returns:
+        dict: the bundle header.
+    """
+    import faiss
+    import pandas as pd
+
+    from src.bot.ref_graph import GRAPH_FILE
+    from src.bot.shards import ROUTER_FILE
+    from src.bot.vectors import SUMMARY_TREE_FILE, read_index_meta
+
+    if os.path.exists(os.path.join(faiss_database, ROUTER_FILE)):
+        raise BundleError(f"{faiss_database} is a shard set, bundle the single index it "
+                          f"was built from instead")
+    start = time.perf_counter()
+    index = faiss.read_index(os.path.join(faiss_database, "index.faiss"))
+    metadata = pd.read_csv(metadata_database)
+    with open(os.path.join(faiss_database, "index.pkl"), "rb") as f:
+        docstore = f.read()
+    with open(prompt_config, "rb") as f:
+        prompt = f.read()
+    sections = {
+        "faiss": faiss.serialize_index(index).tobytes(),
+        "docstore": docstore,
+        "metadata": pickle.dumps(metadata, protocol=pickle.HIGHEST_PROTOCOL),
+        "prompt": prompt,
+    }
+    for name, file_name in (("ref_graph", GRAPH_FILE), ("summary_tree", SUMMARY_TREE_FILE)):
+        path = os.path.join(faiss_database, file_name)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                sections[name] = f.read()
+
+    header = {
+        "version": BUNDLE_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "index_meta": {**read_index_meta(faiss_database), "dimensions": index.d},
+        "stats": {"chunks": int(index.ntotal), "dimensions": int(index.d),
+                  "metadata_rows": len(metadata),
+                  "sources": int(metadata["source"].nunique()) if len(metadata) else 0},
+        "sections": {},
+    }
+    # offsets depend on the header size, so lay the sections out against a
+    # generous placeholder and pad the real header to it
+    header_budget = 4096
+    while True:
+        offset = _align(_PREAMBLE.size + header_budget)
+        for name, data in sections.items():
+            header["sections"][name] = {"offset": offset, "length": len(data),
+                                        "sha256": hashlib.sha256(data).hexdigest()}
+            offset = _align(offset + len(data))
+        encoded = json.dumps(header).encode()
+        if len(encoded) <= header_budget:
+            break
+        header_budget *= 2
+
+    with open(output, "wb") as f:
+        f.write(_PREAMBLE.pack(MAGIC, BUNDLE_VERSION, header_budget))
+        f.write(encoded.ljust(header_budget))
+        for name, data in sections.items():
+            f.seek(header["sections"][name]["offset"])
+            f.write(data)
+    header["stats"]["build_seconds"] = time.perf_counter() - start
+    logger.info(f"Wrote {output}: {header['stats']}")
+    return header
+
+
+def _align(offset: int) -> int:
+    return -(-offset // _ALIGN) * _ALIGN
+
+
+class Bundle:
+    """Read-only view of a bundle file, every section is a slice of one mmap.
+
+    Args:
+        path (str): bundle file.
+        verify (bool): check every section against its SHA-256 on open.
+    """
+
+    def __init__(self, path: str, verify: bool = True):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, header_length = _PREAMBLE.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise BundleError(f"{path} is not a Medibot bundle")
+        if version != BUNDLE_VERSION:
+            raise BundleError(f"{path} is bundle version {version}, "
+                              f"this build reads version {BUNDLE_VERSION}")
+        self.header = json.loads(bytes(self._mmap[_PREAMBLE.size:
+                                                  _PREAMBLE.size + header_length]))
+        self.sections: Dict[str, dict] = self.header["sections"]
+        if verify:
+            for name in self.sections:
+                self.verify(name)
+
+    @property
+    def index_meta(self) -> dict:
+        return self.header["index_meta"]
+
+    def section(self, name: str) -> Optional[memoryview]:
+        entry = self.sections.get(name)
+        if entry is None:
+            return None
+        return memoryview(self._mmap)[entry["offset"]:entry["offset"] + entry["length"]]
+
+    def verify(self, name: str):
+        if hashlib.sha256(self.section(name)).hexdigest() != self.sections[name]["sha256"]:
+            raise BundleError(f"checksum mismatch in section {name!r} of {self.path}")
+
+    def check_embedding_model(self, model: Optional[str]):
+        """Refuse a bundle whose vectors, per its recorded ``index_meta``, come from
+        another embedding model than ``model``, the one queries are embedded with."""
+        built_with = self.index_meta.get("embedding_model")
+        if model is not None and built_with != model:
+            raise BundleError(f"{self.path} was built with {built_with!r}, "
+                              f"queries would be embedded with {model!r}")
+
+    def faiss_index(self):
+        import faiss
+        import numpy as np
+        return faiss.deserialize_index(np.frombuffer(self.section("faiss"), dtype=np.uint8))
+
+    def docstore(self) -> tuple:
+        return pickle.loads(self.section("docstore"))
+
+    def metadata(self):
+        return pickle.loads(self.section("metadata"))
+
+    def ref_graph(self):
+        from src.bot.ref_graph import ReferenceGraph
+        data = self.section("ref_graph")
+        return None if data is None else ReferenceGraph.load(io.BytesIO(data))
+
+    def summary_tree(self):
+        from src.bot.summary_tree import SummaryTree
+        data = self.section("summary_tree")
+        return None if data is None else SummaryTree.load(io.BytesIO(data))
+
+    def prompt_config(self) -> Optional[dict]:
+        import toml
+        data = self.section("prompt")
+        return None if data is None else toml.loads(bytes(data).decode())
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Build or check a Medibot index bundle")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build")
+    build.add_argument("faiss_database", nargs="?", default="database/faiss_index")
+    build.add_argument("metadata_database", nargs="?", default="database/metadata.csv")
+    build.add_argument("prompt_config", nargs="?", default="src/bot/configs/prompt.toml")
+    build.add_argument("-o", "--output", default="database/medibot.bundle")
+    build.add_argument("--profile", action="store_true",
+                       help="write a cProfile capture to PROFILE_DIR")
+    verify = commands.add_parser("verify")
+    verify.add_argument("bundle")
+    args = parser.parse_args()
+    if args.command == "build":
+        from src.profiling import profile
+        with profile("bundle", args.faiss_database, force=args.profile):
+            build_bundle(args.faiss_database, args.metadata_database, args.prompt_config,
+                         args.output)
+    else:
+        print(json.dumps(Bundle(args.bundle).header, indent=2))
@@ -0,0 +1,191 @@
+"""
+Pool of Groq clients keyed by API key hash.
+
+Every key gets one sync (and, on demand, one async) Groq client backed by a
+keep-alive httpx client with bounded connection limits, so TCP/TLS connections are
+reused across requests and sessions of the same user. Clients that have not been
+used for ``idle_ttl`` seconds are closed. Calls hold a ``lease`` on the clients they
+send through: leased clients are never evicted, and discarded ones are closed when
+the last lease is released.
+"""
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+import groq
+import httpx
+from langchain_groq import ChatGroq
+
+from src import config
+
+logger = logging.getLogger(__name__)
+
+# worth another attempt while the request deadline allows (timeouts are connection errors)
+RETRYABLE_ERRORS = (groq.APIConnectionError, groq.RateLimitError, groq.InternalServerError)
+
+
+class _PooledClients:
+    def __init__(self, sync_client: groq.Groq, http_client: httpx.Client):
+        self.sync_client = sync_client
+        self.http_client = http_client
+        self.async_client: Optional[groq.AsyncGroq] = None
+        self.async_http_client: Optional[httpx.AsyncClient] = None
+        self.chat_models = {}
+        self.last_used = time.monotonic()
+        # calls in flight, and whether the pool has dropped the entry
+        self.leases = 0
+        self.retired = False
+
+    def close(self):
+        self.http_client.close()
+        if self.async_http_client is not None:
+            try:
+                asyncio.get_running_loop().create_task(self.async_http_client.aclose())
+            except RuntimeError:
+                pass  # no running loop, the transport is released with the client
+
+
+class GroqClientPool:
+    def __init__(self, base_url: Optional[str] = None,
+                 max_connections: int = 20,
+                 max_keepalive_connections: int = 10,
+                 keepalive_expiry: float = 30.0,
+                 idle_ttl: float = 600.0,
+                 max_keys: int = 1024,
+                 timeout: float = 60.0):
+        self.base_url = base_url
+        self.limits = httpx.Limits(max_connections=max_connections,
+                                   max_keepalive_connections=max_keepalive_connections,
+                                   keepalive_expiry=keepalive_expiry)
+        self.idle_ttl = idle_ttl
+        self.max_keys = max_keys
+        self.timeout = timeout
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._last_eviction = time.monotonic()
+
+    @staticmethod
+    def _key_hash(api_key: str) -> str:
+        return hashlib.sha256(api_key.encode()).hexdigest()
+
+    def _entry(self, api_key: str, lease: bool = False) -> _PooledClients:
+        key_hash = self._key_hash(api_key)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key_hash)
+            if entry is None:
+                http_client = httpx.Client(limits=self.limits, timeout=self.timeout)
+                sync_client = groq.Groq(api_key=api_key, base_url=self.base_url,
+                                        http_client=http_client)
+                entry = self._entries[key_hash] = _PooledClients(sync_client, http_client)
+            entry.last_used = now
+            if lease:
+                entry.leases += 1
+            if now - self._last_eviction > min(self.idle_ttl, 60.0) or \
+                    len(self._entries) > self.max_keys:
+                self._evict_locked(now)
+        return entry
+
+    def _evict_locked(self, now: float):
+        self._last_eviction = now
+        # leased clients are in use, they stay until their calls are done
+        idle = [key for key, entry in self._entries.items()
+                if not entry.leases and now - entry.last_used > self.idle_ttl]
+        # over capacity: drop the least recently used keys as well
+        overflow = len(self._entries) - len(idle) - self.max_keys
+        if overflow > 0:
+            by_age = sorted((entry.last_used, key) for key, entry in self._entries.items()
+                            if not entry.leases and key not in idle)
+            idle.extend(key for _, key in by_age[:overflow])
+        for key in idle:
+            self._entries.pop(key).close()
+        if idle:
+            logger.info(f"Closed {len(idle)} idle Groq client(s)")
+
+    @contextmanager
+    def lease(self, api_key: str) -> Iterator[_PooledClients]:
+        """Keep the clients of ``api_key`` open while the block sends through them."""
+        entry = self._entry(api_key, lease=True)
+        try:
+            yield entry
+        finally:
+            with self._lock:
+                entry.leases -= 1
+                close = entry.retired and not entry.leases
+            if close:
+                entry.close()
+
+    def _retire(self, entry: _PooledClients):
+        """Close a dropped entry now, or when its last lease is released."""
+        with self._lock:
+            entry.retired = True
+            close = not entry.leases
+        if close:
+            entry.close()
+
+    def client(self, api_key: str) -> groq.Groq:
+        return self._entry(api_key).sync_client
+
+    def _async_client_locked(self, entry: _PooledClients, api_key: str) -> groq.AsyncGroq:
+        if entry.async_client is None:
+            entry.async_http_client = httpx.AsyncClient(limits=self.limits,
+                                                        timeout=self.timeout)
+            entry.async_client = groq.AsyncGroq(api_key=api_key, base_url=self.base_url,
+                                                http_client=entry.async_http_client)
+        return entry.async_client
+
+    def async_client(self, api_key: str) -> groq.AsyncGroq:
+        entry = self._entry(api_key)
+        with self._lock:
+            return self._async_client_locked(entry, api_key)
+
+    def chat_model(self, api_key: str, model: str = "llama-3.1-8b-instant",
+                   max_retries: int = 0, **model_kwargs) -> ChatGroq:
+        """A ChatGroq handle for ``api_key`` that sends through the pooled clients.
+
+        SDK retries are off by default, Medibot retries within the request deadline.
+        """
+        entry = self._entry(api_key)
+        cache_key = (model, max_retries, tuple(sorted(model_kwargs.items())))
+        with self._lock:
+            chat_model = entry.chat_models.get(cache_key)
+            if chat_model is not None:
+                return chat_model
+            async_client = self._async_client_locked(entry, api_key)
+        # with_options shares the pooled http clients
+        chat_model = ChatGroq(
+            api_key=api_key,
+            model=model,
+            client=entry.sync_client.with_options(max_retries=max_retries).chat.completions,
+            async_client=async_client.with_options(max_retries=max_retries).chat.completions,
+            **model_kwargs,
+        )
+        with self._lock:
+            # another thread may have built the same handle meanwhile
+            return entry.chat_models.setdefault(cache_key, chat_model)
+
+    def discard(self, api_key: str):
+        with self._lock:
+            entry = self._entries.pop(self._key_hash(api_key), None)
+        if entry is not None:
+            self._retire(entry)
+
+    def close(self):
+        with self._lock:
+            entries, self._entries = list(self._entries.values()), {}
+        for entry in entries:
+            self._retire(entry)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+client_pool = GroqClientPool(base_url=config.GROQ_BASE_URL,
+                             max_connections=config.GROQ_MAX_CONNECTIONS,
+                             max_keepalive_connections=config.GROQ_MAX_KEEPALIVE,
+                             keepalive_expiry=config.GROQ_KEEPALIVE_EXPIRY,
+                             idle_ttl=config.GROQ_CLIENT_IDLE_TTL)
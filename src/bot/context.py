@@ -0,0 +1,89 @@
+"""
+Assembly of the retrieved chunks into the RAG prompt context.
+
+Chunks built by ``create_chunks`` and the single text items from ``extract_all_text``
+overlap, so MMR often returns the same passage twice. ``ContextBuilder`` drops chunks
+whose words are (nearly) contained in a chunk already kept, then fills the context in
+retrieval order until the token budget is used up. Token counts come from the
+``token_count`` chunk metadata written at ingest, so no tokenizer runs per query.
+"""
+import logging
+import re
+from typing import List, Optional
+
+from langchain_core.documents import Document
+
+from src.metrics import SIZE_BUCKETS, inc, observe
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"\w+")
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token, for indexes built before token counts were stored
+    return max(1, len(text) // 4)
+
+
+def chunk_tokens(doc: Document) -> int:
+    token_count = doc.metadata.get("token_count")
+    if token_count is None:
+        return estimate_tokens(doc.page_content)
+    return int(token_count)
+
+
+class ContextBuilder:
+    """Deduplicate retrieved chunks and trim them to a token budget.
+
+    Args:
+        token_budget (int, optional): most context tokens sent to the model,
+            None keeps every chunk.
+        dedupe_threshold (float, optional): share of a chunk's words found in an
+            already kept chunk above which it is dropped, None turns dedup off.
+    """
+
+    def __init__(self, token_budget: Optional[int] = None,
+                 dedupe_threshold: Optional[float] = None):
+        self.token_budget = token_budget
+        self.dedupe_threshold = dedupe_threshold
+
+    def _is_duplicate(self, words: set, kept_words: List[set]) -> bool:
+        # nothing to compare a chunk without words on, e.g. a table of figures
+        if not words:
+            return False
+        for other in kept_words:
+            overlap = len(words & other) / len(words)
+            if overlap >= self.dedupe_threshold:
+                return True
+        return False
+
+    def select(self, docs: List[Document]) -> List[Document]:
+        """Chunks to put in the prompt, in retrieval order."""
+        selected, kept_words = [], []
+        used_tokens = 0
+        for doc in docs:
+            if self.dedupe_threshold is not None:
+                words = set(_WORD.findall(doc.page_content.lower()))
+                if self._is_duplicate(words, kept_words):
+                    inc("medibot_context_dropped_total", reason="duplicate")
+                    continue
+            tokens = chunk_tokens(doc)
+            # the best ranked chunk always goes in, even on its own over budget
+            if self.token_budget is not None and selected and \
+                    used_tokens + tokens > self.token_budget:
+                inc("medibot_context_dropped_total", reason="budget")
+                continue
+            selected.append(doc)
+            used_tokens += tokens
+            if self.dedupe_threshold is not None:
+                kept_words.append(words)
+        observe("medibot_context_tokens", used_tokens, SIZE_BUCKETS)
+        return selected
+
+    @staticmethod
+    def format(docs: List[Document]) -> str:
+        return "\n\n".join(f"[Source: {doc.metadata.get('source', 'unknown')}]\n"
+                           f"{doc.page_content}" for doc in docs)
+
+    def build(self, docs: List[Document]) -> str:
+        return self.format(self.select(docs))
@@ -0,0 +1,96 @@
+"""
+End-to-end request deadlines.
+
+``deadline(seconds)`` sets the deadline of everything run inside it, nested
+deadlines can only make it tighter. Stages check it before they start and wait for
+remote calls at most the remaining time, so a stalled upstream costs a request its
+deadline and not a worker forever.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from typing import Callable, Optional
+
+from src.metrics import inc
+from src.profiling import run_profiled
+
+_current_deadline: ContextVar[Optional["Deadline"]] = ContextVar("medibot_deadline",
+                                                                 default=None)
+# remote calls waited on with a timeout, a stalled call keeps its thread until the
+# client's own timeout gives up
+_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="deadline-call")
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request deadline passed before ``stage`` could finish."""
+
+    def __init__(self, stage: str):
+        super().__init__(f"deadline exceeded during {stage}")
+        self.stage = stage
+
+
+class Deadline:
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def check(self, stage: str):
+        if self.expired:
+            inc("medibot_deadline_exceeded_total", stage=stage)
+            raise DeadlineExceeded(stage)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+@contextmanager
+def deadline(seconds: Optional[float]):
+    """Run the block under a deadline ``seconds`` from now, None or 0 adds none."""
+    outer = _current_deadline.get()
+    if not seconds or (outer is not None and outer.remaining() <= seconds):
+        yield outer
+        return
+    token = _current_deadline.set(Deadline(seconds))
+    try:
+        yield _current_deadline.get()
+    finally:
+        _current_deadline.reset(token)
+
+
+def check(stage: str):
+    """Raise ``DeadlineExceeded`` if the current deadline has passed."""
+    current = _current_deadline.get()
+    if current is not None:
+        current.check(stage)
+
+
+def call_within(fn: Callable, stage: str):
+    """Call ``fn``, giving up with ``DeadlineExceeded`` when the deadline passes."""
+    current = _current_deadline.get()
+    if current is None:
+        return fn()
+    current.check(stage)
+    # the worker keeps the caller's trace, deadline and profile capture
+    future = _executor.submit(copy_context().run, run_profiled, fn)
+    try:
+        return future.result(timeout=current.remaining())
+    except FutureTimeout:
+        if future.done():  # raised by fn itself
+            raise
+        future.cancel()
+        inc("medibot_deadline_exceeded_total", stage=stage)
+        raise DeadlineExceeded(stage) from None
+
+
+def submit(fn: Callable):
+    """Run ``fn`` on the deadline worker threads, in the caller's context."""
+    return _executor.submit(copy_context().run, run_profiled, fn)
@@ -0,0 +1,96 @@
+"""
+Adaptive retrieval depth from the distances of the retrieved chunks.
+
+Medibot retrieves a fixed ``k`` chunks per question, so narrow questions pay for
+chunks that have nothing to do with them. ``DepthSelector`` retrieves ``max_k``
+candidates with their FAISS distances (lower is closer) and keeps between ``min_k``
+and ``max_k`` of them:
+
+* ``elbow``: cut at the largest jump between consecutive sorted distances, if it
+  stands out (``ELBOW_RATIO`` times the median jump); without a clear elbow all
+  ``max_k`` candidates are kept.
+* ``relative``: keep candidates whose distance is within ``margin`` of the best
+  one, ``distance <= best * (1 + margin)``.
+
+``fixed`` keeps the old behaviour.
+"""
+from typing import List, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from src.metrics import inc
+
+METHODS = ("fixed", "elbow", "relative")
+# how far the largest jump must stand out of the median jump to count as an elbow
+ELBOW_RATIO = 2.0
+
+
+def elbow_k(distances: Sequence[float], min_k: int, max_k: int) -> int:
+    """Chunks before the largest distance jump, ``max_k`` without a clear one."""
+    distances = np.sort(np.asarray(distances, dtype=np.float64))[:max_k]
+    if len(distances) <= min_k:
+        return len(distances)
+    gaps = np.diff(distances)
+    # a cut after position i keeps i + 1 chunks
+    candidates = gaps[min_k - 1:]
+    best = int(np.argmax(candidates))
+    if candidates[best] <= ELBOW_RATIO * max(float(np.median(gaps)), 1e-12):
+        return len(distances)
+    return min_k + best
+
+
+def relative_k(distances: Sequence[float], min_k: int, max_k: int,
+               margin: float) -> int:
+    """Chunks within ``margin`` of the closest one, between ``min_k`` and ``max_k``."""
+    distances = np.sort(np.asarray(distances, dtype=np.float64))[:max_k]
+    if not len(distances):
+        return 0
+    kept = int(np.searchsorted(distances, distances[0] * (1 + margin), side="right"))
+    return max(min(min_k, len(distances)), kept)
+
+
+class DepthSelector:
+    """Chooses how many retrieved chunks to keep per question.
+
+    Args:
+        method (str): "fixed", "elbow" or "relative".
+        min_k (int): fewest chunks kept.
+        max_k (int): candidates retrieved and most chunks kept.
+        margin (float): relative distance margin of the "relative" method.
+    """
+
+    def __init__(self, method: str = "fixed", min_k: int = 3, max_k: int = 10,
+                 margin: float = 0.25):
+        if method not in METHODS:
+            raise ValueError(f"unknown retrieval depth {method!r}, use one of {METHODS}")
+        self.method = method
+        self.min_k = max(1, min(min_k, max_k))
+        self.max_k = max_k
+        self.margin = margin
+
+    @property
+    def adaptive(self) -> bool:
+        return self.method != "fixed"
+
+    def choose_k(self, distances: Sequence[float]) -> int:
+        if self.method == "elbow":
+            return elbow_k(distances, self.min_k, self.max_k)
+        if self.method == "relative":
+            return relative_k(distances, self.min_k, self.max_k, self.margin)
+        return min(len(distances), self.max_k)
+
+    def select(self, hits: List[Tuple[Document, float]]) -> List[Document]:
+        """Keep the chosen number of the closest hits, in retrieval (MMR) order."""
+        k = self.choose_k([distance for _, distance in hits])
+        inc("medibot_retrieval_dropped_total", len(hits) - k, method=self.method)
+        if k >= len(hits):
+            return [doc for doc, _ in hits]
+        cutoff = sorted(distance for _, distance in hits)[k - 1]
+        kept = [doc for doc, distance in hits if distance <= cutoff]
+        return kept[:k]
+
+    @property
+    def key(self) -> tuple:
+        """What makes two selectors choose differently, for coalescing keys."""
+        return self.method, self.min_k, self.max_k, self.margin
@@ -1,11 +1,17 @@
 from langchain_core.documents import Document
-from typing import Tuple, List
+from typing import Tuple, List, Union
 import pandas as pd
 import re
 
 class Metadata:
-    def __init__(self, ref_database_path: str):
-        self.df = pd.read_csv(ref_database_path)
+    def __init__(self, ref_database_path: Union[str, pd.DataFrame], ref_graph=None):
+        # a bundle hands over the already loaded frame
+        self.df = ref_database_path if isinstance(ref_database_path, pd.DataFrame) \
+            else pd.read_csv(ref_database_path)
+        # precompiled ReferenceGraph, resolves references by row number
+        self.ref_graph = ref_graph
+        self._chunk_types = self.df["chunk_type"].to_numpy()
+        self._page_contents = self.df["page_content"].to_numpy()
 
     def extract_ref_from_metadata(self, meta_data: dict) -> List[str]:
         """Extract references from metadata of images and tables."""
@@ -49,6 +55,18 @@ class Metadata:
         return all_metadata
 
 
+    def get_data_from_graph(self, chunk_ids: List[int], tables: dict, images: dict):
+        """Add the tables and pictures linked to ``chunk_ids`` in the reference graph."""
+        graph = self.ref_graph
+        for chunk_id in chunk_ids:
+            for node in graph.media_nodes(chunk_id):
+                row = graph.node_row[node]
+                chunk_type = self._chunk_types[row]
+                if chunk_type == "table":
+                    tables[graph.refs[node]] = self._page_contents[row]
+                elif chunk_type == "picture":
+                    images[graph.refs[node]] = self._page_contents[row]
+
     def get_data_from_ref(self, chunks:Document) -> Tuple[str, str]:
         """Extract tables and pictures from metadata using references."""
 
@@ -56,6 +74,13 @@ class Metadata:
         tables = {}
         images = {}
 
+        if self.ref_graph is not None:
+            chunk_ids = [self.ref_graph.chunk_id(doc) for doc in chunks]
+            self.get_data_from_graph([i for i in chunk_ids if i is not None],
+                                     tables, images)
+            # chunks added after the graph was compiled still go through the refs
+            chunks = [doc for doc, i in zip(chunks, chunk_ids) if i is None]
+
         all_metadata = self.extract_all_ref_from_retrived_chunks(chunks)
 
         for meta in all_metadata.values():
@@ -0,0 +1,153 @@
+"""
+Background loading of the knowledge base.
+
+The FAISS index and the reference metadata do not depend on the user, so they are
+loaded once in a background thread as soon as the app starts, while the login page
+is already being served, and warmed up with the example and most asked questions
+(see ``src.bot.warmup``) before it is reported ready. This module only imports the
+standard library, the heavy imports happen inside the loader thread.
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundLoader:
+    """Run ``factory`` once in a daemon thread and hand out its result.
+
+    Args:
+        factory (Callable[[], Any]): builds the object, runs in the loader thread.
+        name (str): used for the thread name and log messages.
+    """
+
+    def __init__(self, factory: Callable[[], Any], name: str = "knowledge-base"):
+        self.factory = factory
+        self.name = name
+        self.started_at: Optional[float] = None
+        self.load_seconds: Optional[float] = None
+        self._value = None
+        self._error: Optional[BaseException] = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self):
+        try:
+            self._value = self.factory()
+            self.load_seconds = time.perf_counter() - self.started_at
+            logger.info(f"{self.name} ready after {self.load_seconds:.1f}s")
+        except BaseException as e:
+            self._error = e
+            logger.error(f"Failed to load {self.name}: {e}")
+        finally:
+            self._done.set()
+
+    def start(self) -> "BackgroundLoader":
+        with self._lock:
+            if self._thread is None:
+                self.started_at = time.perf_counter()
+                self._thread = threading.Thread(target=self._run, name=f"load-{self.name}",
+                                                daemon=True)
+                self._thread.start()
+        return self
+
+    @property
+    def ready(self) -> bool:
+        return self._done.is_set() and self._error is None
+
+    @property
+    def status(self) -> str:
+        if self._thread is None:
+            return "not started"
+        if not self._done.is_set():
+            return "loading"
+        if self._error is not None:
+            return f"failed: {self._error}"
+        return "ready"
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        """Wait for the loaded object, starting the load if nobody did yet."""
+        self.start()
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"{self.name} is still loading")
+        if self._error is not None:
+            raise RuntimeError(f"{self.name} failed to load") from self._error
+        return self._value
+
+
+def report_memory(knowledge_base, action: Optional[str] = None) -> list:
+    """Log the memory report of ``knowledge_base`` and the live sessions, check the
+    budgets. Returns the budgets exceeded."""
+    from src.memory import check_budgets, memory_report
+    from src.sessions import live_sessions
+    report = memory_report(knowledge_base, live_sessions())
+    logger.info(report.format())
+    return check_budgets(report, action=action)
+
+
+_session_report_lock = threading.Lock()
+
+
+def report_session_memory():
+    """Re-check the budgets in the background once a session is added, at most one
+    report at a time."""
+    if not knowledge_base_loader.ready or not _session_report_lock.acquire(blocking=False):
+        return
+
+    def run():
+        try:
+            # the index is loaded already, a session over budget is only reported
+            report_memory(knowledge_base_loader.get(), action="warn")
+        except Exception:
+            logger.exception("Memory report failed")
+        finally:
+            _session_report_lock.release()
+
+    threading.Thread(target=run, name="memory-report", daemon=True).start()
+
+
+def _load_knowledge_base():
+    from src import config
+    from src.bot.bot import KnowledgeBase
+    from src.bot.warmup import warm_up_knowledge_base
+    knowledge_base = KnowledgeBase()
+    report_memory(knowledge_base)
+    if config.WARMUP_ON_START:
+        knowledge_base.warmup = warm_up_knowledge_base(knowledge_base, EXAMPLE_QUESTIONS)
+    return knowledge_base
+
+
+knowledge_base_loader = BackgroundLoader(_load_knowledge_base)
+
+
+def example_inputs() -> list:
+    """``ChatInterface`` examples, None keeps the session and no specialty is picked."""
+    return [[question, None, ALL_SPECIALTIES] for question in EXAMPLE_QUESTIONS]
+
+
+def readiness_markdown() -> str:
+    status = knowledge_base_loader.status
+    if status == "ready":
+        return f"🟢 Knowledge base ready ({knowledge_base_loader.load_seconds:.1f}s)"
+    if status.startswith("failed"):
+        return f"🔴 Knowledge base {status}"
+    return "🟡 Loading knowledge base..."
+
+
+ALL_SPECIALTIES = "All specialties"
+# offered in the chat UI, the warm-up replays them first
+EXAMPLE_QUESTIONS = ["briefly explain me about cancer", "types of skin diseases?"]
+
+
+def specialty_choices() -> list:
+    """Choices of the UI specialty filter, only the catch-all until the index is ready."""
+    if not knowledge_base_loader.ready:
+        return [ALL_SPECIALTIES]
+    return [ALL_SPECIALTIES] + knowledge_base_loader.get().specialties
+
+
+def selected_specialty(choice):
+    return None if choice in (None, ALL_SPECIALTIES) else choice
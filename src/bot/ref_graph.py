@@ -0,0 +1,231 @@
+"""
+Precompiled reference graph of the indexed documents.
+
+Chunk metadata keeps docling references (``#/texts/12``, ``#/tables/3`` ...) as
+strings, joined with spaces by some pipelines and commas by others. This module
+parses them once, after ingestion, into integer node ids and CSR adjacency arrays
+(the table/picture rows each chunk links to through its own, parent and child
+references) stored as ``ref_graph.npz`` next to the FAISS index. The query path then
+resolves tables and figures with array lookups only.
+
+    python -m src.bot.ref_graph database/faiss_index database/metadata.csv
+"""
+import argparse
+import logging
+import os
+import pickle
+import re
+from typing import Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+GRAPH_FILE = "ref_graph.npz"
+
+# node kinds
+TEXT, TABLE, PICTURE, OTHER = 0, 1, 2, 3
+MEDIA_KINDS = (TABLE, PICTURE)
+
+
+def split_refs(value) -> List[str]:
+    """References from a metadata field, whatever separator or container was used."""
+    if not value or value != value:  # empty or NaN from pandas
+        return []
+    if not isinstance(value, str):
+        value = " ".join(str(item) for item in value)
+    return [ref for ref in re.split(r"[,\s]+", value) if ref]
+
+
+def ref_kind(ref: str) -> int:
+    if ref.startswith("#/texts/"):
+        return TEXT
+    if ref.startswith("#/tables/"):
+        return TABLE
+    if ref.startswith("#/pictures/"):
+        return PICTURE
+    return OTHER
+
+
+class Adjacency:
+    """Neighbour lists of integer nodes stored as CSR offsets and targets."""
+
+    def __init__(self, offsets: np.ndarray, targets: np.ndarray):
+        self.offsets = offsets
+        self.targets = targets
+
+    @classmethod
+    def from_lists(cls, lists: List[Iterable[int]]) -> "Adjacency":
+        lists = [list(dict.fromkeys(items)) for items in lists]
+        offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+        np.cumsum([len(items) for items in lists], out=offsets[1:])
+        targets = np.fromiter((t for items in lists for t in items), dtype=np.int32,
+                              count=int(offsets[-1]))
+        return cls(offsets, targets)
+
+    def __getitem__(self, node: int) -> np.ndarray:
+        return self.targets[self.offsets[node]:self.offsets[node + 1]]
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+
+class ReferenceGraph:
+    """Integer-encoded references of every chunk and of the table/picture rows.
+
+    Nodes are ``(source, ref)`` pairs. Chunks are numbered in FAISS insertion order
+    and found from a retrieved document by its docstore id.
+    """
+
+    _ADJACENCIES = ("chunk_refs", "chunk_media")
+    _ARRAYS = ("sources", "refs", "node_source", "node_kind", "node_row",
+               "chunk_docstore_ids")
+
+    def __init__(self, sources: np.ndarray, refs: np.ndarray, node_source: np.ndarray,
+                 node_kind: np.ndarray, node_row: np.ndarray,
+                 chunk_docstore_ids: np.ndarray, metadata_rows: int,
+                 chunk_refs: Adjacency, chunk_media: Adjacency):
+        self.sources = sources
+        self.refs = refs
+        self.node_source = node_source
+        self.node_kind = node_kind
+        # row of metadata.csv holding a table/picture node, -1 for other nodes
+        self.node_row = node_row
+        self.chunk_docstore_ids = chunk_docstore_ids
+        self.metadata_rows = metadata_rows
+        self.chunk_refs = chunk_refs
+        self.chunk_media = chunk_media
+        self._chunk_by_docstore_id = {docstore_id: i for i, docstore_id
+                                      in enumerate(chunk_docstore_ids.tolist())}
+
+    @classmethod
+    def build(cls, chunks: List[Document], docstore_ids: List[str],
+              metadata: pd.DataFrame) -> "ReferenceGraph":
+        """Compile the graph from the indexed chunks and the metadata.csv rows.
+
+        Args:
+            chunks (List[Document]): indexed chunks in FAISS insertion order.
+            docstore_ids (List[str]): docstore id of each chunk.
+            metadata (pd.DataFrame): table/picture rows with source and self_ref.
+        """
+        node_ids, sources, source_ids = {}, [], {}
+        refs, node_source = [], []
+
+        def node(source: str, ref: str) -> int:
+            key = (source, ref)
+            node_id = node_ids.get(key)
+            if node_id is None:
+                if source not in source_ids:
+                    source_ids[source] = len(sources)
+                    sources.append(source)
+                node_id = node_ids[key] = len(refs)
+                refs.append(ref)
+                node_source.append(source_ids[source])
+            return node_id
+
+        chunk_refs, chunk_parents, chunk_children = [], [], []
+        for doc in chunks:
+            source = str(doc.metadata.get("source", ""))
+            self_nodes = [node(source, r) for r in split_refs(doc.metadata.get("self_ref"))]
+            parent_nodes = [node(source, r)
+                            for r in split_refs(doc.metadata.get("parent_ref"))]
+            child_nodes = [node(source, r) for r in split_refs(doc.metadata.get("child_ref"))]
+            chunk_refs.append(self_nodes)
+            chunk_parents.append(parent_nodes)
+            chunk_children.append(child_nodes)
+
+        rows = {}
+        for row, (source, ref) in enumerate(zip(metadata["source"].astype(str),
+                                                metadata["self_ref"].astype(str))):
+            rows.setdefault(node(source, ref), row)
+
+        node_kind = np.array([ref_kind(ref) for ref in refs], dtype=np.int8)
+        node_row = np.full(len(refs), -1, dtype=np.int32)
+        for node_id, row in rows.items():
+            if node_kind[node_id] in MEDIA_KINDS:
+                node_row[node_id] = row
+
+        # the tables and pictures a chunk points to, as the old regex lookup found them
+        chunk_media = [[n for n in refs_ + parents_ + children_ if node_row[n] >= 0]
+                       for refs_, parents_, children_
+                       in zip(chunk_refs, chunk_parents, chunk_children)]
+
+        return cls(
+            sources=np.array(sources, dtype=str),
+            refs=np.array(refs, dtype=str),
+            node_source=np.array(node_source, dtype=np.int32),
+            node_kind=node_kind,
+            node_row=node_row,
+            chunk_docstore_ids=np.array(docstore_ids, dtype=str),
+            metadata_rows=len(metadata),
+            chunk_refs=Adjacency.from_lists(chunk_refs),
+            chunk_media=Adjacency.from_lists(chunk_media),
+        )
+
+    def save(self, path: str):
+        arrays = {name: getattr(self, name) for name in self._ARRAYS}
+        arrays["metadata_rows"] = np.array(self.metadata_rows)
+        for name in self._ADJACENCIES:
+            adjacency = getattr(self, name)
+            arrays[f"{name}_offsets"] = adjacency.offsets
+            arrays[f"{name}_targets"] = adjacency.targets
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> "ReferenceGraph":
+        # graphs saved by older versions also hold section arrays, they are skipped
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in cls._ARRAYS}
+            adjacencies = {name: Adjacency(data[f"{name}_offsets"], data[f"{name}_targets"])
+                           for name in cls._ADJACENCIES}
+            metadata_rows = int(data["metadata_rows"])
+        return cls(**arrays, metadata_rows=metadata_rows, **adjacencies)
+
+    @classmethod
+    def load_for_index(cls, faiss_database: str) -> Optional["ReferenceGraph"]:
+        """The graph saved next to ``faiss_database``, None if it was never built."""
+        path = os.path.join(faiss_database, GRAPH_FILE)
+        if not os.path.exists(path):
+            return None
+        return cls.load(path)
+
+    def chunk_id(self, doc: Document) -> Optional[int]:
+        return self._chunk_by_docstore_id.get(getattr(doc, "id", None))
+
+    def media_nodes(self, chunk_id: int) -> np.ndarray:
+        return self.chunk_media[chunk_id]
+
+
+
+def read_index_chunks(faiss_database: str) -> tuple:
+    """Chunks and docstore ids of a saved FAISS index, without loading the vectors."""
+    with open(os.path.join(faiss_database, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    docstore_ids = [index_to_docstore_id[i] for i in range(len(index_to_docstore_id))]
+    return [docstore.search(docstore_id) for docstore_id in docstore_ids], docstore_ids
+
+
+def build_for_index(faiss_database: str, metadata_database: str) -> ReferenceGraph:
+    """Compile and save the reference graph of an ingested index."""
+    chunks, docstore_ids = read_index_chunks(faiss_database)
+    graph = ReferenceGraph.build(chunks, docstore_ids, pd.read_csv(metadata_database))
+    graph.save(os.path.join(faiss_database, GRAPH_FILE))
+    logger.info(f"Reference graph: {len(graph.refs)} nodes, {len(graph.chunk_refs)} "
+                f"chunks, {len(graph.sources)} sources")
+    return graph
+
+
+if __name__ == "__main__":
+    from src.profiling import profile
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Compile the reference graph of an index")
+    parser.add_argument("faiss_database", nargs="?", default="database/faiss_index")
+    parser.add_argument("metadata_database", nargs="?", default="database/metadata.csv")
+    parser.add_argument("--profile", action="store_true",
+                        help="write a cProfile capture to PROFILE_DIR")
+    args = parser.parse_args()
+    with profile("ref_graph", args.faiss_database, force=args.profile):
+        build_for_index(args.faiss_database, args.metadata_database)
@@ -0,0 +1,200 @@
+"""
+Per-specialty (or per-book) shards of the FAISS index with a centroid router.
+
+``build_shards`` splits an ingested monolithic index into one FAISS index per
+specialty or per book, each saved in the usual ``index.faiss``/``index.pkl`` layout,
+plus ``router.npz`` holding the normalised centroid of every shard. At query time
+``ShardedVectorStore`` scores the question against the centroids, searches the best
+shards in parallel and merges their results by distance. A specialty chosen in the
+UI restricts the search to the shards of that specialty.
+
+    python -m src.bot.shards database/faiss_index database/shards --by specialty
+"""
+import argparse
+import logging
+import os
+import pickle
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from src.bot.ref_graph import read_index_chunks
+from src.bot.vectors import make_index, read_index_meta, write_index_meta
+
+logger = logging.getLogger(__name__)
+
+ROUTER_FILE = "router.npz"
+
+
+def chunk_specialty(metadata: dict) -> str:
+    # pipelines disagree on the key name
+    return str(metadata.get("specilization") or metadata.get("medical_specialty")
+               or "general")
+
+
+class SpecialtyFilter:
+    """FAISS metadata filter keeping the chunks of one specialty."""
+
+    def __init__(self, specialty: str):
+        self.specialty = specialty
+
+    def __call__(self, metadata: dict) -> bool:
+        return chunk_specialty(metadata) == self.specialty
+
+
+def _shard_name(name: str) -> str:
+    return re.sub(r"[^\w.-]+", "-", name).strip("-") or "shard"
+
+
+def build_shards(faiss_database: str, output_dir: str, by: str = "specialty") -> dict:
+    """Split a saved FAISS index into shards and write their router.
+
+    Args:
+        faiss_database (str): monolithic index directory.
+        output_dir (str): directory receiving one sub-directory per shard.
+        by (str): "specialty" or "source" (one shard per book).
+
+    Returns:
+        dict: number of chunks per shard.
+    """
+    import faiss
+
+    meta = read_index_meta(faiss_database)
+    index = faiss.read_index(os.path.join(faiss_database, "index.faiss"))
+    chunks, docstore_ids = read_index_chunks(faiss_database)
+    vectors = index.reconstruct_n(0, index.ntotal)
+
+    groups: Dict[str, List[int]] = {}
+    specialties = {}
+    for i, doc in enumerate(chunks):
+        key = chunk_specialty(doc.metadata) if by == "specialty" \
+            else str(doc.metadata.get("source", "unknown"))
+        groups.setdefault(key, []).append(i)
+        specialties.setdefault(key, chunk_specialty(doc.metadata))
+
+    names, shard_specialties, centroids = [], [], []
+    os.makedirs(output_dir, exist_ok=True)
+    for key, positions in sorted(groups.items()):
+        name = _shard_name(key)
+        shard_vectors = np.ascontiguousarray(vectors[positions])
+        shard_index = make_index(shard_vectors, meta["storage"], index.metric_type)
+        ids = [docstore_ids[i] for i in positions]
+        docstore = InMemoryDocstore({docstore_id: chunks[i]
+                                     for docstore_id, i in zip(ids, positions)})
+        # same files FAISS.save_local writes
+        shard_dir = os.path.join(output_dir, name)
+        os.makedirs(shard_dir, exist_ok=True)
+        faiss.write_index(shard_index, os.path.join(shard_dir, "index.faiss"))
+        with open(os.path.join(shard_dir, "index.pkl"), "wb") as f:
+            pickle.dump((docstore, dict(enumerate(ids))), f)
+        write_index_meta(shard_dir, **meta)
+
+        centroid = shard_vectors.mean(axis=0)
+        names.append(name)
+        shard_specialties.append(specialties[key])
+        centroids.append(centroid / (np.linalg.norm(centroid) or 1.0))
+
+    write_index_meta(output_dir, **meta)
+    np.savez(os.path.join(output_dir, ROUTER_FILE), names=np.array(names, dtype=str),
+             specialties=np.array(shard_specialties, dtype=str),
+             centroids=np.array(centroids, dtype=np.float32),
+             sizes=np.array([len(groups[k]) for k in sorted(groups)], dtype=np.int64))
+    logger.info(f"Wrote {len(names)} shards to {output_dir}")
+    return {name: len(groups[key]) for name, key in zip(names, sorted(groups))}
+
+
+class ShardedVectorStore:
+    """Routes searches to the shards closest to the question and merges the hits.
+
+    Only the search methods Medibot uses are provided, with the FAISS signatures.
+
+    Args:
+        shards_database (str): directory written by ``build_shards``.
+        embeddings (Embeddings): query embedding model of the index.
+        top_shards (int): shards searched per question.
+    """
+
+    def __init__(self, shards_database: str, embeddings: Embeddings, top_shards: int = 3):
+        with np.load(os.path.join(shards_database, ROUTER_FILE)) as router:
+            self.names = router["names"].tolist()
+            self.specialties = router["specialties"].tolist()
+            self.centroids = router["centroids"]
+            self.sizes = router["sizes"]
+        self.shards = [FAISS.load_local(os.path.join(shards_database, name), embeddings,
+                                        allow_dangerous_deserialization=True)
+                       for name in self.names]
+        self.embeddings = embeddings
+        self.top_shards = top_shards
+        self.docstore = InMemoryDocstore({
+            docstore_id: doc for shard in self.shards
+            for docstore_id, doc in shard.docstore._dict.items()})
+        self._executor = ThreadPoolExecutor(max_workers=min(8, len(self.shards)) or 1,
+                                            thread_name_prefix="shard-search")
+
+    def route(self, embedding: List[float], specialty: Optional[str] = None) -> List[int]:
+        """Indexes of the shards to search, best first."""
+        candidates = np.arange(len(self.names))
+        if specialty is not None:
+            candidates = np.array([i for i, s in enumerate(self.specialties)
+                                   if s == specialty], dtype=np.int64)
+            if not len(candidates):
+                return []
+        query = np.asarray(embedding, dtype=np.float32)
+        scores = self.centroids[candidates] @ (query / (np.linalg.norm(query) or 1.0))
+        return candidates[np.argsort(-scores)[:self.top_shards]].tolist()
+
+    def _search(self, search: Callable[[FAISS], List[Tuple[Document, float]]],
+                embedding: List[float], k: int,
+                specialty: Optional[str]) -> List[Tuple[Document, float]]:
+        shards = [self.shards[i] for i in self.route(embedding, specialty)]
+        hits = [hit for result in self._executor.map(search, shards) for hit in result]
+        # FAISS scores are distances for the L2 indexes the pipelines build
+        hits.sort(key=lambda hit: hit[1])
+        return hits[:k]
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4,
+                                               specialty: Optional[str] = None,
+                                               **kwargs) -> List[Tuple[Document, float]]:
+        return self._search(
+            lambda shard: shard.similarity_search_with_score_by_vector(embedding, k,
+                                                                       **kwargs),
+            embedding, k, specialty)
+
+    def max_marginal_relevance_search_with_score_by_vector(
+            self, embedding: List[float], k: int = 4, fetch_k: int = 20,
+            lambda_mult: float = 0.5, specialty: Optional[str] = None,
+            **kwargs) -> List[Tuple[Document, float]]:
+        # MMR runs inside each shard, the shards' picks are merged by distance
+        return self._search(
+            lambda shard: shard.max_marginal_relevance_search_with_score_by_vector(
+                embedding, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult, **kwargs),
+            embedding, k, specialty)
+
+    def max_marginal_relevance_search_by_vector(self, embedding: List[float], k: int = 4,
+                                                fetch_k: int = 20, lambda_mult: float = 0.5,
+                                                specialty: Optional[str] = None,
+                                                **kwargs) -> List[Document]:
+        hits = self.max_marginal_relevance_search_with_score_by_vector(
+            embedding, k, fetch_k, lambda_mult, specialty, **kwargs)
+        return [doc for doc, _ in hits]
+
+
+if __name__ == "__main__":
+    from src.profiling import profile
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Split a FAISS index into routed shards")
+    parser.add_argument("faiss_database", nargs="?", default="database/faiss_index")
+    parser.add_argument("output_dir", nargs="?", default="database/shards")
+    parser.add_argument("--by", choices=("specialty", "source"), default="specialty")
+    parser.add_argument("--profile", action="store_true",
+                        help="write a cProfile capture to PROFILE_DIR")
+    args = parser.parse_args()
+    with profile("shards", args.faiss_database, force=args.profile):
+        build_shards(args.faiss_database, args.output_dir, args.by)
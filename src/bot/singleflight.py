@@ -0,0 +1,167 @@
+"""
+Single-flight coalescing of identical questions asked at the same time.
+
+The first caller of a key runs the computation, callers arriving while it is in
+flight wait for its result instead of starting their own. Nothing is kept once the
+flight lands, this is not a cache. Streams are fanned out: every follower replays
+the items produced so far and then receives new ones as the leader's stream
+produces them, the stream runs to completion even if the caller that started it
+goes away. The leader's deadline bounds the flight, a waiter's own deadline how long
+it waits for it.
+"""
+import asyncio
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import AsyncIterator, Callable, Hashable
+
+from src.bot.deadline import DeadlineExceeded, current_deadline
+from src.metrics import inc, span
+
+_TRAILING = "?!.。？！ "
+
+
+def normalize_question(question: str) -> str:
+    """Case, whitespace and trailing punctuation do not make a different question."""
+    return " ".join(question.lower().split()).rstrip(_TRAILING)
+
+
+class _Broadcast:
+    """Items of one stream, replayed to every follower."""
+
+    def __init__(self):
+        self.items = []
+        self.finished = False
+        self.error = None
+        self._changed = asyncio.Event()
+
+    def _wake(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def push(self, item):
+        self.items.append(item)
+        self._wake()
+
+    def close(self, error: BaseException = None):
+        self.finished = True
+        self.error = error
+        self._wake()
+
+    async def follow(self) -> AsyncIterator:
+        position = 0
+        while True:
+            while position < len(self.items):
+                yield self.items[position]
+                position += 1
+            if self.finished:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+
+class SingleFlight:
+    """Shares in-flight calls between callers asking for the same key.
+
+    Args:
+        name (str): label of the coalescing metrics.
+    """
+
+    def __init__(self, name: str = "query"):
+        self.name = name
+        self._calls = {}    # key -> Future
+        self._streams = {}  # (event loop, key) -> _Broadcast
+        self._pumps = set()  # running stream tasks, the loop only keeps weak references
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], object]) -> tuple:
+        """Run ``fn`` unless a call of ``key`` is in flight, then wait for that one.
+
+        Returns:
+            tuple: (result, shared), shared is True for callers that waited.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            inc("medibot_coalesced_total", kind=self.name)
+            # the leader's deadline bounds the flight, a waiter's own one its wait
+            current = current_deadline()
+            with span("coalesced_wait"):
+                try:
+                    return future.result(None if current is None
+                                         else current.remaining()), True
+                except FutureTimeout:
+                    if future.done():  # the flight itself timed out
+                        raise
+                    inc("medibot_deadline_exceeded_total", stage="coalesced_wait")
+                    raise DeadlineExceeded("coalesced_wait") from None
+
+        inc("medibot_singleflight_calls_total", kind=self.name)
+        try:
+            result = fn()
+            future.set_result(result)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+        return result, False
+
+    async def stream(self, key: Hashable,
+                     produce: Callable[[], AsyncIterator]) -> AsyncIterator:
+        """Iterate ``produce()``, shared with the callers streaming the same key."""
+        loop_key = (id(asyncio.get_running_loop()), key)
+        broadcast = self._streams.get(loop_key)
+        current = None
+        if broadcast is None:
+            inc("medibot_singleflight_calls_total", kind=f"{self.name}_stream")
+            broadcast = self._streams[loop_key] = _Broadcast()
+            # a task, so followers are served even if this caller disconnects
+            pump = asyncio.ensure_future(self._pump(loop_key, broadcast, produce))
+            self._pumps.add(pump)
+            pump.add_done_callback(self._pumps.discard)
+        else:
+            inc("medibot_coalesced_total", kind=f"{self.name}_stream")
+            current = current_deadline()
+        items = broadcast.follow()
+        if current is None:
+            async for item in items:
+                yield item
+            return
+        while True:
+            try:
+                item = await asyncio.wait_for(items.__anext__(), current.remaining())
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                inc("medibot_deadline_exceeded_total", stage="coalesced_wait")
+                raise DeadlineExceeded("coalesced_wait") from None
+            yield item
+
+    async def _pump(self, loop_key: tuple, broadcast: _Broadcast,
+                    produce: Callable[[], AsyncIterator]):
+        error = None
+        try:
+            async for item in produce():
+                broadcast.push(item)
+        except Exception as e:
+            error = e
+        except BaseException as e:
+            # e.g. the loop cancelling the pump, followers must not wait forever
+            error = e
+            raise
+        finally:
+            broadcast.close(error)
+            self._streams.pop(loop_key, None)
+
+    @property
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls) + len(self._streams)
+
+
+query_flights = SingleFlight("query")
@@ -0,0 +1,288 @@
+"""
+RAPTOR-style tree of cluster summaries over the chunks of every book.
+
+``build_tree`` clusters the chunk vectors of each book with FAISS k-means (on CPU),
+summarizes every cluster, embeds the summaries and repeats on the summaries until
+one root per book is left. Summary texts, vectors and the CSR child lists are saved
+as ``summary_tree.npz`` next to the FAISS index; the flat index is left untouched.
+
+At query time ``SummaryTree.search`` starts from the book roots, keeps the ``beam``
+closest nodes of every level and only scores the children of those, down to the
+leaf chunks. A broad question then scores a few hundred vectors instead of the whole
+index. The summarizer is pluggable: ``ChatSummarizer`` asks a chat model,
+``ExtractiveSummarizer`` keeps the leading sentences and needs no model.
+
+    python -m src.bot.summary_tree database/faiss_index --branching 8 --summarizer groq
+"""
+import argparse
+import logging
+import math
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+
+from src.bot.ref_graph import Adjacency, read_index_chunks
+from src.bot.shards import chunk_specialty
+from src.bot.vectors import SUMMARY_TREE_FILE, query_embeddings, read_index_meta
+from src.metrics import SIZE_BUCKETS, observe
+
+logger = logging.getLogger(__name__)
+
+TREE_FILE = SUMMARY_TREE_FILE
+# words of every text handed to the summarizer
+MAX_INPUT_WORDS = 400
+
+SUMMARY_PROMPT = (
+    "Summarize the following passages of a medical textbook in one paragraph of at "
+    "most {max_words} words. Keep the conditions, treatments and terms they mention.\n\n"
+    "{passages}")
+
+
+class ExtractiveSummarizer:
+    """Leading sentence of every text, up to ``max_words`` words in total."""
+
+    def __init__(self, max_words: int = 120):
+        self.max_words = max_words
+
+    def summarize(self, texts: List[str]) -> str:
+        sentences = [re.split(r"(?<=[.!?])\s+", text.strip(), maxsplit=1)[0]
+                     for text in texts if text.strip()]
+        return " ".join(" ".join(sentences).split()[:self.max_words])
+
+
+class ChatSummarizer:
+    """Summaries written by a chat model, e.g. a pooled Groq model."""
+
+    def __init__(self, chat_model: BaseChatModel, max_words: int = 120):
+        self.chat_model = chat_model
+        self.max_words = max_words
+
+    def summarize(self, texts: List[str]) -> str:
+        passages = "\n\n".join(" ".join(text.split()[:MAX_INPUT_WORDS]) for text in texts)
+        prompt = SUMMARY_PROMPT.format(max_words=self.max_words, passages=passages)
+        return str(self.chat_model.invoke(prompt).content).strip()
+
+
+def kmeans(vectors: np.ndarray, n_clusters: int, niter: int = 20,
+           seed: int = 0) -> np.ndarray:
+    """Cluster of every row, clusters renumbered without the empty ones."""
+    import faiss
+
+    if n_clusters <= 1 or len(vectors) <= n_clusters:
+        return np.zeros(len(vectors), dtype=np.int64) if n_clusters <= 1 \
+            else np.arange(len(vectors), dtype=np.int64)
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    clustering = faiss.Kmeans(vectors.shape[1], n_clusters, niter=niter, seed=seed,
+                              gpu=False, verbose=False)
+    clustering.train(vectors)
+    _, assignment = clustering.index.search(vectors, 1)
+    _, labels = np.unique(assignment[:, 0], return_inverse=True)
+    return labels.astype(np.int64)
+
+
+def _squared_distances(query: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    # same squared L2 the flat index reports
+    return ((vectors - query) ** 2).sum(axis=1)
+
+
+class SummaryTree:
+    """Summary nodes above the chunks of a FAISS index.
+
+    Level 1 nodes have chunk positions of the index as children, higher levels have
+    node ids.
+    """
+
+    def __init__(self, vectors: np.ndarray, summaries: np.ndarray, level: np.ndarray,
+                 node_book: np.ndarray, books: np.ndarray, book_specialties: np.ndarray,
+                 children: Adjacency, index_size: int):
+        self.vectors = vectors
+        self.summaries = summaries
+        self.level = level
+        self.node_book = node_book
+        self.books = books
+        self.book_specialties = book_specialties
+        self.children = children
+        self.index_size = index_size
+        has_parent = np.zeros(len(level), dtype=bool)
+        internal = np.flatnonzero(level > 1)
+        for node in internal:
+            has_parent[children[node]] = True
+        self.roots = np.flatnonzero(~has_parent)
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, chunks: List, summarizer, embeddings: Embeddings,
+              branching: int = 8, workers: int = 4, seed: int = 0) -> "SummaryTree":
+        """Cluster and summarize the chunks of every book.
+
+        Args:
+            vectors (np.ndarray): chunk vectors, in index order.
+            chunks (List[Document]): chunks, in index order.
+            summarizer: object with ``summarize(texts) -> str``.
+            embeddings (Embeddings): embeds the summaries like the chunks were.
+            branching (int): mean children per node.
+            workers (int): summaries written in parallel.
+            seed (int): k-means seed.
+        """
+        branching = max(2, branching)
+        books: Dict[str, List[int]] = {}
+        specialties = {}
+        for i, doc in enumerate(chunks):
+            book = str(doc.metadata.get("source", "unknown"))
+            books.setdefault(book, []).append(i)
+            specialties.setdefault(book, chunk_specialty(doc.metadata))
+        book_names = sorted(books)
+
+        node_vectors, node_summaries, node_level, node_book, node_children = [], [], [], [], []
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for book_id, book in enumerate(book_names):
+                # members of the current level: (vector, text, id in the level below)
+                members = books[book]
+                level_vectors = vectors[members]
+                level_texts = [chunks[i].page_content for i in members]
+                level_ids = np.asarray(members, dtype=np.int64)
+                level = 1
+                while True:
+                    n_clusters = math.ceil(len(level_ids) / branching)
+                    labels = kmeans(level_vectors, n_clusters, seed=seed)
+                    clusters = [np.flatnonzero(labels == c) for c in range(labels.max() + 1)]
+                    summaries = list(pool.map(
+                        lambda cluster: summarizer.summarize(
+                            [level_texts[i] for i in cluster]), clusters))
+                    summary_vectors = np.asarray(embeddings.embed_documents(summaries),
+                                                 dtype=np.float32)
+                    first = len(node_level)
+                    for cluster, summary, vector in zip(clusters, summaries,
+                                                        summary_vectors):
+                        node_vectors.append(vector)
+                        node_summaries.append(summary)
+                        node_level.append(level)
+                        node_book.append(book_id)
+                        node_children.append(level_ids[cluster].tolist())
+                    if len(clusters) == 1:
+                        break
+                    level_vectors, level_texts = summary_vectors, summaries
+                    level_ids = np.arange(first, first + len(clusters), dtype=np.int64)
+                    level += 1
+                logger.info(f"Summary tree of {book}: {len(members)} chunks, "
+                            f"{level} levels")
+
+        return cls(np.asarray(node_vectors, dtype=np.float32),
+                   np.array(node_summaries, dtype=str),
+                   np.array(node_level, dtype=np.int16),
+                   np.array(node_book, dtype=np.int32),
+                   np.array(book_names, dtype=str),
+                   np.array([specialties[book] for book in book_names], dtype=str),
+                   Adjacency.from_lists(node_children), len(vectors))
+
+    def save(self, path: str):
+        np.savez(path, vectors=self.vectors, summaries=self.summaries, level=self.level,
+                 node_book=self.node_book, books=self.books,
+                 book_specialties=self.book_specialties,
+                 children_offsets=self.children.offsets,
+                 children_targets=self.children.targets,
+                 index_size=np.array(self.index_size))
+
+    @classmethod
+    def load(cls, path: str) -> "SummaryTree":
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in data.files}
+        children = Adjacency(arrays.pop("children_offsets"), arrays.pop("children_targets"))
+        arrays["index_size"] = int(arrays["index_size"])
+        return cls(**arrays, children=children)
+
+    @classmethod
+    def load_for_index(cls, faiss_database: str) -> Optional["SummaryTree"]:
+        """The tree saved next to ``faiss_database``, None if it was never built."""
+        path = os.path.join(faiss_database, TREE_FILE)
+        if not os.path.exists(path):
+            return None
+        return cls.load(path)
+
+    def search(self, query, index, k: int = 20, beam: int = 4,
+               specialty: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray,
+                                                         np.ndarray]:
+        """Descend from the roots to the ``k`` closest chunks.
+
+        Args:
+            query: question vector.
+            index (faiss.Index): the flat index, leaf vectors are read from it.
+            k (int): chunks returned.
+            beam (int): nodes expanded per level.
+            specialty (str, optional): only descend into books of this specialty.
+
+        Returns:
+            tuple: (chunk positions, squared distances, vectors), closest first.
+        """
+        query = np.asarray(query, dtype=np.float32)
+        frontier = self.roots
+        if specialty is not None:
+            frontier = frontier[self.book_specialties[self.node_book[frontier]] == specialty]
+        leaves, scored = [], 0
+        while len(frontier):
+            distances = _squared_distances(query, self.vectors[frontier])
+            scored += len(frontier)
+            expanded = frontier[np.argsort(distances)[:beam]]
+            below = []
+            for node in expanded:
+                (leaves if self.level[node] == 1 else below).append(self.children[node])
+            frontier = np.concatenate(below) if below else np.empty(0, dtype=np.int64)
+        if not leaves:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, np.empty(0, dtype=np.float32), np.empty((0, self.vectors.shape[1]),
+                                                                  dtype=np.float32)
+        positions = np.concatenate(leaves).astype(np.int64)
+        leaf_vectors = index.reconstruct_batch(positions)
+        distances = _squared_distances(query, leaf_vectors)
+        scored += len(positions)
+        observe("medibot_tree_vectors_scored", scored, SIZE_BUCKETS)
+        order = np.argsort(distances)[:k]
+        return positions[order], distances[order], leaf_vectors[order]
+
+
+def build_for_index(faiss_database: str, summarizer, embeddings: Optional[Embeddings] = None,
+                    branching: int = 8, workers: int = 4) -> SummaryTree:
+    """Build and save the summary tree of an ingested index."""
+    import faiss
+
+    index = faiss.read_index(os.path.join(faiss_database, "index.faiss"))
+    chunks, _ = read_index_chunks(faiss_database)
+    # summaries must land in the space of the stored (possibly truncated) vectors
+    embeddings = query_embeddings(read_index_meta(faiss_database), embeddings)
+    tree = SummaryTree.build(index.reconstruct_n(0, index.ntotal), chunks, summarizer,
+                             embeddings, branching=branching, workers=workers)
+    tree.save(os.path.join(faiss_database, TREE_FILE))
+    logger.info(f"Summary tree: {len(tree.level)} summaries over {tree.index_size} chunks "
+                f"of {len(tree.books)} books, {int(tree.level.max())} levels")
+    return tree
+
+
+def groq_summarizer(model: str = "llama-3.1-8b-instant") -> ChatSummarizer:
+    from src.bot.clients import client_pool
+    return ChatSummarizer(client_pool.chat_model(os.environ["GROQ_API_KEY"], model=model,
+                                                 max_retries=2, temperature=0.0))
+
+
+if __name__ == "__main__":
+    from src.profiling import profile
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Build the summary tree of an index")
+    parser.add_argument("faiss_database", nargs="?", default="database/faiss_index")
+    parser.add_argument("--branching", type=int, default=8)
+    parser.add_argument("--summarizer", choices=("groq", "extractive"), default="groq")
+    parser.add_argument("--model", default="llama-3.1-8b-instant",
+                        help="Groq model of the groq summarizer, needs GROQ_API_KEY")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--profile", action="store_true",
+                        help="write a cProfile capture to PROFILE_DIR")
+    args = parser.parse_args()
+    summarizer = groq_summarizer(args.model) if args.summarizer == "groq" \
+        else ExtractiveSummarizer()
+    with profile("summary_tree", args.faiss_database, force=args.profile):
+        build_for_index(args.faiss_database, summarizer, branching=args.branching,
+                        workers=args.workers)
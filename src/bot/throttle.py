@@ -0,0 +1,241 @@
+"""
+Client-side protection of the Groq rate limits, shared by every bot of a key.
+
+Each (API key, model) pair has a token bucket and a circuit breaker:
+
+* The bucket paces requests at ``GROQ_REQUESTS_PER_MINUTE`` with bursts of
+  ``GROQ_BURST``. A 429 halves its rate and pauses it for the ``retry-after`` the
+  server sent, successes raise the rate back step by step (AIMD), so users sharing
+  a key back off together instead of each retrying on their own.
+* The breaker opens after ``GROQ_BREAKER_FAILURES`` consecutive throttled or failed
+  calls and refuses calls for ``GROQ_BREAKER_RESET`` seconds, then lets one probe
+  through.
+
+When the primary model is refused, ``Medibot`` falls back to ``GROQ_FALLBACK_MODEL``.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import groq
+
+from src import config
+from src.metrics import inc, observe
+
+# bucket rate bounds relative to the configured rate
+MIN_RATE_FRACTION = 0.05
+RECOVERY_STEP = 0.05
+
+
+class RateLimited(RuntimeError):
+    """The key is throttled and no model could take the request in time."""
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds the server asked to wait, from a 429 response."""
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class TokenBucket:
+    """Token bucket with AIMD rate adaptation.
+
+    Args:
+        rate (float): tokens per second at most, 0 admits everything.
+        burst (int): bucket size.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+
+    def _wait_locked(self, now: float) -> float:
+        """Take a token and return 0, or return the seconds until one is available."""
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def acquire(self, timeout: float = 0.0) -> bool:
+        """Take a token, waiting up to ``timeout`` seconds for one."""
+        if not self.max_rate:
+            return True
+        end = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                wait = self._wait_locked(now)
+                if wait == 0:
+                    return True
+                if now + wait > end:
+                    return False
+                self._cond.wait(wait)
+
+    def throttled(self, pause: Optional[float] = None):
+        """The server said 429: halve the rate and stop for ``pause`` seconds."""
+        if not self.max_rate:
+            return
+        with self._cond:
+            self.rate = max(self.max_rate * MIN_RATE_FRACTION, self.rate / 2)
+            self.tokens = 0.0
+            self._paused_until = time.monotonic() + (pause if pause else 1 / self.rate)
+
+    def succeeded(self):
+        if self.max_rate and self.rate < self.max_rate:
+            with self._cond:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * RECOVERY_STEP)
+
+
+class CircuitBreaker:
+    """Closed, open after ``failure_threshold`` consecutive failures, half-open
+    (one probe) ``reset_timeout`` seconds later."""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _set_locked(self, state: str):
+        if state != self.state:
+            self.state = state
+            inc("medibot_circuit_transitions_total", state=state)
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.OPEN and \
+                    time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._set_locked(self.HALF_OPEN)
+                self._probing = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def release(self):
+        """The call allowed by ``allow`` did not go out after all."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            self._set_locked(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._set_locked(self.OPEN)
+
+
+class KeyThrottle:
+    """Bucket and breaker of one (API key, model) pair."""
+
+    def __init__(self, model: str, bucket: TokenBucket, breaker: CircuitBreaker):
+        self.model = model
+        self.bucket = bucket
+        self.breaker = breaker
+
+    def try_admit(self) -> Optional[str]:
+        """None if the call may go now, else why not: "open" or "throttled"."""
+        if not self.breaker.allow():
+            return "open"
+        if not self.bucket.acquire(0.0):
+            self.breaker.release()
+            return "throttled"
+        return None
+
+    def wait_admit(self, timeout: float) -> bool:
+        """Wait up to ``timeout`` seconds for the bucket, True if the call may go."""
+        if not self.breaker.allow():
+            return False
+        start = time.monotonic()
+        admitted = self.bucket.acquire(timeout)
+        observe("medibot_rate_limit_wait_seconds", time.monotonic() - start)
+        if not admitted:
+            self.breaker.release()
+        return admitted
+
+    def succeeded(self):
+        self.bucket.succeeded()
+        self.breaker.record_success()
+
+    def failed(self, error: Optional[BaseException] = None):
+        """Record a failed call, ``error`` None for a call cut short by the deadline."""
+        if isinstance(error, groq.RateLimitError):
+            inc("medibot_llm_throttled_total", reason="429", model=self.model)
+            self.bucket.throttled(retry_after(error))
+        elif error is not None and not isinstance(
+                error, (groq.APIConnectionError, groq.InternalServerError)):
+            # bad requests and auth errors say nothing about capacity, but the call
+            # may have been the half-open probe
+            self.breaker.release()
+            return
+        self.breaker.record_failure()
+
+    def abandoned(self):
+        """The caller went away before the call finished, e.g. a closed stream."""
+        self.breaker.release()
+
+
+class ThrottleRegistry:
+    """One ``KeyThrottle`` per (API key, model), keys are only kept hashed.
+
+    At most ``max_size`` throttles are kept, the least recently used one is dropped
+    and starts fresh when its key comes back.
+    """
+
+    def __init__(self, requests_per_minute: float = 30.0, burst: int = 10,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 max_size: int = 4096):
+        self.rate = requests_per_minute / 60
+        self.burst = burst
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_size = max_size
+        self._throttles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, api_key: str, model: str) -> KeyThrottle:
+        key = (hashlib.sha256(api_key.encode()).hexdigest(), model)
+        with self._lock:
+            throttle = self._throttles.get(key)
+            if throttle is None:
+                throttle = self._throttles[key] = KeyThrottle(
+                    model, TokenBucket(self.rate, self.burst),
+                    CircuitBreaker(self.failure_threshold, self.reset_timeout))
+            self._throttles.move_to_end(key)
+            while len(self._throttles) > self.max_size:
+                self._throttles.popitem(last=False)
+        return throttle
+
+
+throttles = ThrottleRegistry(config.GROQ_REQUESTS_PER_MINUTE, config.GROQ_BURST,
+                             config.GROQ_BREAKER_FAILURES, config.GROQ_BREAKER_RESET,
+                             config.GROQ_THROTTLE_CACHE_SIZE)
@@ -0,0 +1,195 @@
+"""
+Reduced-dimension and compressed vector storage.
+
+An index can hold shorter vectors, either asked from the model through its
+``dimensions`` option at ingest or cut from full vectors afterwards (truncated and
+renormalised, which text-embedding-3 models are trained to tolerate), and store them
+as float32, float16 or 8-bit scalar-quantized codes (FAISS SQ8). How an index was
+built is recorded in ``index_meta.json`` next to it, and the query side configures
+its embeddings from that file.
+
+    python -m src.bot.vectors database/faiss_index database/faiss_index_sq8 \
+        --dimensions 1024 --storage sq8
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+INDEX_META_FILE = "index_meta.json"
+DEFAULT_EMBEDDING_MODEL = "text-embedding-3-large"
+STORAGES = ("float32", "float16", "sq8")
+# written by src.bot.summary_tree, which imports this module
+SUMMARY_TREE_FILE = "summary_tree.npz"
+
+
+def read_index_meta(faiss_database: str) -> dict:
+    """How the index was built, defaults for indexes from before the file existed."""
+    meta = {"embedding_model": DEFAULT_EMBEDDING_MODEL, "model_dimensions": None,
+            "dimensions": None, "truncated": False, "storage": "float32"}
+    path = os.path.join(faiss_database, INDEX_META_FILE)
+    if os.path.exists(path):
+        with open(path) as f:
+            meta.update(json.load(f))
+    return meta
+
+
+def write_index_meta(faiss_database: str, **meta):
+    with open(os.path.join(faiss_database, INDEX_META_FILE), "w") as f:
+        json.dump({**read_index_meta(faiss_database), **meta}, f, indent=2)
+
+
+def truncate(vectors: np.ndarray, dimensions: int) -> np.ndarray:
+    """Keep the first ``dimensions`` components and renormalise each row."""
+    vectors = np.ascontiguousarray(vectors[:, :dimensions], dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class TruncatedEmbeddings(Embeddings):
+    """Embeddings cut to the first ``dimensions`` components and renormalised."""
+
+    def __init__(self, embeddings: Embeddings, dimensions: int):
+        self.embeddings = embeddings
+        self.dimensions = dimensions
+
+    def _truncate(self, vectors: List[List[float]]) -> List[List[float]]:
+        return truncate(np.asarray(vectors, dtype=np.float32), self.dimensions).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._truncate(self.embeddings.embed_documents(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._truncate([self.embeddings.embed_query(text)])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._truncate(await self.embeddings.aembed_documents(texts))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return self._truncate([await self.embeddings.aembed_query(text)])[0]
+
+
+def make_index(vectors: np.ndarray, storage: str = "float32", metric: Optional[int] = None):
+    """A flat FAISS index over ``vectors`` with the requested storage."""
+    import faiss
+
+    metric = faiss.METRIC_L2 if metric is None else metric
+    dim = vectors.shape[1]
+    if storage == "float32":
+        index = faiss.IndexFlat(dim, metric)
+    elif storage == "float16":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16, metric)
+    elif storage == "sq8":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, metric)
+    else:
+        raise ValueError(f"unknown vector storage {storage!r}, expected one of {STORAGES}")
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+def compress_index(faiss_database: str, output_dir: str, dimensions: Optional[int] = None,
+                   storage: str = "float32") -> dict:
+    """Rewrite a saved index with truncated vectors and/or compressed storage.
+
+    Args:
+        faiss_database (str): index directory to read.
+        output_dir (str): directory to write, may be ``faiss_database`` itself.
+        dimensions (int, optional): keep this many components, None keeps all.
+        storage (str): "float32", "float16" or "sq8".
+
+    Returns:
+        dict: the index metadata written next to the new index.
+    """
+    import faiss
+
+    meta = read_index_meta(faiss_database)
+    index = faiss.read_index(os.path.join(faiss_database, "index.faiss"))
+    vectors = index.reconstruct_n(0, index.ntotal)
+    truncated = meta["truncated"]
+    if dimensions is not None and dimensions < index.d:
+        vectors = truncate(vectors, dimensions)
+        truncated = True
+    compressed = make_index(vectors, storage, index.metric_type)
+
+    # the summary tree's vectors have the old width, rebuild it after truncating
+    stale = {SUMMARY_TREE_FILE} if compressed.d != index.d else set()
+    os.makedirs(output_dir, exist_ok=True)
+    if os.path.abspath(output_dir) != os.path.abspath(faiss_database):
+        shutil.copy(os.path.join(faiss_database, "index.pkl"), output_dir)
+        for name in os.listdir(faiss_database):
+            if name.endswith(".npz") and name not in stale:  # reference graph, router
+                shutil.copy(os.path.join(faiss_database, name), output_dir)
+    for name in stale:
+        path = os.path.join(output_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+            logger.info(f"Dropped {name}, rebuild it with `python -m src.bot.summary_tree`")
+    faiss.write_index(compressed, os.path.join(output_dir, "index.faiss"))
+    meta.update(dimensions=compressed.d, truncated=truncated, storage=storage)
+    write_index_meta(output_dir, **meta)
+    logger.info(f"Wrote {compressed.ntotal} vectors of {compressed.d} dims as {storage} "
+                f"to {output_dir}")
+    return meta
+
+
+def store_index(vector_store, faiss_database: str,
+                embedding_model: str = DEFAULT_EMBEDDING_MODEL,
+                model_dimensions: Optional[int] = None, storage: str = "float32") -> dict:
+    """Save a freshly ingested float32 store with its metadata, then compress it.
+
+    Args:
+        vector_store (FAISS): the ingested store.
+        faiss_database (str): directory to write.
+        embedding_model (str): model the chunks were embedded with.
+        model_dimensions (int, optional): the model's ``dimensions`` option.
+        storage (str): "float32", "float16" or "sq8".
+
+    Returns:
+        dict: the index metadata written next to the index.
+    """
+    if storage not in STORAGES:
+        raise ValueError(f"unknown vector storage {storage!r}, expected one of {STORAGES}")
+    vector_store.save_local(faiss_database)
+    meta = {"embedding_model": embedding_model, "model_dimensions": model_dimensions,
+            "dimensions": vector_store.index.d, "truncated": False, "storage": "float32"}
+    write_index_meta(faiss_database, **meta)
+    if storage == "float32":
+        return meta
+    return compress_index(faiss_database, faiss_database, storage=storage)
+
+
+def query_embeddings(meta: dict, embeddings: Optional[Embeddings] = None) -> Embeddings:
+    """Query embeddings matching how the index described by ``meta`` was built."""
+    if embeddings is None:
+        from langchain_openai import OpenAIEmbeddings
+        embeddings = OpenAIEmbeddings(model=meta["embedding_model"],
+                                      dimensions=meta["model_dimensions"])
+    if meta["truncated"]:
+        embeddings = TruncatedEmbeddings(embeddings, meta["dimensions"])
+    return embeddings
+
+
+if __name__ == "__main__":
+    from src.profiling import profile
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Truncate and/or compress a FAISS index")
+    parser.add_argument("faiss_database")
+    parser.add_argument("output_dir")
+    parser.add_argument("--dimensions", type=int)
+    parser.add_argument("--storage", choices=STORAGES, default="float32")
+    parser.add_argument("--profile", action="store_true",
+                        help="write a cProfile capture to PROFILE_DIR")
+    args = parser.parse_args()
+    with profile("compress", args.faiss_database, force=args.profile):
+        compress_index(args.faiss_database, args.output_dir, args.dimensions, args.storage)
@@ -0,0 +1,210 @@
+"""
+Query log and cache warm-up.
+
+Every answered question is appended to ``QUERY_LOG`` as one compact JSON line:
+normalized question, specialty, latency, whether its embedding was cached and the
+docstore ids retrieved. After a deploy or restart, ``warm_up`` replays the example
+questions and the ``WARMUP_TOP_N`` most asked logged ones through embedding,
+retrieval and reference resolution (and generation with ``WARMUP_GENERATE``) before
+the knowledge base is reported ready, so the first users do not pay for cold caches.
+
+    python -m src.bot.warmup top --log logs/queries.jsonl --top 20
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from src import config
+from src.bot.singleflight import normalize_question
+from src.metrics import inc, observe
+
+logger = logging.getLogger(__name__)
+
+
+class QuestionCache:
+    """Bounded LRU cache of question embeddings, keyed by the normalized question.
+
+    Args:
+        max_size (int): embeddings kept, 0 disables the cache.
+    """
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._embeddings = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, question: str) -> Optional[np.ndarray]:
+        key = normalize_question(question)
+        with self._lock:
+            embedding = self._embeddings.get(key)
+            if embedding is not None:
+                self._embeddings.move_to_end(key)
+        inc("medibot_cache_hits_total" if embedding is not None else
+            "medibot_cache_misses_total", cache="question_embedding")
+        return embedding
+
+    def put(self, question: str, embedding):
+        if not self.max_size:
+            return
+        key = normalize_question(question)
+        # float32 arrays take a quarter of the memory of a list of Python floats
+        embedding = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            self._embeddings[key] = embedding
+            self._embeddings.move_to_end(key)
+            while len(self._embeddings) > self.max_size:
+                self._embeddings.popitem(last=False)
+
+    def __contains__(self, question: str) -> bool:
+        with self._lock:
+            return normalize_question(question) in self._embeddings
+
+    def __len__(self) -> int:
+        return len(self._embeddings)
+
+    @property
+    def nbytes(self) -> int:
+        with self._lock:
+            return sum(embedding.nbytes for embedding in self._embeddings.values())
+
+
+class QueryLog:
+    """Append-only log of answered questions, "" as path disables it."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+
+    def record(self, question: str, specialty: Optional[str], seconds: float,
+               hit: bool, docs: Iterable):
+        if not self.path:
+            return
+        entry = {"t": int(time.time()), "q": normalize_question(question),
+                 "ms": round(seconds * 1000), "hit": int(hit),
+                 "ids": [doc.id for doc in docs if getattr(doc, "id", None) is not None]}
+        if specialty is not None:
+            entry["s"] = specialty
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n"
+        try:
+            with self._lock:
+                if self._file is None:
+                    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                    self._file = open(self.path, "a", encoding="utf-8")
+                self._file.write(line)
+                self._file.flush()
+        except OSError as e:
+            # losing a log line must not fail the question
+            logger.warning(f"Could not append to query log {self.path}: {e}")
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def read_log(path: str) -> Iterator[dict]:
+    """Entries of a query log, skipping a line cut short by a crash."""
+    if not path or not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def top_questions(path: str, n: int) -> List[Tuple[str, Optional[str], int]]:
+    """The ``n`` most asked ``(question, specialty, count)`` of a query log."""
+    counts = Counter((entry["q"], entry.get("s")) for entry in read_log(path))
+    return [(question, specialty, count)
+            for (question, specialty), count in counts.most_common(n)]
+
+
+def warm_up(bot, questions: Iterable[Tuple[str, Optional[str]]],
+            generate: bool = False) -> dict:
+    """Replay ``(question, specialty)`` pairs through ``bot`` to fill its caches.
+
+    Args:
+        bot (Medibot): bot on the knowledge base to warm up.
+        questions (Iterable[Tuple[str, Optional[str]]]): questions to replay,
+            repeated ones are replayed once.
+        generate (bool): also generate the answers, warming the Groq connections.
+
+    Returns:
+        dict: questions replayed, failures and seconds taken.
+    """
+    start = time.perf_counter()
+    seen, failed = set(), 0
+    for question, specialty in questions:
+        key = (normalize_question(question), specialty)
+        if key in seen:
+            continue
+        seen.add(key)
+        try:
+            docs = bot.retrieve(question, specialty)
+            bot.resolve_references(docs)
+            if generate:
+                bot.generate(question, docs)
+        except Exception as e:
+            failed += 1
+            logger.warning(f"Warm-up of {question!r} failed: {e}")
+    seconds = time.perf_counter() - start
+    inc("medibot_warmup_questions_total", len(seen) - failed, status="ok")
+    inc("medibot_warmup_questions_total", failed, status="failed")
+    observe("medibot_warmup_seconds", seconds)
+    logger.info(f"Warmed up {len(seen) - failed}/{len(seen)} questions in {seconds:.1f}s")
+    return {"questions": len(seen), "failed": failed, "seconds": seconds,
+            "generated": generate}
+
+
+def warm_up_knowledge_base(knowledge_base, examples: Iterable[str] = ()) -> dict:
+    """Warm up with ``examples`` and the ``WARMUP_TOP_N`` most asked logged questions."""
+    from src.bot.bot import Medibot
+
+    questions = [(question, None) for question in examples]
+    questions += [(question, specialty) for question, specialty, _
+                  in top_questions(config.QUERY_LOG, config.WARMUP_TOP_N)]
+    api_key = config.WARMUP_API_KEY or os.environ.get("GROQ_API_KEY")
+    generate = config.WARMUP_GENERATE and bool(api_key)
+    if config.WARMUP_GENERATE and not api_key:
+        logger.warning("WARMUP_GENERATE needs WARMUP_API_KEY or GROQ_API_KEY, "
+                       "warming up retrieval only")
+    # retrieval does not call Groq, the key is only checked for being present
+    bot = Medibot(knowledge_base=knowledge_base, api_key=api_key or "warmup",
+                  coalesce="off")
+    return warm_up(bot, questions, generate)
+
+
+query_log = QueryLog(config.QUERY_LOG)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect the query log.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    top = subparsers.add_parser("top", help="most asked questions and their hit rate")
+    top.add_argument("--log", default=config.QUERY_LOG)
+    top.add_argument("--top", type=int, default=config.WARMUP_TOP_N)
+    args = parser.parse_args()
+
+    entries = list(read_log(args.log))
+    if not entries:
+        print(f"No queries logged in {args.log!r}")
+        return
+    hits = sum(entry["hit"] for entry in entries)
+    print(f"{len(entries)} queries, embedding cache hit rate {hits / len(entries):.1%}")
+    for question, specialty, count in top_questions(args.log, args.top):
+        print(f"{count:6d}  {question}" + (f"  [{specialty}]" if specialty else ""))
+
+
+if __name__ == "__main__":
+    main()
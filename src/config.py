@@ -2,4 +2,119 @@ import os
 
 DB_PATH = os.getenv("DB_PATH", "users.db")
 
-api_key = None
\ No newline at end of file
+api_key = None
+
+# bcrypt cost factor and the number of worker threads allowed to hash at once
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", "4"))
+
+# signed session tokens issued after a successful login
+SESSION_SECRET = os.getenv("SESSION_SECRET")
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(7 * 24 * 3600)))
+
+# users database connection pool
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", "5.0"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))
+
+# Groq endpoint (None uses the SDK default) and API key validation cache lifetimes
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL")
+KEY_VALIDATION_TTL = float(os.getenv("KEY_VALIDATION_TTL", "3600"))
+KEY_VALIDATION_NEGATIVE_TTL = float(os.getenv("KEY_VALIDATION_NEGATIVE_TTL", "300"))
+KEY_VALIDATION_CACHE_SIZE = int(os.getenv("KEY_VALIDATION_CACHE_SIZE", "4096"))
+
+# query path metrics, served as Prometheus text on METRICS_PORT when set (which also
+# turns them on)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0").lower() in ("1", "true", "yes")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Gradio queue workers shared by all users, and questions one user may have in flight
+QUEUE_CONCURRENCY = int(os.getenv("QUEUE_CONCURRENCY", "8"))
+QUEUE_MAX_SIZE = int(os.getenv("QUEUE_MAX_SIZE", "256"))
+# seconds a login waits for the knowledge base still loading before asking to retry
+LOGIN_LOAD_WAIT = float(os.getenv("LOGIN_LOAD_WAIT", "5"))
+USER_MAX_IN_FLIGHT = int(os.getenv("USER_MAX_IN_FLIGHT", "2"))
+
+# keep-alive HTTP clients per Groq API key
+GROQ_MAX_CONNECTIONS = int(os.getenv("GROQ_MAX_CONNECTIONS", "20"))
+GROQ_MAX_KEEPALIVE = int(os.getenv("GROQ_MAX_KEEPALIVE", "10"))
+GROQ_KEEPALIVE_EXPIRY = float(os.getenv("GROQ_KEEPALIVE_EXPIRY", "30"))
+GROQ_CLIENT_IDLE_TTL = float(os.getenv("GROQ_CLIENT_IDLE_TTL", "600"))
+
+# query embedding micro-batching, EMBED_BATCH_SIZE=1 turns it off
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", "5"))
+
+# prompt context assembly, CONTEXT_TOKEN_BUDGET=0 sends every retrieved chunk
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_DEDUPE_THRESHOLD = float(os.getenv("CONTEXT_DEDUPE_THRESHOLD", "0.9"))
+
+# routed index shards, built with `python -m src.bot.shards`; empty uses the single index
+SHARDS_DATABASE = os.getenv("SHARDS_DATABASE", "")
+ROUTER_TOP_SHARDS = int(os.getenv("ROUTER_TOP_SHARDS", "3"))
+
+# single-file index bundle, built with `python -m src.bot.bundle build`
+INDEX_BUNDLE = os.getenv("INDEX_BUNDLE", "")
+BUNDLE_VERIFY = os.getenv("BUNDLE_VERIFY", "1").lower() in ("1", "true", "yes")
+
+# headless HTTP service (python -m src.service)
+SERVICE_HOST = os.getenv("SERVICE_HOST", "0.0.0.0")
+SERVICE_PORT = int(os.getenv("SERVICE_PORT", "8080"))
+# bots kept by API key (least recently used ones are rebuilt), LLM calls per batch
+SERVICE_BOT_CACHE_SIZE = int(os.getenv("SERVICE_BOT_CACHE_SIZE", "256"))
+SERVICE_MAX_BATCH_CONCURRENCY = int(os.getenv("SERVICE_MAX_BATCH_CONCURRENCY", "16"))
+
+# on-demand profiling, PROFILE_SAMPLE_RATE=0 profiles only flagged requests
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+
+# memory budgets in MB, 0 disables a budget; "session" applies to each chat session
+MEMORY_BUDGET_FAISS_MB = float(os.getenv("MEMORY_BUDGET_FAISS_MB", "0"))
+MEMORY_BUDGET_DOCSTORE_MB = float(os.getenv("MEMORY_BUDGET_DOCSTORE_MB", "0"))
+MEMORY_BUDGET_METADATA_MB = float(os.getenv("MEMORY_BUDGET_METADATA_MB", "0"))
+MEMORY_BUDGET_SESSION_MB = float(os.getenv("MEMORY_BUDGET_SESSION_MB", "0"))
+MEMORY_BUDGET_TOTAL_MB = float(os.getenv("MEMORY_BUDGET_TOTAL_MB", "0"))
+# "warn" logs exceeded budgets, "refuse" fails loading the knowledge base: the process
+# keeps running but never becomes ready (/readyz stays 503, queries get 503)
+MEMORY_BUDGET_ACTION = os.getenv("MEMORY_BUDGET_ACTION", "warn").lower()
+
+# share identical questions in flight: "key" per API key, "global" across all users
+# (one user's key then pays for everyone's answer), "off"
+COALESCE_QUERIES = os.getenv("COALESCE_QUERIES", "key").lower()
+
+# end-to-end deadline of one question in seconds (0 disables), LLM attempts within it
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "60"))
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+
+# per-key Groq pacing (0 requests per minute disables the bucket), circuit breaker and
+# the model used while the primary one is throttled ("" disables the fallback)
+GROQ_REQUESTS_PER_MINUTE = float(os.getenv("GROQ_REQUESTS_PER_MINUTE", "30"))
+GROQ_BURST = int(os.getenv("GROQ_BURST", "10"))
+GROQ_BREAKER_FAILURES = int(os.getenv("GROQ_BREAKER_FAILURES", "5"))
+GROQ_BREAKER_RESET = float(os.getenv("GROQ_BREAKER_RESET", "30"))
+GROQ_THROTTLE_CACHE_SIZE = int(os.getenv("GROQ_THROTTLE_CACHE_SIZE", "4096"))
+GROQ_RATE_LIMIT_MAX_WAIT = float(os.getenv("GROQ_RATE_LIMIT_MAX_WAIT", "10"))
+GROQ_FALLBACK_MODEL = os.getenv("GROQ_FALLBACK_MODEL", "")
+
+# append-only query log ("" disables it), cached question embeddings and the warm-up
+# replaying the example and the most asked logged questions before reporting ready
+QUERY_LOG = os.getenv("QUERY_LOG", "")
+QUESTION_CACHE_SIZE = int(os.getenv("QUESTION_CACHE_SIZE", "1024"))
+WARMUP_ON_START = os.getenv("WARMUP_ON_START", "true").lower() in ("1", "true", "yes")
+WARMUP_TOP_N = int(os.getenv("WARMUP_TOP_N", "20"))
+WARMUP_GENERATE = os.getenv("WARMUP_GENERATE", "false").lower() in ("1", "true", "yes")
+WARMUP_API_KEY = os.getenv("WARMUP_API_KEY", "")
+
+# chunks kept per question: "fixed" (k=10), or chosen between RETRIEVAL_MIN_K and
+# RETRIEVAL_MAX_K from the distances by "elbow" or "relative" (within the margin)
+RETRIEVAL_DEPTH = os.getenv("RETRIEVAL_DEPTH", "fixed").lower()
+RETRIEVAL_MIN_K = int(os.getenv("RETRIEVAL_MIN_K", "3"))
+RETRIEVAL_MAX_K = int(os.getenv("RETRIEVAL_MAX_K", "10"))
+RETRIEVAL_RELATIVE_MARGIN = float(os.getenv("RETRIEVAL_RELATIVE_MARGIN", "0.25"))
+
+# search through the summary tree saved next to the index (if it was built), nodes
+# expanded per level
+SUMMARY_TREE_SEARCH = os.getenv("SUMMARY_TREE_SEARCH", "true").lower() in ("1", "true", "yes")
+SUMMARY_TREE_BEAM = int(os.getenv("SUMMARY_TREE_BEAM", "4"))
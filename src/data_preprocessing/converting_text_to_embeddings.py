@@ -1,21 +1,33 @@
 # This module is responsible for converting text data into embeddings using the 
 # OpenAI API and storing in Faiss database.
+#
+#   python -m src.data_preprocessing.converting_text_to_embeddings \
+#       dataset/converted_json_docs --dimensions 1024 --storage sq8
 
+import argparse
+import os
 import faiss
 import tiktoken
 from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
 from langchain_openai import OpenAIEmbeddings
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 from uuid import uuid4
 from dotenv import load_dotenv
 import logging
 # other imports
-from dataloader import dataloader
+from src.bot.ref_graph import build_for_index
+from src.bot.vectors import STORAGES, store_index
+from src.data_preprocessing.dataloader import dataloader
+from src.profiling import profile
+
+EMBEDDING_MODEL = "text-embedding-3-large"
 
 logging.basicConfig(level=logging.INFO)
 
-def main(folder_path: str)-> None:
+def main(folder_path: str, dimensions: Optional[int] = None,
+         storage: str = "float32", faiss_database: str = "faiss_index",
+         metadata_database: str = "database/metadata.csv")-> None:
     """
     Main function to convert text data into embeddings and store them in a Faiss database.
     The function uses the OpenAI API to generate embeddings and the Faiss library 
@@ -23,12 +35,17 @@ def main(folder_path: str)-> None:
 
     Args:
         folder_path (str): path to the folder containing the data files.
+        dimensions (int, optional): shorter vectors through the model's dimensions
+            option, None keeps the native 3072.
+        storage (str): "float32", "float16" or "sq8" vector storage.
+        faiss_database (str): directory the index is saved to.
+        metadata_database (str): table/picture metadata the reference graph links to.
     """
     logging.info("Loading environment variables...")
     load_dotenv()  # Load environment variables from .env file
     logging.info("Environment variables loaded.")
     logging.info("Loading OpenAI embeddings...")
-    embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
+    embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL, dimensions=dimensions)
     logging.info("OpenAI embeddings loaded.")
     logging.info("Creating Faiss index...")
 
@@ -49,8 +66,10 @@ def main(folder_path: str)-> None:
     # Load the data
     chunks_list, _, _, _ = dataloader(folder_path)
     logging.info(f"Loaded {len(chunks_list)} chunks from folder: {folder_path}")
-    # calculte the number of tokens
-    total_tokens = sum(len(enc.encode(doc.page_content)) for doc in chunks_list)
+    # calculte the number of tokens, stored per chunk for the prompt token budget
+    for doc in chunks_list:
+        doc.metadata["token_count"] = len(enc.encode(doc.page_content))
+    total_tokens = sum(doc.metadata["token_count"] for doc in chunks_list)
     cost = (total_tokens / 1000000) * 0.13
     logging.info(f"Total tokens: {total_tokens}")
     logging.info(f"Estimated cost of using text-embedding-3-large: ${cost:.2f}")
@@ -69,13 +88,31 @@ def main(folder_path: str)-> None:
     uuids = [str(uuid4()) for _ in range(len(chunks_list))]
     vector_store.add_documents(documents=chunks_list, ids=uuids)
     logging.info("Text data converted to embeddings and stored in Faiss index.")
-    vector_store.save_local("faiss_index")
-    logging.info("Faiss index saved to local storage.")
+    # index_meta.json next to the index configures the query embeddings
+    store_index(vector_store, faiss_database, EMBEDDING_MODEL, dimensions, storage)
+    logging.info(f"Faiss index saved to {faiss_database} as {storage}.")
+    # the bot answers without it, but cannot follow figure and table references
+    if os.path.exists(metadata_database):
+        build_for_index(faiss_database, metadata_database)
+    else:
+        logging.warning(f"{metadata_database} not found, build the reference graph with: "
+                        f"python -m src.bot.ref_graph {faiss_database} <metadata.csv>")
 
 
 if __name__ == "__main__":
-    folder_path = "dataset/converted_json_docs"
-    main(folder_path)
+    parser = argparse.ArgumentParser(description="Embed the converted documents into FAISS")
+    parser.add_argument("folder_path", nargs="?", default="dataset/converted_json_docs")
+    parser.add_argument("--output", default="faiss_index", help="index directory")
+    parser.add_argument("--dimensions", type=int,
+                        help="shorter vectors through the model's dimensions option")
+    parser.add_argument("--storage", choices=STORAGES, default="float32")
+    parser.add_argument("--metadata-database", default="database/metadata.csv")
+    parser.add_argument("--profile", action="store_true",
+                        help="write a cProfile capture to PROFILE_DIR")
+    args = parser.parse_args()
+    with profile("ingest", args.folder_path, force=args.profile):
+        main(args.folder_path, args.dimensions, args.storage, args.output,
+             args.metadata_database)
 
 
 
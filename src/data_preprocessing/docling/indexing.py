@@ -1,5 +1,6 @@
 """
-create chunks and create clusters usign raptor architecture.
+create chunks of the converted documents. The raptor clusters over them are built
+after ingestion by ``src.bot.summary_tree``.
 """
 
 import json
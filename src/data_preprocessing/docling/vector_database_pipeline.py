@@ -1,7 +1,11 @@
 """
 To preprocess the data and create a vector database using docling and langchain, 
 openai embeddings.
+
+    python -m src.data_preprocessing.docling.vector_database_pipeline book.md \
+        --dimensions 1024 --storage sq8
 """
+import argparse
 import getpass
 import os
 from dotenv import load_dotenv
@@ -9,6 +13,7 @@ import itertools
 from uuid import uuid4
 
 import faiss
+import tiktoken
 from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
 
@@ -25,6 +30,10 @@ from langchain_core.documents import Document
 
 import logging
 
+from src.bot.ref_graph import build_for_index
+from src.bot.vectors import DEFAULT_EMBEDDING_MODEL, STORAGES, store_index
+from src.profiling import profile
+
 load_dotenv()
 
 def adding_metadata_chunks(chunks: HybridChunker, file_name: str, speciality: str) -> list[Document]:
@@ -120,19 +129,25 @@ def dataloader(file_path:str, embeddings_model:str) -> list[Document]:
     return documents
 
 
-def create_vector_database(documents: list[Document]) -> FAISS:
-    """Create a vector database from the documents.
+def create_vector_database(documents: list[Document], faiss_database: str = "faiss_index",
+                           dimensions: int = None, storage: str = "float32",
+                           metadata_database: str = "database/metadata.csv") -> FAISS:
+    """Create a vector database from the documents and save it.
 
     Args:
-        file_path (str): The path to the document file.
-        embeddings_model (str): The model name for embeddings.
+        documents (list[Document]): chunks to embed.
+        faiss_database (str): directory the index is saved to.
+        dimensions (int, optional): shorter vectors through the model's dimensions
+            option, None keeps the native 3072.
+        storage (str): "float32", "float16" or "sq8" vector storage.
+        metadata_database (str): table/picture metadata the reference graph links to.
 
     Returns:
-        list[Document]: A list of Document objects with embeddings.
+        FAISS: the float32 vector store that was saved.
     """
 
     logging.info("Creating the vector database...")
-    embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
+    embeddings = OpenAIEmbeddings(model=DEFAULT_EMBEDDING_MODEL, dimensions=dimensions)
     index = faiss.IndexFlatL2(len(embeddings.embed_query("hello world")))
     vector_store = FAISS(
                         embedding_function=embeddings,
@@ -140,19 +155,48 @@ def create_vector_database(documents: list[Document]) -> FAISS:
                         docstore=InMemoryDocstore(),
                         index_to_docstore_id={},
                     )
+    # token counts for the prompt token budget, so queries never re-tokenize chunks
+    enc = tiktoken.get_encoding("cl100k_base")
+    for document in documents:
+        document.metadata["token_count"] = len(enc.encode(document.page_content))
     uuids = [str(uuid4()) for _ in range(len(documents))]
     vector_store.add_documents(documents=documents, ids=uuids)
-    logging.info("Vector database created successfully.")
+    # index_meta.json next to the index configures the query embeddings
+    store_index(vector_store, faiss_database, DEFAULT_EMBEDDING_MODEL, dimensions, storage)
+    logging.info(f"Vector database saved to {faiss_database} as {storage}.")
+    # the bot answers without it, but cannot follow figure and table references
+    if os.path.exists(metadata_database):
+        build_for_index(faiss_database, metadata_database)
+    else:
+        logging.warning(f"{metadata_database} not found, build the reference graph with: "
+                        f"python -m src.bot.ref_graph {faiss_database} <metadata.csv>")
+    return vector_store
 
     
-def main(file_path:str, embeddings_model:str) -> FAISS:
+def main(file_path:str, embeddings_model:str, faiss_database: str = "faiss_index",
+         dimensions: int = None, storage: str = "float32",
+         metadata_database: str = "database/metadata.csv") -> FAISS:
     logging.basicConfig(level=logging.INFO)
     logger = logging.getLogger(__name__)
     documents = dataloader(file_path, embeddings_model)
-    create_vector_database(documents)
+    return create_vector_database(documents, faiss_database, dimensions, storage,
+                                  metadata_database)
 
 
 if __name__ == "__main__":
-    file_path = r"converted\ROBBINS-&-COTRAN-PATHOLOGIC-BASIS-OF-DISEASE-10TH-ED-with-image-refs.md"
-    embeddings_model = "ibm-granite/granite-embedding-125m-english"
-    main(file_path, embeddings_model)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Chunk a converted book and embed it into FAISS")
+    parser.add_argument("file_path", nargs="?",
+                        default=r"converted\ROBBINS-&-COTRAN-PATHOLOGIC-BASIS-OF-DISEASE-10TH-ED-with-image-refs.md")
+    parser.add_argument("--embeddings-model", default="ibm-granite/granite-embedding-125m-english",
+                        help="tokenizer of the hybrid chunker")
+    parser.add_argument("--output", default="faiss_index", help="index directory")
+    parser.add_argument("--dimensions", type=int,
+                        help="shorter vectors through the model's dimensions option")
+    parser.add_argument("--storage", choices=STORAGES, default="float32")
+    parser.add_argument("--metadata-database", default="database/metadata.csv")
+    parser.add_argument("--profile", action="store_true",
+                        help="write a cProfile capture to PROFILE_DIR")
+    args = parser.parse_args()
+    with profile("ingest", args.file_path, force=args.profile):
+        main(args.file_path, args.embeddings_model, args.output, args.dimensions,
+             args.storage, args.metadata_database)
\ No newline at end of file
@@ -1,16 +1,11 @@
-import os
 import base64
 import io
-from PIL import Image
+from typing import Optional
 import gradio as gr
-from src.bot.bot import Medibot
-from bs4 import BeautifulSoup
-import markdown
-from src.auth.auth import register_user, login_user
+from src.auth.auth import ahandle_login as auth_handle_login
 from src.auth.db import initialize_db
-from groq import Groq
-
-from src import config
+from src.auth.validation import validate_groq_api_key
+from src.metrics import span
 
 
 #======================================
@@ -18,13 +13,20 @@ from src import config
 #======================================
 
 # Helper functions
+# markdown, bs4, PIL and the bot stack are imported where they are used so the UI
+# can render before they are loaded
 def markdown_to_plain_text(md_text: str) -> str:
+    import markdown
+    from bs4 import BeautifulSoup
+
     html = markdown.markdown(md_text)
     soup = BeautifulSoup(html, "html.parser")
     return soup.get_text()
 
 # Ensure base64 strings are properly formatted (no newlines/whitespace)
 def decode_base64_to_image(base64_string):
+    from PIL import Image
+
     # Clean the string before decoding
     base64_string = base64_string.replace("\n", "").replace(" ", "")
     image_data = base64.b64decode(base64_string)
@@ -33,57 +35,24 @@ def decode_base64_to_image(base64_string):
 
 # Step 1: API Key Validation Logic
 def validate_api_key(user_api_key):
-    global api_key
+    # Only checks the key, it is never stored in the process environment or a global
+    # where other users' sessions would pick it up
     if not user_api_key:
         return "❌ Please enter your Groq Cloud API key.", gr.update(visible=True), gr.update(visible=False)
 
-    try:
-        client = Groq(api_key=user_api_key)
-        response = client.chat.completions.create(
-            messages=[{"role": "user", "content": "Hello"}],
-            model="llama3-70b-8192"
-        )
-
-        api_key = user_api_key
-        os.environ["GROQ_API_KEY"] = api_key
-
-        return "✅ API key is valid and saved!", gr.update(visible=False), gr.update(visible=True)
+    is_valid, reason = validate_groq_api_key(user_api_key)
+    if not is_valid:
+        return f"❌ Invalid API key: {reason}", gr.update(visible=True), gr.update(visible=False)
 
-    except Exception as e:
-        return f"❌ Invalid API key: {str(e)}", gr.update(visible=True), gr.update(visible=False)
+    return "✅ API key is valid!", gr.update(visible=False), gr.update(visible=True)
     
-def handle_login(userid, password, user_api_key):
-    if user_api_key:
-        # Step 1: Validate API Key first
-        try:
-            client = Groq(api_key=user_api_key)
-            response = client.chat.completions.create(
-                messages=[{"role": "user", "content": "Hello"}],
-                model="llama3-70b-8192"
-            )
-
-            # If API key is valid, proceed to register
-            success, msg = register_user(userid, password, user_api_key)
-            if success:
-                config.api_key = user_api_key
-                os.environ["GROQ_API_KEY"] = user_api_key
-                return "✅ API Key validated & registered!", gr.update(visible=False), gr.update(visible=True)
-            else:
-                return msg, gr.update(visible=True), gr.update(visible=False)
-
-        except Exception as e:
-            # API key invalid
-            return f"❌ Invalid API Key: {str(e)}", gr.update(visible=True), gr.update(visible=False)
-
-    else:
-        # User is trying to login
-        success, saved_api_key = login_user(userid, password)
-        if success:
-            config.api_key = saved_api_key
-            os.environ["GROQ_API_KEY"] = saved_api_key
-            return "✅ Login successful!", gr.update(visible=False), gr.update(visible=True)
-        else:
-            return "❌ Incorrect userid or password.", gr.update(visible=True), gr.update(visible=False)
+async def handle_login(userid, password, user_api_key):
+    # The API key is handed back to the caller for its session, it is never stored
+    # in the process environment where other users would pick it up
+    login_status, api_key = await auth_handle_login(userid, password, user_api_key)
+    if api_key is None:
+        return login_status, gr.update(visible=True), gr.update(visible=False), None
+    return login_status, gr.update(visible=False), gr.update(visible=True), api_key
 
 
 #======================================
@@ -91,52 +60,60 @@ def handle_login(userid, password, user_api_key):
 #======================================
 
 class Interface:
-    def __init__(self, config_path: str = "src/bot/configs/prompt.toml",
+    def __init__(self, config_path: Optional[str] = None,
                  metadata_database: str = "database/metadata.csv",
-                 faiss_database: str = "database/faiss_index"):
-        
+                 faiss_database: str = "database/faiss_index",
+                 **bot_kwargs):
+        from src.bot.bot import Medibot
+
         self.bot = Medibot(config_path = config_path,
                       metadata_database = metadata_database,
                       faiss_database = faiss_database,
+                      **bot_kwargs,
                       )
     
-    def get_answer(self, question: str):
+    def get_answer(self, question: str, specialty: Optional[str] = None):
         try:
-            answer_md, retrieved_docs, refered_tables, refered_images = self.bot.query(question)
-
-            # Convert answer to markdown display
-            answer_display = answer_md
-
-            # Format referenced tables as markdown
-            tables_display = "### Referenced Tables:\n\n"
-            if refered_tables:
-                for table_name, table_content in refered_tables.items():
-                    tables_display += f"{table_content}\n\n"
-            else:
-                tables_display += "_No tables referenced._"
-
-            # Decode images
-            # Format images as markdown (base64)
-            images_display = []
-            if refered_images:
-                for image_name, base64_string in refered_images.items():
-                    data_uri = f"data:image/png;base64,{base64_string}"
-                    images_display.append(f'![]({data_uri})')  # Markdown embedding for images
-            else:
-                images_display = None
-
-            # Combine retrieved document texts
-            retrieved_display = "### Retrieved Documents:\n\n"
-            if retrieved_docs:
-                for i, doc in enumerate(retrieved_docs):
-                    retrieved_display += f"**Doc {i+1}:**\n{doc.page_content}\n\n"
-            else:
-                retrieved_display += "_No documents retrieved._"
-
-            return answer_display, tables_display, images_display, retrieved_display
+            answer_md, retrieved_docs, refered_tables, refered_images = \
+                self.bot.query(question, specialty)
+            return self.format_answer(answer_md, retrieved_docs, refered_tables, refered_images)
 
         except Exception as e:
             return f"Error: {str(e)}", "", [], ""
 
-        
-        
\ No newline at end of file
+    def format_answer(self, answer_md, retrieved_docs, refered_tables, refered_images):
+        with span("format"):
+            return self._format_answer(answer_md, retrieved_docs, refered_tables,
+                                       refered_images)
+
+    def _format_answer(self, answer_md, retrieved_docs, refered_tables, refered_images):
+        # Convert answer to markdown display
+        answer_display = answer_md
+
+        # Format referenced tables as markdown
+        tables_display = "### Referenced Tables:\n\n"
+        if refered_tables:
+            for table_name, table_content in refered_tables.items():
+                tables_display += f"{table_content}\n\n"
+        else:
+            tables_display += "_No tables referenced._"
+
+        # Decode images
+        # Format images as markdown (base64)
+        images_display = []
+        if refered_images:
+            for image_name, base64_string in refered_images.items():
+                data_uri = f"data:image/png;base64,{base64_string}"
+                images_display.append(f'![]({data_uri})')  # Markdown embedding for images
+        else:
+            images_display = None
+
+        # Combine retrieved document texts
+        retrieved_display = "### Retrieved Documents:\n\n"
+        if retrieved_docs:
+            for i, doc in enumerate(retrieved_docs):
+                retrieved_display += f"**Doc {i+1}:**\n{doc.page_content}\n\n"
+        else:
+            retrieved_display += "_No documents retrieved._"
+
+        return answer_display, tables_display, images_display, retrieved_display
@@ -0,0 +1,273 @@
+"""
+Memory accounting of the serving process.
+
+``memory_report`` sizes the major structures of a loaded knowledge base, the FAISS
+vectors, the pickled docstore, the table/picture metadata frame (with the share
+taken by base64 images) and the reference graph, plus every live chat session
+without the knowledge base it shares. The report is logged when the knowledge base
+finishes loading and is served on demand by ``GET /memory`` of the HTTP service.
+
+Budgets (``MEMORY_BUDGET_*_MB``, 0 disables one) are checked against the report;
+``MEMORY_BUDGET_ACTION=refuse`` fails the background knowledge base load instead of
+warning. The process keeps running and serving the login page and health checks, but
+it never reports ready: ``/readyz`` answers 503 with the failure and queries are
+refused, so a load balancer or orchestrator takes it out of rotation.
+
+    python -m src.memory --bundle database/medibot.bundle
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import types
+from typing import Dict, Iterable, List, Optional
+
+from src import config
+
+logger = logging.getLogger(__name__)
+
+MB = 1 << 20
+# documents sized one by one before the docstore size is extrapolated
+DOCSTORE_SAMPLE = 20000
+
+_ATOMIC = (str, bytes, bytearray, int, float, complex, bool, type(None), range)
+_OPAQUE = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType,
+           types.MethodType)
+
+
+class MemoryBudgetError(RuntimeError):
+    """A structure is larger than its configured memory budget."""
+
+
+def rss_bytes() -> int:
+    """Resident set size of this process, 0 where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def deep_sizeof(obj, skip: Optional[set] = None) -> int:
+    """Bytes held by ``obj`` and everything it references.
+
+    Objects whose id is in ``skip`` are not counted nor followed, the set also
+    collects the ids already counted, so passing one set to several calls never
+    counts a shared object twice. Classes, modules and functions are not followed.
+    """
+    seen = set() if skip is None else skip
+    total = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, _OPAQUE):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, _ATOMIC):
+            continue
+        if hasattr(obj, "dtype") and hasattr(obj, "base"):
+            # numpy: getsizeof includes the buffer an array owns, views lead to it
+            if obj.base is not None:
+                stack.append(obj.base)
+            if obj.dtype == object:
+                stack.extend(obj.ravel().tolist())
+        elif isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        else:
+            attributes = getattr(obj, "__dict__", None)
+            if attributes is not None:
+                stack.append(attributes)
+            for slot in getattr(type(obj), "__slots__", ()):
+                if hasattr(obj, slot):
+                    stack.append(getattr(obj, slot))
+    return total
+
+
+def faiss_bytes(index) -> int:
+    """Bytes of the vector codes held by a FAISS index."""
+    import faiss
+
+    try:
+        return int(index.sa_code_size()) * int(index.ntotal)
+    except RuntimeError:  # index types without standalone codes
+        return int(faiss.serialize_index(index).nbytes)
+
+
+def docstore_bytes(docstore, index_to_docstore_id: Optional[dict] = None,
+                   sample: int = DOCSTORE_SAMPLE) -> tuple:
+    """Size of an ``InMemoryDocstore`` and its id mapping.
+
+    Returns:
+        tuple: (bytes, estimated), estimated is True when only ``sample`` documents
+            were sized and the total was extrapolated from them.
+    """
+    documents = docstore._dict
+    skip = set()
+    total = sys.getsizeof(documents) + deep_sizeof(index_to_docstore_id or {}, skip)
+    if len(documents) <= sample:
+        return total + deep_sizeof(list(documents.items()), skip), False
+    keys = random.Random(0).sample(list(documents), sample)
+    sampled = sum(deep_sizeof((key, documents[key]), skip) for key in keys)
+    return total + sampled * len(documents) // sample, True
+
+
+def metadata_bytes(df) -> tuple:
+    """Size of the metadata frame and of the base64 picture payloads in it."""
+    total = int(df.memory_usage(index=True, deep=True).sum())
+    pictures = df.loc[df["chunk_type"] == "picture", "page_content"]
+    return total, int(pictures.astype(str).str.len().sum())
+
+
+class MemoryReport:
+    """Sizes in bytes of the structures of one knowledge base and its sessions.
+
+    Args:
+        components (Dict[str, int]): size of each shared structure.
+        sessions (List[int]): size of each live session, shared structures excluded.
+        rss (int): resident set size of the process.
+        details (dict, optional): extra numbers, e.g. the base64 image bytes.
+        estimated (Iterable[str], optional): components extrapolated from a sample.
+    """
+
+    def __init__(self, components: Dict[str, int], sessions: List[int], rss: int,
+                 details: Optional[dict] = None, estimated: Iterable[str] = ()):
+        self.components = components
+        self.sessions = sessions
+        self.rss = rss
+        self.details = details or {}
+        self.estimated = set(estimated)
+
+    @property
+    def total(self) -> int:
+        return sum(self.components.values()) + sum(self.sessions)
+
+    def to_dict(self) -> dict:
+        return {"components": self.components, "sessions": {
+                    "count": len(self.sessions), "bytes": sum(self.sessions),
+                    "max_bytes": max(self.sessions, default=0)},
+                "total": self.total, "rss": self.rss, "details": self.details,
+                "estimated": sorted(self.estimated)}
+
+    def format(self) -> str:
+        lines = ["Memory report:"]
+        for name, size in self.components.items():
+            note = " (estimated)" if name in self.estimated else ""
+            lines.append(f"  {name:<12} {size / MB:10.1f} MB{note}")
+            if name == "metadata" and "metadata_images" in self.details:
+                lines.append(f"    base64 images {self.details['metadata_images'] / MB:.1f} MB")
+        lines.append(f"  {'sessions':<12} {sum(self.sessions) / MB:10.1f} MB "
+                     f"({len(self.sessions)} live, largest "
+                     f"{max(self.sessions, default=0) / MB:.2f} MB)")
+        lines.append(f"  {'accounted':<12} {self.total / MB:10.1f} MB of "
+                     f"{self.rss / MB:.1f} MB RSS")
+        return "\n".join(lines)
+
+
+def _vector_stores(knowledge_base) -> list:
+    store = knowledge_base.vector_store
+    return getattr(store, "shards", None) or [store]
+
+
+def memory_report(knowledge_base, sessions: Iterable = ()) -> MemoryReport:
+    """Size the structures of a loaded ``KnowledgeBase`` and the given sessions.
+
+    Args:
+        knowledge_base (KnowledgeBase): the shared, loaded knowledge base.
+        sessions (Iterable): ``UserSession`` objects or bots, each sized without the
+            knowledge base and the process-wide client pool.
+    """
+    components, details, estimated = {}, {}, set()
+    stores = _vector_stores(knowledge_base)
+    components["faiss"] = sum(faiss_bytes(store.index) for store in stores)
+
+    docstore = 0
+    for store in stores:
+        size, sampled = docstore_bytes(store.docstore, store.index_to_docstore_id)
+        docstore += size
+        if sampled:
+            estimated.add("docstore")
+    components["docstore"] = docstore
+
+    metadata = knowledge_base.metadata_extactor
+    components["metadata"], details["metadata_images"] = metadata_bytes(metadata.df)
+    # the per-column arrays of Metadata only add pointers to the frame's strings
+    components["metadata"] += metadata._chunk_types.nbytes + metadata._page_contents.nbytes
+    if knowledge_base.ref_graph is not None:
+        components["ref_graph"] = deep_sizeof(knowledge_base.ref_graph)
+    components["question_cache"] = knowledge_base.question_cache.nbytes
+    if knowledge_base.summary_tree is not None:
+        components["summary_tree"] = deep_sizeof(knowledge_base.summary_tree)
+
+    # a session's own state, without what every session shares
+    shared = {id(knowledge_base), id(knowledge_base.vector_store),
+              id(knowledge_base.embeddings), id(metadata), id(knowledge_base.ref_graph),
+              id(knowledge_base.question_cache), id(knowledge_base.summary_tree)}
+    shared.update(id(store) for store in stores)
+    from src.bot.clients import client_pool
+    shared.add(id(client_pool))
+    session_sizes = [deep_sizeof(session, set(shared)) for session in sessions]
+    return MemoryReport(components, session_sizes, rss_bytes(), details, estimated)
+
+
+def budgets() -> Dict[str, float]:
+    """Configured budgets in bytes, disabled ones left out."""
+    configured = {"faiss": config.MEMORY_BUDGET_FAISS_MB,
+                  "docstore": config.MEMORY_BUDGET_DOCSTORE_MB,
+                  "metadata": config.MEMORY_BUDGET_METADATA_MB,
+                  "session": config.MEMORY_BUDGET_SESSION_MB,
+                  "total": config.MEMORY_BUDGET_TOTAL_MB}
+    return {name: mb * MB for name, mb in configured.items() if mb > 0}
+
+
+def check_budgets(report: MemoryReport, limits: Optional[Dict[str, float]] = None,
+                  action: Optional[str] = None) -> List[str]:
+    """Compare a report with the budgets, warn or raise on the ones exceeded.
+
+    Args:
+        report (MemoryReport): sizes to check.
+        limits (Dict[str, float], optional): bytes per component, "session" applies
+            to each session and "total" to everything accounted. Defaults to the
+            configured budgets.
+        action (str, optional): "warn" or "refuse", defaults to ``MEMORY_BUDGET_ACTION``.
+
+    Returns:
+        List[str]: one message per budget exceeded.
+
+    Raises:
+        MemoryBudgetError: a budget is exceeded and the action is "refuse".
+    """
+    limits = budgets() if limits is None else limits
+    action = action or config.MEMORY_BUDGET_ACTION
+    sizes = {**report.components, "total": report.total,
+             "session": max(report.sessions, default=0)}
+    exceeded = [f"{name} uses {sizes[name] / MB:.1f} MB, budget {limit / MB:.1f} MB"
+                for name, limit in limits.items() if sizes.get(name, 0) > limit]
+    if exceeded and action == "refuse":
+        raise MemoryBudgetError("; ".join(exceeded))
+    for message in exceeded:
+        logger.warning(f"Memory budget exceeded: {message}")
+    return exceeded
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Report the memory of a knowledge base")
+    parser.add_argument("--metadata-database", default="database/metadata.csv")
+    parser.add_argument("--faiss-database", default="database/faiss_index")
+    parser.add_argument("--shards-database")
+    parser.add_argument("--bundle")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    from src.bot.bot import KnowledgeBase
+    report = memory_report(KnowledgeBase(args.metadata_database, args.faiss_database,
+                                         shards_database=args.shards_database,
+                                         bundle=args.bundle))
+    print(json.dumps(report.to_dict(), indent=2) if args.json else report.format())
+    check_budgets(report, action="warn")
@@ -0,0 +1,280 @@
+"""
+Lightweight timing spans, counters and histograms for the query path.
+
+Everything is recorded in-process and exposed as Prometheus text, either through
+``start_metrics_server`` or any exporter registered with ``add_exporter``. When
+metrics are disabled ``span`` hands back a shared no-op context manager and the
+record functions return immediately.
+
+    with span("search"):
+        docs = vector_store.max_marginal_relevance_search_by_vector(...)
+    observe("medibot_retrieved_docs", len(docs))
+"""
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src import config
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_NOOP = nullcontext()
+
+# stage timings of the request currently being traced, see ``trace``
+_current_trace = contextvars.ContextVar("medibot_trace", default=None)
+
+
+def _label_key(labels: dict) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value) -> str:
+    # label values are quoted strings in the Prometheus text format
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key, extra: Optional[dict] = None) -> str:
+    pairs = list(key) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str = ""):
+        self.name = name
+        self.help = help
+        self.values: Dict[tuple, float] = {}
+
+    def inc(self, value: float = 1.0, **labels):
+        key = _label_key(labels)
+        self.values[key] = self.values.get(key, 0.0) + value
+
+    def get(self, **labels) -> float:
+        return self.values.get(_label_key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str = "", buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [per-bucket counts (+Inf last), sum, count]
+        self.values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        entry = self.values.get(key)
+        if entry is None:
+            entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def count(self, **labels) -> int:
+        entry = self.values.get(_label_key(labels))
+        return entry[2] if entry else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (bucket_counts, total, count) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), bucket_counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f"{self.name}_bucket{_format_labels(key, {'le': le})} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total:g}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class _Span:
+    __slots__ = ("registry", "stage", "start")
+
+    def __init__(self, registry: "MetricsRegistry", stage: str):
+        self.registry = registry
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        self.registry.observe("medibot_stage_latency_seconds", elapsed, stage=self.stage)
+        timings = _current_trace.get()
+        if timings is not None:
+            timings[self.stage] = timings.get(self.stage, 0.0) + elapsed
+        return False
+
+
+class MetricsRegistry:
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._metrics: Dict[str, object] = {}
+        self._exporters: List[Callable[[str], None]] = []
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str = "") -> Counter:
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.setdefault(name, Counter(name, help))
+        return metric
+
+    def histogram(self, name: str, help: str = "", buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.setdefault(name, Histogram(name, help, buckets))
+        return metric
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        if not self.enabled:
+            return
+        metric = self.counter(name)
+        with self._lock:
+            metric.inc(value, **labels)
+
+    def observe(self, name: str, value: float, buckets: tuple = LATENCY_BUCKETS, **labels):
+        if not self.enabled:
+            return
+        metric = self.histogram(name, buckets=buckets)
+        with self._lock:
+            metric.observe(value, **labels)
+
+    def span(self, stage: str):
+        """Time a block of work as ``stage``."""
+        if not self.enabled and _current_trace.get() is None:
+            return _NOOP
+        return _Span(self, stage)
+
+    def render_prometheus(self) -> str:
+        with self._lock:
+            lines = []
+            for name in sorted(self._metrics):
+                lines.extend(self._metrics[name].render())
+        return "\n".join(lines) + "\n"
+
+    def add_exporter(self, exporter: Callable[[str], None]):
+        """Register a callable that receives the Prometheus text on ``export``."""
+        self._exporters.append(exporter)
+
+    def export(self):
+        text = self.render_prometheus()
+        for exporter in self._exporters:
+            try:
+                exporter(text)
+            except Exception as e:
+                logger.warning(f"Metrics exporter {exporter!r} failed: {e}")
+
+    def reset(self):
+        with self._lock:
+            for metric in self._metrics.values():
+                metric.values.clear()
+
+
+metrics = MetricsRegistry(enabled=config.METRICS_ENABLED)
+metrics.histogram("medibot_stage_latency_seconds", "Latency of each query stage in seconds")
+metrics.histogram("medibot_retrieved_docs", "Chunks retrieved per question", SIZE_BUCKETS)
+metrics.histogram("medibot_prompt_tokens", "Prompt tokens per LLM call", SIZE_BUCKETS)
+metrics.histogram("medibot_completion_tokens", "Completion tokens per LLM call", SIZE_BUCKETS)
+metrics.histogram("medibot_embedding_batch_size", "Texts per batched embedding call",
+                  SIZE_BUCKETS)
+metrics.histogram("medibot_context_tokens", "Context tokens sent per question", SIZE_BUCKETS)
+metrics.counter("medibot_queries_total", "Questions answered")
+metrics.counter("medibot_context_dropped_total", "Retrieved chunks left out of the prompt")
+metrics.counter("medibot_cache_hits_total", "Cache hits by cache")
+metrics.counter("medibot_cache_misses_total", "Cache misses by cache")
+metrics.counter("medibot_singleflight_calls_total", "Computations run for coalesced keys")
+metrics.counter("medibot_coalesced_total", "Requests served by another request's flight")
+metrics.counter("medibot_deadline_exceeded_total", "Requests past their deadline by stage")
+metrics.counter("medibot_llm_retries_total", "LLM attempts retried by error")
+metrics.counter("medibot_llm_throttled_total", "LLM calls throttled by reason and model")
+metrics.counter("medibot_llm_fallbacks_total", "LLM calls sent to the fallback model")
+metrics.counter("medibot_circuit_transitions_total", "Groq circuit breaker state changes")
+metrics.histogram("medibot_rate_limit_wait_seconds", "Time waiting for a Groq rate-limit token")
+metrics.counter("medibot_warmup_questions_total", "Questions replayed by the warm-up")
+metrics.histogram("medibot_warmup_seconds", "Duration of the start-up warm-up")
+metrics.counter("medibot_retrieval_dropped_total",
+                "Retrieved candidates dropped by the adaptive retrieval depth")
+metrics.counter("medibot_profiles_skipped_total", "Sampled requests not profiled by reason")
+metrics.histogram("medibot_tree_vectors_scored", "Vectors scored per summary tree search",
+                  SIZE_BUCKETS)
+
+
+def span(stage: str):
+    return metrics.span(stage)
+
+
+def inc(name: str, value: float = 1.0, **labels):
+    metrics.inc(name, value, **labels)
+
+
+def observe(name: str, value: float, buckets: tuple = LATENCY_BUCKETS, **labels):
+    metrics.observe(name, value, buckets, **labels)
+
+
+def current_trace() -> Optional[dict]:
+    """Timings dict of the enclosing ``trace``, None outside of one."""
+    return _current_trace.get()
+
+
+@contextmanager
+def trace():
+    """Collect per-stage timings of the enclosed request into a dict.
+
+    Works whether or not metrics are enabled, so callers can always report timings
+    for a single request.
+    """
+    timings = {}
+    token = _current_trace.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_trace.reset(token)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        payload = self.server.registry.render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0",
+                         registry: MetricsRegistry = metrics) -> ThreadingHTTPServer:
+    """Serve ``GET /metrics`` in Prometheus text format from a daemon thread.
+
+    Serving metrics turns recording on, an endpoint of empty metrics is no use.
+    """
+    registry.enabled = True
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    server.registry = registry
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,217 @@
+"""
+Opt-in cProfile capture of single requests and ingestion runs.
+
+A request is profiled when it is sampled (``PROFILE_SAMPLE_RATE``) or flagged
+(``Medibot.query(..., profile=True)``, the ``X-Medibot-Profile: 1`` header of the
+HTTP service, ``--profile`` on the ingestion pipelines and the ``src.bot`` index
+build commands). Each capture writes ``<time>-<name>-<key hash>.prof`` plus a
+``.json`` with the stage timings to ``PROFILE_DIR``, keeping the newest ``PROFILE_MAX_FILES`` captures. With sampling
+off and no flag, ``profile`` returns a shared no-op context manager.
+
+Calls a request hands to the ``deadline-call`` threads go through ``run_profiled``,
+which profiles them into the request's capture (from Python 3.12 cProfile sees every
+thread anyway, including other requests'). One capture runs at a time, requests
+sampled meanwhile are not profiled, and a failing capture never fails the request.
+
+    python -m src.profiling summarize profiles --top 25
+"""
+import argparse
+import cProfile
+import glob
+import hashlib
+import json
+import logging
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+from src import config
+from src.metrics import current_trace, inc, trace
+
+logger = logging.getLogger(__name__)
+
+_NOOP = nullcontext()
+# capture of the request running in this context, followed into worker threads
+_current_capture: ContextVar[Optional["_Capture"]] = ContextVar("medibot_profile",
+                                                                default=None)
+# cProfile runs on sys.monitoring from 3.12, one profiler at a time for all threads
+_PROCESS_WIDE = sys.version_info >= (3, 12)
+
+
+def key_hash(key: str) -> str:
+    return hashlib.sha256(" ".join(key.lower().split()).encode()).hexdigest()[:12]
+
+
+class _Capture:
+    def __init__(self, profiler: "Profiler", name: str, key: str):
+        self.profiler = profiler
+        self.name = name
+        self.key = key
+        self.profile = None
+        self.thread_profiles = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        # reuse the caller's trace so its timings are not lost
+        self._trace = trace() if current_trace() is None else nullcontext(current_trace())
+        self.timings = self._trace.__enter__()
+        self.started = time.time()
+        if not self.profiler._active.acquire(blocking=False):
+            inc("medibot_profiles_skipped_total", reason="busy")
+            return self
+        try:
+            profile = cProfile.Profile()
+            profile.enable()
+        except ValueError as e:  # another profiler or debugger holds the hook
+            self.profiler._active.release()
+            inc("medibot_profiles_skipped_total", reason="hooked")
+            logger.warning(f"Could not profile {self.name}: {e}")
+            return self
+        self.profile = profile
+        self._token = _current_capture.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        if self.profile is not None:
+            self.profile.disable()
+            _current_capture.reset(self._token)
+            self.profiler._active.release()
+        self._trace.__exit__(*exc)
+        if self.profile is not None:
+            try:
+                self.profiler.save(self, error=exc[1])
+            except Exception as e:
+                logger.warning(f"Could not save profile of {self.name}: {e}")
+        return False
+
+    def run_in_thread(self, fn: Callable):
+        """Call ``fn`` on a worker thread, profiled into this capture."""
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            return fn()
+        try:
+            return fn()
+        finally:
+            profile.disable()
+            with self._lock:
+                self.thread_profiles.append(profile)
+
+    def stats(self) -> pstats.Stats:
+        """The request thread's profile merged with its worker threads' ones."""
+        with self._lock:
+            thread_profiles = list(self.thread_profiles)
+        stats = pstats.Stats(self.profile)
+        for profile in thread_profiles:
+            stats.add(profile)
+        return stats
+
+
+def run_profiled(fn: Callable):
+    """Call ``fn``, profiled into the capture of the calling context if there is one."""
+    capture = _current_capture.get()
+    if capture is None or _PROCESS_WIDE:
+        return fn()
+    return capture.run_in_thread(fn)
+
+
+class Profiler:
+    """Decides which requests to profile and stores their captures.
+
+    Args:
+        sample_rate (float): share of requests profiled without a flag.
+        directory (str): where captures are written.
+        max_files (int): captures kept, older ones are deleted.
+    """
+
+    def __init__(self, sample_rate: float = 0.0, directory: str = "profiles",
+                 max_files: int = 200):
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self.max_files = max_files
+        self._active = threading.Lock()
+
+    def profile(self, name: str, key: str = "", force: bool = False):
+        """Context manager profiling the enclosed block when sampled or forced."""
+        if not force and (self.sample_rate <= 0 or random.random() >= self.sample_rate):
+            return _NOOP
+        return _Capture(self, name, key)
+
+    def save(self, capture: _Capture, error: Optional[BaseException] = None):
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.localtime(capture.started)) \
+            + f"{capture.started % 1:.3f}"[1:]
+        base = os.path.join(self.directory, f"{stamp}-{capture.name}-"
+                                            f"{key_hash(capture.key)}-{os.getpid()}")
+        capture.stats().dump_stats(base + ".prof")
+        with open(base + ".json", "w") as f:
+            json.dump({"name": capture.name, "key_hash": key_hash(capture.key),
+                       "started": capture.started,
+                       "seconds": time.time() - capture.started,
+                       "timings": capture.timings,
+                       "error": None if error is None else repr(error)}, f, indent=2)
+        self._rotate()
+
+    def _rotate(self):
+        captures = sorted(glob.glob(os.path.join(self.directory, "*.prof")),
+                          key=os.path.getmtime)
+        for path in captures[:max(0, len(captures) - self.max_files)]:
+            for stale in (path, path[:-len(".prof")] + ".json"):
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass
+
+
+profiler = Profiler(config.PROFILE_SAMPLE_RATE, config.PROFILE_DIR,
+                    config.PROFILE_MAX_FILES)
+
+
+def profile(name: str, key: str = "", force: bool = False):
+    return profiler.profile(name, key, force)
+
+
+def summarize(directory: str, top: int = 25, sort: str = "cumulative",
+              name: Optional[str] = None):
+    """Print the hottest functions and mean stage timings across captures."""
+    pattern = f"*-{name}-*.prof" if name else "*.prof"
+    paths = sorted(glob.glob(os.path.join(directory, pattern)))
+    if not paths:
+        print(f"No profiles in {directory}")
+        return
+    stages, totals = {}, []
+    for path in paths:
+        try:
+            with open(path[:-len(".prof")] + ".json") as f:
+                sidecar = json.load(f)
+        except (OSError, ValueError):
+            continue
+        totals.append(sidecar["seconds"])
+        for stage, seconds in sidecar["timings"].items():
+            stages.setdefault(stage, []).append(seconds)
+    print(f"{len(paths)} profiles, mean {sum(totals) / max(1, len(totals)) * 1000:.1f} ms")
+    for stage, samples in sorted(stages.items(), key=lambda item: -sum(item[1])):
+        print(f"  {stage:<24} mean {sum(samples) / len(samples) * 1000:9.1f} ms "
+              f"({len(samples)} samples)")
+    print()
+    pstats.Stats(*paths).strip_dirs().sort_stats(sort).print_stats(top)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize collected profiles")
+    commands = parser.add_subparsers(dest="command", required=True)
+    summary = commands.add_parser("summarize")
+    summary.add_argument("directory", nargs="?", default=config.PROFILE_DIR)
+    summary.add_argument("--top", type=int, default=25)
+    summary.add_argument("--sort", default="cumulative",
+                         choices=("cumulative", "tottime", "ncalls"))
+    summary.add_argument("--name", help="only captures of this name, e.g. query")
+    args = parser.parse_args()
+    summarize(args.directory, args.top, args.sort, args.name)
@@ -0,0 +1,395 @@
+"""
+Headless HTTP service over the Medibot core, for API clients and load balancers.
+
+A small asyncio HTTP/1.1 server (keep-alive, JSON bodies, server-sent events)
+without the Gradio UI in the request path:
+
+    GET  /healthz             liveness
+    GET  /readyz              200 once the knowledge base is loaded, 503 before
+    GET  /memory              memory report of the knowledge base and the bots
+    POST /auth/login          {"userid", "password", "api_key"?} -> {"token"}
+    POST /query               {"question", "specialty"?, "deadline"?} -> answer, sources,
+                              timings; "deadline" in seconds, default REQUEST_DEADLINE
+    POST /query/batch         {"questions", "concurrency"?, "specialty"?}; "concurrency"
+                              is clamped to 1..SERVICE_MAX_BATCH_CONCURRENCY
+    POST /query/stream        same body as /query, answer streamed as SSE events
+
+Query endpoints take ``Authorization: Bearer <token>`` with the session token
+issued by ``src.auth`` (the same one the Gradio app keeps in the browser).
+``X-Medibot-Profile: 1`` on ``/query`` captures a cProfile of that request
+(see ``src.profiling``).
+
+    python -m src.service --port 8080
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from src import config
+from src.auth.auth import handle_login, issue_session_token, resume_session
+from src.bot.loader import BackgroundLoader, knowledge_base_loader
+from src.bot.throttle import RateLimited
+from src.metrics import trace
+from src.sessions import InFlightLimiter, in_flight_limiter
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_BYTES = 1 << 20
+REASONS = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found",
+           405: "Method Not Allowed", 413: "Payload Too Large",
+           429: "Too Many Requests", 500: "Internal Server Error",
+           503: "Service Unavailable"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Request:
+    def __init__(self, method: str, path: str, headers: dict, body: bytes):
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+
+    def json(self) -> dict:
+        try:
+            data = json.loads(self.body or b"{}")
+        except ValueError:
+            raise HTTPError(400, "body is not valid JSON")
+        if not isinstance(data, dict):
+            raise HTTPError(400, "body must be a JSON object")
+        return data
+
+    @property
+    def keep_alive(self) -> bool:
+        return self.headers.get("connection", "").lower() != "close"
+
+
+async def read_request(reader: asyncio.StreamReader) -> Optional[Request]:
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    try:
+        method, target, _ = request_line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "malformed request line")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length") or 0)
+    except ValueError:
+        raise HTTPError(400, "bad content-length")
+    if length < 0:
+        raise HTTPError(400, "bad content-length")
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, f"body larger than {MAX_BODY_BYTES} bytes")
+    body = await reader.readexactly(length) if length else b""
+    return Request(method.upper(), target.split("?", 1)[0], headers, body)
+
+
+def write_response(writer: asyncio.StreamWriter, status: int, body: dict,
+                   keep_alive: bool = True):
+    payload = json.dumps(body).encode()
+    writer.write(
+        f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+        f"Content-Type: application/json\r\n"
+        f"Content-Length: {len(payload)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode()
+        + payload)
+
+
+def string_field(body: dict, name: str, required: bool = True) -> Optional[str]:
+    """The body's ``name`` string, None when optional and left out."""
+    value = body.get(name)
+    if value is None and not required:
+        return None
+    if not isinstance(value, str) or (required and not value):
+        raise HTTPError(400, f"{name} must be a {'non-empty ' if required else ''}string")
+    return value
+
+
+def request_deadline(body: dict) -> Optional[float]:
+    """The body's "deadline" in seconds, None when it is left out."""
+    value = body.get("deadline")
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) \
+            or not math.isfinite(value) or value <= 0:
+        raise HTTPError(400, "deadline must be a positive number of seconds")
+    return float(value)
+
+
+def batch_concurrency(body: dict) -> int:
+    """The body's "concurrency", clamped to 1..SERVICE_MAX_BATCH_CONCURRENCY."""
+    value = body.get("concurrency", 4)
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise HTTPError(400, "concurrency must be an integer")
+    return max(1, min(value, config.SERVICE_MAX_BATCH_CONCURRENCY))
+
+
+class MedibotService:
+    """Serves Medibot over HTTP.
+
+    Args:
+        loader (BackgroundLoader): loads the shared knowledge base.
+        bot_factory (Callable[[str], Medibot], optional): builds the bot of an API
+            key, defaults to a Medibot on the loaded knowledge base.
+        limiter (InFlightLimiter, optional): per-user cap on questions in flight.
+        max_bots (int): bots kept, least recently used ones are dropped.
+    """
+
+    def __init__(self, loader: BackgroundLoader = knowledge_base_loader,
+                 bot_factory: Optional[Callable] = None,
+                 limiter: Optional[InFlightLimiter] = None,
+                 max_bots: int = config.SERVICE_BOT_CACHE_SIZE):
+        self.loader = loader
+        self.bot_factory = bot_factory or self._default_bot
+        self.limiter = limiter or in_flight_limiter
+        self.max_bots = max_bots
+        self._bots = OrderedDict()  # sha256 of the API key -> bot
+        self._bots_lock = threading.Lock()
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def _default_bot(self, api_key: str):
+        from src.bot.bot import Medibot
+        return Medibot(knowledge_base=self.loader.get(), api_key=api_key)
+
+    def bot(self, api_key: str):
+        # bots only hold prompt and pooled client handles, one per key is enough
+        key = hashlib.sha256(api_key.encode()).hexdigest()
+        with self._bots_lock:
+            bot = self._bots.get(key)
+            if bot is not None:
+                self._bots.move_to_end(key)
+                return bot
+        bot = self.bot_factory(api_key)
+        with self._bots_lock:
+            bot = self._bots.setdefault(key, bot)
+            self._bots.move_to_end(key)
+            while len(self._bots) > self.max_bots:
+                self._bots.popitem(last=False)
+        return bot
+
+    async def authenticate(self, request: Request) -> tuple:
+        token = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+        if not token:
+            raise HTTPError(401, "missing bearer token")
+        userid, api_key, status = await asyncio.to_thread(resume_session, token)
+        if userid is None:
+            raise HTTPError(401, status)
+        if not self.loader.ready:
+            raise HTTPError(503, f"knowledge base {self.loader.status}")
+        return userid, self.bot(api_key)
+
+    # endpoints ------------------------------------------------------------------
+
+    async def healthz(self, request: Request) -> dict:
+        return {"status": "ok"}
+
+    async def readyz(self, request: Request) -> dict:
+        if not self.loader.ready:
+            raise HTTPError(503, f"knowledge base {self.loader.status}")
+        return {"status": "ready", "load_seconds": self.loader.load_seconds,
+                "warmup": getattr(self.loader.get(), "warmup", None)}
+
+    async def memory(self, request: Request) -> dict:
+        from src.memory import check_budgets, memory_report
+        if not self.loader.ready:
+            raise HTTPError(503, f"knowledge base {self.loader.status}")
+        with self._bots_lock:
+            bots = list(self._bots.values())
+        report = await asyncio.to_thread(memory_report, self.loader.get(), bots)
+        return {**report.to_dict(), "exceeded": check_budgets(report, action="warn")}
+
+    async def login(self, request: Request) -> dict:
+        body = request.json()
+        userid, password = string_field(body, "userid"), string_field(body, "password")
+        status, api_key = await asyncio.to_thread(
+            handle_login, userid, password, string_field(body, "api_key", required=False))
+        if api_key is None:
+            raise HTTPError(401, status)
+        return {"status": status, "token": issue_session_token(userid, api_key)}
+
+    async def query(self, request: Request) -> dict:
+        body = request.json()
+        question = string_field(body, "question")
+        specialty = string_field(body, "specialty", required=False)
+        deadline = request_deadline(body)
+        userid, bot = await self.authenticate(request)
+        with self.limiter.acquire(userid) as admitted:
+            if not admitted:
+                raise HTTPError(429, "too many questions in progress")
+            try:
+                answer, docs, tables, images, timings = await asyncio.to_thread(
+                    self._query, bot, question, specialty,
+                    request.headers.get("x-medibot-profile", "").lower()
+                    in ("1", "true", "yes"),
+                    deadline)
+            except RateLimited as e:
+                raise HTTPError(429, str(e))
+        return {"answer": answer, "sources": [doc.metadata.get("source") for doc in docs],
+                "tables": tables, "images": images, "timings": timings}
+
+    @staticmethod
+    def _query(bot, question: str, specialty: Optional[str], profile: bool = False,
+               deadline: Optional[float] = None) -> tuple:
+        with trace() as timings:
+            answer, docs, tables, images = bot.query(question, specialty, profile=profile,
+                                                     deadline=deadline)
+        return answer, docs, tables, images, timings
+
+    async def query_batch(self, request: Request) -> dict:
+        body = request.json()
+        questions = body.get("questions")
+        if not isinstance(questions, list) or not questions \
+                or not all(isinstance(question, str) and question for question in questions):
+            raise HTTPError(400, "questions must be a non-empty list of non-empty strings")
+        specialty = string_field(body, "specialty", required=False)
+        concurrency = batch_concurrency(body)
+        userid, bot = await self.authenticate(request)
+        with self.limiter.acquire(userid) as admitted:
+            if not admitted:
+                raise HTTPError(429, "too many questions in progress")
+            results = await asyncio.to_thread(
+                bot.query_batch, questions, concurrency, specialty)
+        return {"results": [result.to_dict() for result in results]}
+
+    async def query_stream(self, request: Request, writer: asyncio.StreamWriter):
+        body = request.json()
+        question = string_field(body, "question")
+        specialty = string_field(body, "specialty", required=False)
+        deadline = request_deadline(body)
+        userid, bot = await self.authenticate(request)
+        with self.limiter.acquire(userid) as admitted:
+            if not admitted:
+                raise HTTPError(429, "too many questions in progress")
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                         b"Cache-Control: no-cache\r\nConnection: close\r\n\r\n")
+
+            async def send(event: str, data):
+                writer.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode())
+                await writer.drain()
+
+            try:
+                with trace() as timings:
+                    async for event, data in bot.astream_query(
+                            question, specialty, deadline):
+                        if event == "sources":
+                            await send("sources", [doc.metadata.get("source")
+                                                   for doc in data])
+                        elif event == "token":
+                            await send("token", data)
+                        else:
+                            tables, images = data
+                await send("done", {"tables": tables, "images": images,
+                                    "timings": timings})
+            except Exception as e:
+                logger.error(f"Streaming answer failed: {e}")
+                await send("error", {"error": str(e)})
+
+    # plumbing -------------------------------------------------------------------
+
+    ROUTES = {
+        ("GET", "/healthz"): "healthz",
+        ("GET", "/readyz"): "readyz",
+        ("GET", "/memory"): "memory",
+        ("POST", "/auth/login"): "login",
+        ("POST", "/query"): "query",
+        ("POST", "/query/batch"): "query_batch",
+    }
+
+    async def handle(self, request: Request, writer: asyncio.StreamWriter) -> bool:
+        """Answer one request, return whether the connection can be reused."""
+        try:
+            if request.path == "/query/stream":
+                if request.method != "POST":
+                    raise HTTPError(405, "use POST")
+                await self.query_stream(request, writer)
+                return False
+            name = self.ROUTES.get((request.method, request.path))
+            if name is None:
+                known = any(path == request.path for _, path in self.ROUTES)
+                raise HTTPError(405 if known else 404, f"{request.method} {request.path}")
+            body = await getattr(self, name)(request)
+            write_response(writer, 200, body, request.keep_alive)
+        except HTTPError as e:
+            write_response(writer, e.status, {"error": e.message}, request.keep_alive)
+        except Exception as e:
+            logger.error(f"{request.method} {request.path} failed: {e}")
+            write_response(writer, 500, {"error": str(e)}, request.keep_alive)
+        return request.keep_alive
+
+    async def _connection(self, reader: asyncio.StreamReader,
+                          writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except HTTPError as e:
+                    write_response(writer, e.status, {"error": e.message}, False)
+                    break
+                if request is None or not await self.handle(request, writer):
+                    break
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            try:
+                await writer.drain()
+                writer.close()
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8080):
+        self._server = await asyncio.start_server(self._connection, host, port)
+        return self._server
+
+    @property
+    def port(self) -> int:
+        return self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self, host: str = "127.0.0.1", port: int = 8080):
+        server = await self.start(host, port)
+        logger.info(f"Medibot service listening on {host}:{self.port}")
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    from dotenv import load_dotenv
+
+    from src.auth.db import initialize_db
+    from src.metrics import start_metrics_server
+
+    parser = argparse.ArgumentParser(description="Headless Medibot HTTP service")
+    parser.add_argument("--host", default=config.SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=config.SERVICE_PORT)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()
+    initialize_db()
+    knowledge_base_loader.start()
+    if config.METRICS_PORT:
+        start_metrics_server(config.METRICS_PORT)
+    asyncio.run(MedibotService().serve_forever(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
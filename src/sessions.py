@@ -0,0 +1,83 @@
+"""
+Per-session chat state for the Gradio apps.
+
+Each logged-in browser session keeps its own ``UserSession`` in ``gr.State`` with a
+bot built from that user's API key. ``InFlightLimiter`` caps how many questions one
+user can have running at once, so a single heavy user cannot occupy every queue
+worker.
+"""
+import threading
+import weakref
+from contextlib import contextmanager
+from typing import Optional
+
+from src import config
+
+
+class InFlightLimiter:
+    def __init__(self, max_in_flight: int):
+        self.max_in_flight = max_in_flight
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def acquire(self, userid: str):
+        """Yield True if the user is below the limit, False if the request is rejected."""
+        with self._lock:
+            current = self._in_flight.get(userid, 0)
+            admitted = current < self.max_in_flight
+            if admitted:
+                self._in_flight[userid] = current + 1
+        try:
+            yield admitted
+        finally:
+            if admitted:
+                with self._lock:
+                    remaining = self._in_flight[userid] - 1
+                    if remaining:
+                        self._in_flight[userid] = remaining
+                    else:
+                        del self._in_flight[userid]
+
+    def in_flight(self, userid: str) -> int:
+        with self._lock:
+            return self._in_flight.get(userid, 0)
+
+
+in_flight_limiter = InFlightLimiter(config.USER_MAX_IN_FLIGHT)
+
+# sessions still referenced by a browser tab, for the memory report
+_live_sessions = weakref.WeakSet()
+
+
+def live_sessions() -> list:
+    """The sessions still referenced by a browser tab."""
+    return list(_live_sessions)
+
+
+class UserSession:
+    """State of one logged-in browser session."""
+
+    def __init__(self, userid: str, bot):
+        self.userid = userid
+        self.bot = bot
+        _live_sessions.add(self)
+
+    def answer(self, message: str, limiter: Optional[InFlightLimiter] = None,
+               specialty: Optional[str] = None) -> str:
+        limiter = limiter or in_flight_limiter
+        with limiter.acquire(self.userid) as admitted:
+            if not admitted:
+                return (f"⏳ You already have {limiter.max_in_flight} questions in progress, "
+                        "please wait for them to finish.")
+            answer_md, tables_display, images_display, retrieved_display = \
+                self.bot.get_answer(message, specialty)
+
+        # Combine all parts into a single response string for chat
+        combined_response = f"{answer_md}\n\n{tables_display}"
+
+        # Add images as markdown
+        if images_display:
+            combined_response += "\n\n" + "\n\n".join(images_display)
+
+        return combined_response